@@ -0,0 +1,150 @@
+"""
+Micro-benchmarks for the text hot paths in mastodon_bot.util and mastodon_bot.markdown
+
+    PYTHONPATH=src python bench/bench_text.py
+    PYTHONPATH=src python bench/bench_text.py --save
+    PYTHONPATH=src python bench/bench_text.py --compare bench/baselines/0.10.26.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import timeit
+import logging
+import platform
+from importlib import metadata
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpora import CORPORA
+from mastodon_bot import util, markdown, normalize
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_DIR = os.path.join(BENCH_DIR, "baselines")
+PYPROJECT = os.path.join(os.path.dirname(BENCH_DIR), "pyproject.toml")
+
+
+def filter_and_remove_mentions(text: str) -> str:
+    # the listener strips every mention out of the content before responding
+    for word in util.filter_words(text, "@"):
+        text = util.remove_word(string=text, word=word)
+    return text
+
+
+BENCHMARKS = {
+    "split_string_by_words": lambda text: util.split_string_by_words(text, 493),
+    "filter_remove_words": filter_and_remove_mentions,
+    "extract_uris": util.extract_uris,
+    "normalize_status": normalize.normalize_status,
+    "detect_code_in_markdown": util.detect_code_in_markdown,
+    "break_long_string_into_paragraphs": lambda text: util.break_long_string_into_paragraphs(text, 5),
+    "convert_text_to_html": util.convert_text_to_html,
+    "markdown_to_html": markdown.to_html,
+    "markdown_to_text": markdown.to_text,
+}
+
+
+def package_version() -> str:
+    try:
+        return metadata.version("mastodon-bot-cli")
+    except metadata.PackageNotFoundError:
+        pass
+
+    # running from a checkout that isn't installed
+    with open(PYPROJECT) as file:
+        version = re.search(r'^version = "([^"]+)"', file.read(), re.M)
+    return version.group(1) if version else "dev"
+
+
+def measure(fn, text: str, min_time: float, repeat: int) -> float:
+    """
+    Returns the best ops/sec of repeat runs, each calling fn(text) enough times to take at least min_time
+    """
+    timer = timeit.Timer(lambda: fn(text))
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(number, int(number * min_time / max(elapsed, 1e-9)))
+
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return number / best
+
+
+def run(names: list, corpora: list, min_time: float, repeat: int) -> dict:
+    texts = {name: CORPORA[name]() for name in corpora}
+    results = {}
+    for name in names:
+        for corpus in corpora:
+            key = f"{name}[{corpus}]"
+            ops = measure(BENCHMARKS[name], texts[corpus], min_time, repeat)
+            results[key] = ops
+            click.echo(f"{key:<60} {ops:>14,.1f} ops/sec")
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Prints each result against the baseline and returns the keys more than threshold times slower
+    """
+    regressions = []
+    for key, ops in results.items():
+        base_ops = baseline.get(key)
+        if not base_ops:
+            click.echo(f"{key:<60} {'new':>14}")
+            continue
+
+        ratio = base_ops / ops
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        click.echo(f"{key:<60} {ratio:>13.2f}x{flag}")
+    return regressions
+
+
+@click.command()
+@click.option("--benchmark", "-b", "benchmarks", multiple=True, type=click.Choice(list(BENCHMARKS)),
+              help="Benchmarks to run, all when not given")
+@click.option("--corpus", "-c", "corpora", multiple=True, type=click.Choice(list(CORPORA)),
+              help="Corpora to run against, all when not given")
+@click.option("--min-time", type=click.FLOAT, default=0.2, help="Minimum seconds per timed run")
+@click.option("--repeat", type=click.INT, default=5, help="Timed runs per benchmark, the best is kept")
+@click.option("--save", "save_path", is_flag=False, flag_value="", default=None,
+              help="Store results as a baseline, in bench/baselines/<version>.json unless a path is given")
+@click.option("--compare", "compare_path", type=click.Path(exists=True, dir_okay=False),
+              help="Baseline to compare against, as time relative to it, so above 1 is slower")
+@click.option("--threshold", type=click.FLOAT, default=1.25,
+              help="How many times slower than the baseline counts as a regression")
+def main(benchmarks, corpora, min_time, repeat, save_path, compare_path, threshold):
+    # extract_uris logs its content at debug, keep that out of the timings
+    logging.getLogger().setLevel(logging.INFO)
+
+    started = time.time()
+    results = run(list(benchmarks or BENCHMARKS), list(corpora or CORPORA), min_time, repeat)
+    click.echo(f"{len(results)} benchmarks in {time.time() - started:.1f}s")
+
+    if save_path is not None:
+        save_path = save_path or os.path.join(BASELINE_DIR, f"{package_version()}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(save_path)), exist_ok=True)
+        with open(save_path, "w") as file:
+            json.dump({
+                "version": package_version(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": results,
+            }, file, indent=2, sort_keys=True)
+        click.echo(f"saved baseline to {save_path}")
+
+    if compare_path:
+        with open(compare_path) as file:
+            baseline = json.load(file)
+        click.echo(f"\ncompared to {baseline.get('version')} on python {baseline.get('python')}:")
+        regressions = compare(results, baseline["results"], threshold)
+        if regressions:
+            click.echo(f"{len(regressions)} regression(s) over {threshold}x")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
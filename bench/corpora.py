@@ -0,0 +1,93 @@
+"""
+Synthetic text shaped like what the bot handles: toots, chat answers, code heavy answers and transcripts
+"""
+import random
+
+WORDS = (
+    "the of and to in is that it for on with as was be by this are or from at an which but not have "
+    "api data model server client request response voice audio image thread status reply context "
+    "token prompt persona network latency cache worker queue redis polly transcript paragraph sentence"
+).split()
+
+DOMAINS = ["example.com", "mastodon.social", "s3.amazonaws.com", "youtube.com", "github.com"]
+
+CODE_LINES = [
+    "def handler(event, context):",
+    "    items = [item for item in event['records'] if item]",
+    "    for index, item in enumerate(items):",
+    "        logging.debug('item %s: %s', index, item)",
+    "    return {'statusCode': 200, 'body': json.dumps(items)}",
+    "",
+]
+
+
+def sentence(rng: random.Random, min_words: int = 6, max_words: int = 24) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return " ".join(words).capitalize() + rng.choice([".", ".", ".", "?", "!"])
+
+
+def fill(rng: random.Random, size: int, make) -> str:
+    parts = []
+    length = 0
+    while length < size:
+        part = make(rng)
+        parts.append(part)
+        length += len(part) + 1
+    return " ".join(parts)[:size]
+
+
+def toot(size: int = 500, seed: int = 1) -> str:
+    """
+    Returns a toot with mentions, a hashtag and a link
+    """
+    rng = random.Random(seed)
+    head = "@bot@mastodon.social @someone can you help with this? "
+    tail = f" https://{rng.choice(DOMAINS)}/@someone/1234567890 #python"
+    return head + fill(rng, size - len(head) - len(tail), sentence) + tail
+
+
+def answer(size: int = 5000, seed: int = 2) -> str:
+    """
+    Returns a chat answer in paragraphs of a few sentences, with the odd link and inline code
+    """
+    rng = random.Random(seed)
+
+    def paragraph(rng):
+        sentences = [sentence(rng) for _ in range(rng.randint(2, 6))]
+        if rng.random() < 0.3:
+            sentences.append(f"See https://{rng.choice(DOMAINS)}/docs/page?id={rng.randint(1, 999)} for more.")
+        if rng.random() < 0.3:
+            sentences.append(f"Use `{rng.choice(WORDS)}()` for that.")
+        return " ".join(sentences) + "\n\n"
+
+    return fill(rng, size, paragraph)
+
+
+def code_answer(size: int = 20000, seed: int = 3) -> str:
+    """
+    Returns a markdown answer alternating between prose and fenced code blocks
+    """
+    rng = random.Random(seed)
+
+    def block(rng):
+        prose = " ".join(sentence(rng) for _ in range(rng.randint(1, 3)))
+        code = "\n".join(rng.choice(CODE_LINES) for _ in range(rng.randint(4, 12)))
+        return f"{prose}\n\n```python\n{code}\n```\n"
+
+    return fill(rng, size, block)
+
+
+def transcript(size: int = 1024 * 1024, seed: int = 4) -> str:
+    """
+    Returns a transcript: sentence after sentence with no line breaks
+    """
+    return fill(random.Random(seed), size, sentence)
+
+
+CORPORA = {
+    "toot_500": lambda: toot(500),
+    "answer_5k": lambda: answer(5 * 1024),
+    "code_answer_20k": lambda: code_answer(20 * 1024),
+    "transcript_100k": lambda: transcript(100 * 1024),
+    "transcript_1m": lambda: transcript(1024 * 1024),
+}
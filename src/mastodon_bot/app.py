@@ -4,12 +4,40 @@ Entrypoint for CLI.
 import click
 import logging
 import atexit
-
-from mastodon_bot.commands import init, post, listen, get
+import importlib
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-@click.group(chain=True)
+# each command's module is only imported when that command runs, or for help
+LAZY_COMMANDS = {
+    "init": "mastodon_bot.commands.init.init",
+    "post": "mastodon_bot.commands.post.post",
+    "listen": "mastodon_bot.commands.listen.listen",
+    "get": "mastodon_bot.commands.get.get",
+    "work": "mastodon_bot.commands.work.work",
+}
+
+
+class LazyGroup(click.Group):
+    """
+    Click group that imports a subcommand from its "module.attribute" path the first time it is asked for
+    """
+
+    def __init__(self, *args, lazy_commands: dict = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_commands and cmd_name not in self.commands:
+            module_name, attribute = self.lazy_commands[cmd_name].rsplit(".", 1)
+            self.add_command(getattr(importlib.import_module(module_name), attribute), cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+
+@click.group(cls=LazyGroup, chain=True, lazy_commands=LAZY_COMMANDS)
 @click.option("--debugging",is_flag=True, default=False, help="output debug information")
 @click.pass_context
 def cli(ctx, debugging):
@@ -32,11 +60,6 @@ def cli(ctx, debugging):
 def exit_handler():
     logging.debug("exit_handler")
 
-cli.add_command(init)
-cli.add_command(post)
-cli.add_command(listen)
-cli.add_command(get)
-
 atexit.register(exit_handler)
 
 if __name__ == '__main__':
@@ -1,7 +1,12 @@
 """
-Exports for CLI commands.
+Exports for CLI commands, imported on first use so loading one command doesn't load them all.
 """
-from mastodon_bot.commands.init import init
-from mastodon_bot.commands.post import post
-from mastodon_bot.commands.listen import listen
-from mastodon_bot.commands.get import get
+import importlib
+
+COMMANDS = ("init", "post", "listen", "get", "work")
+
+
+def __getattr__(name):
+    if name in COMMANDS:
+        return getattr(importlib.import_module(f"{__name__}.{name}"), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -17,5 +17,5 @@ def get(data_type, awsprofile):
     """
     if data_type == "voices":
         wrapper = PollyWrapper(access_key_id="", access_secret_key="", profile_name=awsprofile)
-        result = wrapper.get_voices()
+        result = wrapper.voice_catalog.voices()
         click.echo(json.dumps(result))
@@ -4,14 +4,17 @@ CLI Post to Mastodon.  Source of post based off of parameters passed command.
 import logging
 import click
 import mastodon
-from bs4 import BeautifulSoup
 from rq import Queue, Retry
-from redis import Redis
 from mastodon import Mastodon
 from mastodon_bot.util import error_info
+from mastodon_bot.timed_dict import timed_dict
 from mastodon_bot.worker import listener_respond
+from mastodon_bot.lib.clients.client_registry import registry
 from mastodon_bot.lib.listen.listener_config import ListenerConfig
 from mastodon_bot.lib.listen.listener_response_type import ListenerResponseType
+from mastodon_bot.lib.listen.status_event import parse_event
+from mastodon_bot.lib.listen.status_dedupe import claim_status
+from mastodon_bot.lib.listen.async_ingest import AsyncStreamIngest
 
 class Listener(mastodon.StreamListener):
     """
@@ -20,137 +23,77 @@ class Listener(mastodon.StreamListener):
     def __init__(self, **kwargs):
         self.config = ListenerConfig(**kwargs)
         self.mastodon_api = kwargs.get("mastodon_api", None)
-        logging.info("%s, Listening...", self.config.response_type)
-
-    def on_update(self, status):
-
-        logging.debug("on_update: %s", status)
 
-        status_id = None
-        in_reply_to_id = None
-        image_url = None
+        self.redis_conn = None
+        self.queue = None
+        if self.config.rq_redis_connection:
+            self.redis_conn = registry.get_redis(self.config.rq_redis_connection)
+            self.queue = Queue(self.config.rq_queue_name, connection=self.redis_conn)
 
-        if "in_reply_to_id" in status and status["in_reply_to_id"] != "":
-            in_reply_to_id = status["in_reply_to_id"]
+        # without redis, the same status arriving as an update and a notification is caught in process
+        self.claimed = timed_dict(max_age_hours=self.config.rq_dedupe_ttl / 3600)
 
-        if "id" in status:
-            status_id = status["id"]
+        logging.info("%s, Listening...", self.config.response_type)
 
-        if "content" in status:
+    def claim(self, status_id) -> bool:
+        """
+        Returns True the first time status_id is seen within the dedupe ttl
+        """
+        if self.redis_conn is not None:
+            return claim_status(self.redis_conn, status_id, ttl_seconds=self.config.rq_dedupe_ttl)
 
-            logging.debug("pre BeautifulSoup content: %s", status["content"])
+        self.claimed.remove_old_items()
+        if status_id in self.claimed:
+            return False
+        self.claimed[status_id] = True
+        return True
 
-            inner_content = BeautifulSoup(
-                status["content"], "html.parser").text
+    def on_update(self, status):
 
-            if "media_attachments" in status and len(status["media_attachments"]) > 0:
-                image_url = status["media_attachments"][0].url
-                logging.debug("image_url: %s", image_url)
+        logging.debug("on_update: %s", status)
 
+        parsed = parse_event("update", status)
+        if parsed is not None:
+            status_id, in_reply_to_id, image_url, inner_content, media_urls = parsed
             logging.info("on_update: %s, in_reply_to_id: %s \n content: %s", status_id, in_reply_to_id, inner_content)
-
-            if not status["account"]["bot"]:
-                self.enqueue_response(
-                    status_id, in_reply_to_id, image_url, inner_content)
-            else:
-                logging.debug("i'm a bot, so not responding")
+            self.enqueue_response(status_id, in_reply_to_id, image_url, inner_content, media_urls)
 
     def on_notification(self, notification):
 
-        logging.debug(f"on_notification: {notification}")
-
-        status_id = None
-        in_reply_to_id = None
-        image_url = None
-
-        if (
-            "status" in notification
-            and "in_reply_to_id" in notification["status"]
-            and notification["status"]["in_reply_to_id"] != ""
-        ):
-            in_reply_to_id = notification["status"]["in_reply_to_id"]
-
-        if "status" in notification:
-            status_id = notification["status"]["id"]
-
-        if "status" in notification:
-            logging.debug(
-                f"pre BeautifulSoup content: {notification['status']['content']}"
-            )
-
-            inner_content = BeautifulSoup(
-                notification["status"]["content"], "html.parser"
-            ).text
+        logging.debug("on_notification: %s", notification)
 
-            if (
-                "media_attachments" in notification["status"]
-                and len(notification["status"]["media_attachments"]) > 0
-            ):
-                image_url = notification["status"]["media_attachments"][0].url
-                logging.debug(f"image_url: {image_url}")
-
-            logging.info(
-                f"on_notification: { status_id}, in_reply_to_id: {in_reply_to_id} \n content: {inner_content}"
-            )
-
-            if not notification["account"]["bot"]:
-                self.enqueue_response(
-                    status_id, in_reply_to_id, image_url, inner_content)
-            else:
-                logging.debug("i'm a bot, so not responding")
+        parsed = parse_event("notification", notification)
+        if parsed is not None:
+            status_id, in_reply_to_id, image_url, inner_content, media_urls = parsed
+            logging.info("on_notification: %s, in_reply_to_id: %s \n content: %s", status_id, in_reply_to_id, inner_content)
+            self.enqueue_response(status_id, in_reply_to_id, image_url, inner_content, media_urls)
 
     def on_conversation(self, conversation):
 
-        logging.debug(f"on_conversation: {conversation}")
-
-        status_id = None
-        in_reply_to_id = None
-        image_url = None
-
-        if "status" in conversation:
-            if "in_reply_to_id" in conversation["status"]:
-                in_reply_to_id = conversation["status"]["in_reply_to_id"]
-
-            status_id = conversation["status"]["id"]
-
-            logging.debug(
-                f"pre BeautifulSoup content: {conversation['status']['content']}"
-            )
+        logging.debug("on_conversation: %s", conversation)
 
-            inner_content = BeautifulSoup(
-                conversation["status"]["content"], "html.parser"
-            ).text
+        parsed = parse_event("conversation", conversation)
+        if parsed is not None:
+            status_id, in_reply_to_id, image_url, inner_content, media_urls = parsed
+            logging.info("on_conversation: %s, in_reply_to_id: %s \n content: %s", status_id, in_reply_to_id, inner_content)
+            self.enqueue_response(status_id, in_reply_to_id, image_url, inner_content, media_urls)
 
-            if (
-                "media_attachments" in conversation["status"]
-                and len(conversation["status"]["media_attachments"]) > 0
-            ):
-                image_url = conversation["status"]["media_attachments"][0].url
-                logging.debug(f"image_url: {image_url}")
+    def enqueue_response(self, status_id, in_reply_to_id, image_url, inner_content, media_urls=None):
+        if not self.claim(status_id):
+            logging.debug("already responding to %s, skipping duplicate event", status_id)
+            return
 
-            logging.info(
-                f"on_conversation: { status_id}, in_reply_to_id: {in_reply_to_id} \n content: {inner_content}"
-            )
-
-            if not conversation["account"]["bot"]:
-                self.enqueue_response(
-                    status_id, in_reply_to_id, image_url, inner_content)
-            else:
-                logging.debug("i'm a bot, so not responding")
-
-    def enqueue_response(self, status_id, in_reply_to_id, image_url, inner_content):
-        if self.config.rq_redis_connection:
+        if self.queue is not None:
             logging.info(f"enqueuing: {status_id} {in_reply_to_id}")
-            redis_conn = Redis.from_url(self.config.rq_redis_connection)
-            queue = Queue(self.config.rq_queue_name, connection=redis_conn)
-            queue.enqueue(
+            self.queue.enqueue(
                 listener_respond,
                 kwargs={
                     'content': inner_content,
                     'in_reply_to_id': in_reply_to_id,
                     'image_url': image_url,
                     'status_id': status_id,
-                    'config': self.config
+                    'config': self.config,
+                    'media_urls': media_urls
                 },
                 retry=Retry(max=self.config.rq_queue_retry_attempts,
                             interval=self.config.rq_queue_retry_delay),
@@ -163,7 +106,8 @@ class Listener(mastodon.StreamListener):
                 in_reply_to_id=in_reply_to_id,
                 image_url=image_url,
                 status_id=status_id,
-                config=self.config
+                config=self.config,
+                media_urls=media_urls
             )
 
 
@@ -197,6 +141,50 @@ class Listener(mastodon.StreamListener):
 @click.argument("mastodon_s3_access_secret_key", required=False, type=click.STRING)
 @click.argument("aws_polly_region_name", required=False, type=click.STRING)
 @click.argument("aws_polly_voice_id", required=False, type=click.STRING)
+@click.option("--openai-chat-context-backend", type=click.Choice(["hash", "conversation"]), default="hash",
+              help="How chat context is stored in redis: one hash per persona, or one key per conversation")
+@click.option("--openai-chat-context-max-messages", type=click.INT, default=50,
+              help="The number of messages kept per conversation by the conversation context backend")
+@click.option("--openai-chat-response-cache/--no-openai-chat-response-cache", default=False,
+              help="Reuse responses to prompts that start a conversation, for low temperatures. Requires rq_redis_connection")
+@click.option("--openai-chat-response-cache-ttl", type=click.INT, default=24 * 60 * 60,
+              help="Seconds a cached chat response is kept")
+@click.option("--openai-chat-response-cache-max-entries", type=click.INT, default=10000,
+              help="The most chat responses cached, least recently used are dropped first")
+@click.option("--openai-chat-response-cache-max-temperature", type=click.FLOAT, default=0.3,
+              help="Responses are only cached at or below this temperature")
+@click.option("--openai-chat-stream/--no-openai-chat-stream", default=False,
+              help="Stream chat completions, posting each part of the reply thread as soon as it is complete")
+@click.option("--image-preprocess-workers", type=click.INT, default=1,
+              help="Processes preparing uploaded images for OPEN_AI_IMAGE variations")
+@click.option("--image-max-pixels", type=click.INT, default=40_000_000,
+              help="Largest image, in pixels after jpeg draft scaling, decoded for a variation")
+@click.option("--transcribe-max-workers", type=click.INT, default=3,
+              help="The number of urls and attachments transcribed at once for OPEN_AI_TRANSCRIBE")
+@click.option("--transcribe-error-policy", type=click.Choice(["inline", "skip", "fail"]), default="inline",
+              help="inline posts an error in place of a failed item, skip leaves it out, fail fails the whole job")
+@click.option("--transcribe-segment-seconds", type=click.INT, default=600,
+              help="Long audio is split into segments of this many seconds and transcribed concurrently, 0 disables")
+@click.option("--transcribe-segment-workers", type=click.INT, default=4,
+              help="The number of segments of one audio file transcribed at once")
+@click.option("--polly-max-workers", type=click.INT, default=4,
+              help="The number of chunks of long text synthesized at once for TEXT_TO_SPEECH")
+@click.option("--speech-upload-workers", type=click.INT, default=2,
+              help="The number of csv rows' speech posted to mastodon at once for TEXT_TO_SPEECH")
+@click.option("--tts-cache-dir", default=None,
+              help="Directory synthesized speech is cached in, keyed by text, voice, engine and format. Unset disables the cache")
+@click.option("--tts-cache-max-bytes", type=click.INT, default=500 * 1024 * 1024,
+              help="Least recently used speech is evicted from the cache directory past this size")
+@click.option("--tts-cache-s3-prefix", default="tts-cache/",
+              help="Prefix in the s3 bucket for the shared speech cache tier, empty to keep the cache local")
+@click.option("--download-max-bytes", type=click.INT, default=200 * 1024 * 1024,
+              help="The largest remote file, in bytes, downloaded for transcription, speech or images")
+@click.option("--dedupe-ttl", type=click.INT, default=300,
+              help="Seconds a status is remembered so duplicate events for it are not responded to twice")
+@click.option("--ingest-mode", type=click.Choice(["blocking", "async"]), default="blocking",
+              help="blocking handles each event on the stream thread, async parses on an executor and enqueues in batches")
+@click.option("--ingest-batch-size", type=click.INT, default=25,
+              help="The most events enqueued in one redis round trip by the async ingest mode")
 def listen(
     ctx,
     mastodon_host,
@@ -223,7 +211,29 @@ def listen(
     mastodon_s3_access_key_id,
     mastodon_s3_access_secret_key,
     aws_polly_region_name,
-    aws_polly_voice_id
+    aws_polly_voice_id,
+    openai_chat_context_backend,
+    openai_chat_context_max_messages,
+    openai_chat_response_cache,
+    openai_chat_response_cache_ttl,
+    openai_chat_response_cache_max_entries,
+    openai_chat_response_cache_max_temperature,
+    openai_chat_stream,
+    image_preprocess_workers,
+    image_max_pixels,
+    transcribe_max_workers,
+    transcribe_error_policy,
+    transcribe_segment_seconds,
+    transcribe_segment_workers,
+    polly_max_workers,
+    speech_upload_workers,
+    tts_cache_dir,
+    tts_cache_max_bytes,
+    tts_cache_s3_prefix,
+    download_max_bytes,
+    dedupe_ttl,
+    ingest_mode,
+    ingest_batch_size
 ):
     """
     Listen to Mastodon User streaming events and act
@@ -307,6 +317,31 @@ def listen(
     logging.debug(f"mastodon_s3_access_secret_key: {mastodon_s3_access_secret_key}")
     logging.debug(f"aws_polly_region_name: {aws_polly_region_name}")
     logging.debug(f"aws_polly_voice_id: {aws_polly_voice_id}")
+    logging.debug(f"openai_chat_context_backend: {openai_chat_context_backend}")
+    logging.debug(f"openai_chat_context_max_messages: {openai_chat_context_max_messages}")
+    logging.debug(f"openai_chat_response_cache: {openai_chat_response_cache}")
+    logging.debug(f"openai_chat_response_cache_ttl: {openai_chat_response_cache_ttl}")
+    logging.debug(f"openai_chat_response_cache_max_entries: {openai_chat_response_cache_max_entries}")
+    logging.debug(f"openai_chat_response_cache_max_temperature: {openai_chat_response_cache_max_temperature}")
+    logging.debug(f"openai_chat_stream: {openai_chat_stream}")
+    logging.debug(f"image_preprocess_workers: {image_preprocess_workers}")
+    logging.debug(f"image_max_pixels: {image_max_pixels}")
+    logging.debug(f"transcribe_max_workers: {transcribe_max_workers}")
+    logging.debug(f"transcribe_error_policy: {transcribe_error_policy}")
+    logging.debug(f"transcribe_segment_seconds: {transcribe_segment_seconds}")
+    logging.debug(f"transcribe_segment_workers: {transcribe_segment_workers}")
+    logging.debug(f"polly_max_workers: {polly_max_workers}")
+    logging.debug(f"speech_upload_workers: {speech_upload_workers}")
+    logging.debug(f"tts_cache_dir: {tts_cache_dir}")
+    logging.debug(f"tts_cache_max_bytes: {tts_cache_max_bytes}")
+    logging.debug(f"tts_cache_s3_prefix: {tts_cache_s3_prefix}")
+    logging.debug(f"download_max_bytes: {download_max_bytes}")
+    logging.debug(f"dedupe_ttl: {dedupe_ttl}")
+    logging.debug(f"ingest_mode: {ingest_mode}")
+    logging.debug(f"ingest_batch_size: {ingest_batch_size}")
+
+    if ingest_mode == "async" and not rq_redis_connection:
+        raise click.UsageError("--ingest-mode async enqueues to rq, so it needs rq_redis_connection", ctx=ctx)
 
     mastodon_api = Mastodon(
         client_id=mastodon_client_id,
@@ -318,36 +353,60 @@ def listen(
     try:
         response_type_value = ListenerResponseType[response_type]
 
-        mastodon_api.stream_user(
-            Listener(
-                mastodon_api=mastodon_api,
-                openai_api_key=openai_api_key,
-                response_type=response_type_value,
-                chat_model=openai_chat_model,
-                chat_temperature=openai_chat_temperature,
-                chat_max_tokens=openai_chat_max_tokens,
-                chat_top_p=openai_chat_top_p,
-                chat_frequency_penalty=openai_chat_frequency_penalty,
-                chat_presence_penalty=openai_chat_presence_penalty,
-                chat_max_age_hours_context=openai_chat_max_age_hours,
-                chat_persona=openai_chat_persona,
-                rq_redis_connection=rq_redis_connection,
-                rq_queue_name=rq_queue_name,
-                rq_queue_retry_attempts=rq_queue_retry_attempts,
-                rq_queue_retry_delay=rq_queue_retry_delay,
-                rq_queue_task_timeout=rq_queue_task_timeout,
-                mastodon_client_id=mastodon_client_id,
-                mastodon_client_secret=mastodon_client_secret,
-                mastodon_access_token=mastodon_access_token,
-                mastodon_host=mastodon_host,
-                mastodon_s3_bucket_name=mastodon_s3_bucket_name,
-                mastodon_s3_bucket_prefix_path=mastodon_s3_bucket_prefix_path,
-                mastodon_s3_access_key_id=mastodon_s3_access_key_id,
-                mastodon_s3_access_secret_key=mastodon_s3_access_secret_key,
-                aws_polly_region_name=aws_polly_region_name,
-                aws_polly_voice_id=aws_polly_voice_id
-            )
+        listener = Listener(
+            mastodon_api=mastodon_api,
+            openai_api_key=openai_api_key,
+            response_type=response_type_value,
+            chat_model=openai_chat_model,
+            chat_temperature=openai_chat_temperature,
+            chat_max_tokens=openai_chat_max_tokens,
+            chat_top_p=openai_chat_top_p,
+            chat_frequency_penalty=openai_chat_frequency_penalty,
+            chat_presence_penalty=openai_chat_presence_penalty,
+            chat_max_age_hours_context=openai_chat_max_age_hours,
+            chat_persona=openai_chat_persona,
+            rq_redis_connection=rq_redis_connection,
+            rq_queue_name=rq_queue_name,
+            rq_queue_retry_attempts=rq_queue_retry_attempts,
+            rq_queue_retry_delay=rq_queue_retry_delay,
+            rq_queue_task_timeout=rq_queue_task_timeout,
+            mastodon_client_id=mastodon_client_id,
+            mastodon_client_secret=mastodon_client_secret,
+            mastodon_access_token=mastodon_access_token,
+            mastodon_host=mastodon_host,
+            mastodon_s3_bucket_name=mastodon_s3_bucket_name,
+            mastodon_s3_bucket_prefix_path=mastodon_s3_bucket_prefix_path,
+            mastodon_s3_access_key_id=mastodon_s3_access_key_id,
+            mastodon_s3_access_secret_key=mastodon_s3_access_secret_key,
+            aws_polly_region_name=aws_polly_region_name,
+            aws_polly_voice_id=aws_polly_voice_id,
+            chat_context_backend=openai_chat_context_backend,
+            chat_context_max_messages=openai_chat_context_max_messages,
+            rq_dedupe_ttl=dedupe_ttl,
+            chat_response_cache=openai_chat_response_cache,
+            chat_response_cache_ttl=openai_chat_response_cache_ttl,
+            chat_response_cache_max_entries=openai_chat_response_cache_max_entries,
+            chat_response_cache_max_temperature=openai_chat_response_cache_max_temperature,
+            chat_stream=openai_chat_stream,
+            image_preprocess_workers=image_preprocess_workers,
+            image_max_pixels=image_max_pixels,
+            transcribe_max_workers=transcribe_max_workers,
+            transcribe_error_policy=transcribe_error_policy,
+            transcribe_segment_seconds=transcribe_segment_seconds,
+            transcribe_segment_workers=transcribe_segment_workers,
+            polly_max_workers=polly_max_workers,
+            speech_upload_workers=speech_upload_workers,
+            tts_cache_dir=tts_cache_dir,
+            tts_cache_max_bytes=tts_cache_max_bytes,
+            tts_cache_s3_prefix=tts_cache_s3_prefix,
+            download_max_bytes=download_max_bytes
         )
 
+        if ingest_mode == "async":
+            AsyncStreamIngest(mastodon_api=mastodon_api, config=listener.config,
+                              batch_size=ingest_batch_size).run()
+        else:
+            mastodon_api.stream_user(listener)
+
     except Exception as e:
         logging.error(error_info(e))
@@ -5,14 +5,13 @@ import click
 import random
 import mimetypes
 import logging
-import time
+from concurrent.futures import ThreadPoolExecutor
 
 from mastodon import Mastodon
 
-from mastodon_bot.external import dropbox
-from mastodon_bot.external import openai
-from mastodon_bot.external import plex
-from mastodon_bot.util import error_info, split_string
+from mastodon_bot.util import error_info, split_string, ordered_bounded_map
+from mastodon_bot.lib.clients.rate_limiter import MastodonRateLimiter, RateLimitedMastodon
+from mastodon_bot.lib.plex.watermark import PlexWatermark, RedisWatermarkStore, FileWatermarkStore
 
 @click.command("post", short_help="Post content to a mastodon instance")
 @click.pass_context
@@ -29,6 +28,12 @@ from mastodon_bot.util import error_info, split_string
 @click.argument("plex_host", required=False, type=click.STRING)
 @click.argument("plex_token", required=False, type=click.STRING)
 @click.argument("plex_server_id", required=False, type=click.STRING)
+@click.option("--redis-connection", default=None,
+              help="Redis uri used to share the account's rate limit with the listen workers. Without it posts are paced by Mastodon.py")
+@click.option("--plex-state-file", default=None,
+              help="Local file remembering the last plex item posted, when there is no redis connection to keep it in")
+@click.option("--plex-workers", type=click.INT, default=4,
+              help="The number of plex posters downloaded at once")
 def post(
     ctx,
     mastodon_host,
@@ -43,7 +48,10 @@ def post(
     openai_default_completion,
     plex_host,
     plex_token,
-    plex_server_id
+    plex_server_id,
+    redis_connection,
+    plex_state_file,
+    plex_workers
 ):
     """
     CLI Post to Mastodon
@@ -69,9 +77,18 @@ def post(
         client_id=mastodon_client_id,
         client_secret=mastodon_client_secret,
         access_token=mastodon_access_token,
-        api_base_url=mastodon_host
+        api_base_url=mastodon_host,
+        ratelimit_method="wait" if redis_connection else "pace"
     )
 
+    redis_client = None
+    if redis_connection:
+        from redis import Redis
+
+        redis_client = Redis.from_url(redis_connection)
+        limiter = MastodonRateLimiter(redis_client, account=f"{mastodon_host}:{mastodon_access_token}")
+        mastodon_api = RateLimitedMastodon(mastodon_api, limiter)
+
     if (
         dropbox_client_id
         and dropbox_client_secret
@@ -81,38 +98,75 @@ def post(
         handle_dropbox_post(dropbox_client_id, dropbox_client_secret, dropbox_refresh_token, dropbox_folder, openai_api_key, openai_default_completion, result, mastodon_api)
 
     if (plex_host and plex_token):
-        handle_plex_post(plex_host, plex_token, plex_server_id, result, mastodon_api)
+        watermark_store = None
+        if redis_client is not None:
+            watermark_store = RedisWatermarkStore(redis_client, server=plex_server_id or plex_host)
+        elif plex_state_file:
+            watermark_store = FileWatermarkStore(plex_state_file)
+
+        handle_plex_post(plex_host, plex_token, plex_server_id, result, mastodon_api,
+                         watermark_store=watermark_store, max_workers=plex_workers)
 
     return result
 
-def handle_plex_post(plex_host, plex_token, plex_server_id, result, mastodon_api):
+def handle_plex_post(plex_host, plex_token, plex_server_id, result, mastodon_api, watermark_store=None,
+                     max_workers=4):
+    """
+    Posts the items added to plex since the watermark in watermark_store, or in the last day without one.
+    Posters are downloaded max_workers at a time, while each is only uploaded when its status goes out,
+    in the order the items were added, moving the watermark past each one. A failed post leaves no
+    uploads behind for items the watermark hasn't reached.
+    """
+    # only loaded for the sources a post uses
+    from mastodon_bot.external import plex
+
     logging.debug(f"Have plex token, processing for plex source: {plex_host}")
-        
+
+    watermark = watermark_store.load() if watermark_store is not None else None
+
     plex_instance = plex.PlexInstance(plex_host=plex_host, plex_token=plex_token, plex_server_id=plex_server_id)
-    recently_added = plex_instance.get_recently_added(hours_since=24)
-    for added in recently_added:
-        media = mastodon_api.media_post(
-                media_file=added.get_poster_image_data(),
-                file_name=added.get_post_image_file_name(),
-                mime_type=f"mime_type='image/png'",
-            )
-
-        added_description = added.get_description()
-        logging.debug(added_description)
-        description_parts = split_string(added_description, 500)
-        for desc in description_parts:
-            logging.debug(desc)
-            toot = mastodon_api.status_post(
-                    desc,
-                    media_ids=[media["id"]],
-                    sensitive=False,
-                    visibility="private",
-                    spoiler_text=None
-                )
-            result.append(toot["url"])
-            time.sleep(1)
+    recently_added = plex_instance.get_recently_added(hours_since=24, watermark=watermark)
+    logging.info("%s new plex item(s)", len(recently_added))
+
+    if watermark_store is not None and watermark is None:
+        watermark = PlexWatermark()
+
+    def download_poster(added):
+        return added, added.get_poster_image_data()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="plex") as executor:
+            for added, poster in ordered_bounded_map(executor, download_poster, recently_added, max(1, max_workers)):
+                media = mastodon_api.media_post(
+                        media_file=poster,
+                        file_name=added.get_post_image_file_name(),
+                        mime_type=f"mime_type='image/png'",
+                    )
+                added_description = added.get_description()
+                logging.debug(added_description)
+                description_parts = split_string(added_description, 500)
+                for desc in description_parts:
+                    logging.debug(desc)
+                    toot = mastodon_api.status_post(
+                            desc,
+                            media_ids=[media["id"]],
+                            sensitive=False,
+                            visibility="private",
+                            spoiler_text=None
+                        )
+                    result.append(toot["url"])
+
+                if watermark is not None:
+                    watermark.advance(added.get_added_at(), added.get_key())
+    finally:
+        # whatever was posted before a failure isn't posted again
+        if watermark is not None and recently_added:
+            watermark_store.save(watermark)
 
 def handle_dropbox_post(dropbox_client_id, dropbox_client_secret, dropbox_refresh_token, dropbox_folder, openai_api_key, openai_default_completion, result, mastodon_api):
+    # only loaded for the sources a post uses
+    from mastodon_bot.external import dropbox
+
     logging.debug("Have dropbox token, processing for dropbox source...")
 
     db = dropbox.DropBox(client_id=dropbox_client_id, client_secret=dropbox_client_secret, refresh_token=dropbox_refresh_token)
@@ -145,6 +199,8 @@ def handle_dropbox_post(dropbox_client_id, dropbox_client_secret, dropbox_refres
     status_post = "I love me!"
 
     if openai_api_key and openai_default_completion:
+        from mastodon_bot.external import openai
+
         chat = openai.OpenAiChat(openai_api_key)
         status_post = chat.create(openai_default_completion, "1")
 
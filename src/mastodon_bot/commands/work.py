@@ -0,0 +1,41 @@
+"""
+CLI work command.  Runs an rq worker for the jobs enqueued by listen.
+"""
+import click
+import logging
+
+from rq import Queue, SimpleWorker
+from mastodon_bot.lib.clients.client_registry import registry
+from mastodon_bot.lib.rq.preloading_worker import PreloadingWorker, preload
+
+
+@click.command("work", short_help="Run a worker for the responses enqueued by listen")
+@click.pass_context
+@click.argument("rq_redis_connection", required=True, type=click.STRING)
+@click.argument("rq_queue_name", required=True, type=click.STRING)
+@click.option("--preload/--no-preload", "preload_modules", default=True,
+              help="Import and warm the job code and its dependencies once, before the first job")
+@click.option("--fork/--no-fork", "fork_jobs", default=False,
+              help="Run each job in a forked work horse. Without forking, jobs reuse the clients earlier jobs built")
+@click.option("--with-scheduler/--without-scheduler", default=True,
+              help="Run the rq scheduler, needed for scheduled jobs like polly task status checks")
+@click.option("--burst", is_flag=True, default=False, help="Exit once the queue is empty")
+def work(ctx, rq_redis_connection, rq_queue_name, preload_modules, fork_jobs, with_scheduler, burst):
+    """
+    CLI worker for listen's rq queue
+    """
+    logging.debug(f"rq_queue_name: {rq_queue_name}")
+    logging.debug(f"preload: {preload_modules}")
+    logging.debug(f"fork: {fork_jobs}")
+    logging.debug(f"with_scheduler: {with_scheduler}")
+    logging.debug(f"burst: {burst}")
+
+    if preload_modules:
+        preload()
+
+    redis_conn = registry.get_redis(rq_redis_connection)
+    queue = Queue(rq_queue_name, connection=redis_conn)
+    # a forked work horse builds its clients again for every job, so jobs run in this process by default
+    worker_class = PreloadingWorker if fork_jobs else SimpleWorker
+    worker = worker_class([queue], connection=redis_conn)
+    worker.work(with_scheduler=with_scheduler, burst=burst)
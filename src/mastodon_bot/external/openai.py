@@ -1,15 +1,20 @@
 """
 openai.py - Interact with OpenAI's API
 """
+import time
 import base64
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 import openai
-import tiktoken
-from PIL import Image
+from redis import Redis
 from mastodon_bot.timed_dict import timed_dict
 from mastodon_bot.redis_timed_dict import redis_timed_dict
+from mastodon_bot.redis_conversation_dict import redis_conversation_dict
+from mastodon_bot.lib.chat.encodings import encodings, count_tokens
 from mastodon_bot.util import base64_encode_long_string
+from mastodon_bot.lib.audio.segments import audio_segments, DEFAULT_SEGMENT_SECONDS
+from mastodon_bot.lib.image.preprocess import prepare_variation_image
 
 class OpenAiPrompt:
     """
@@ -141,7 +146,19 @@ class OpenAiChat:
         self.max_age_hours = kwargs.get("max_age_hours", 1)
 
         self.redis_connection = kwargs.get("redis_connection", None)
-        if self.redis_connection:
+        # shared client for the conversation backend, opened from redis_connection when not given
+        self.redis_client = kwargs.get("redis_client", None)
+        self.context_backend = kwargs.get("context_backend", None) or "hash"
+        self.context_max_messages = kwargs.get("context_max_messages", None) or 50
+        # optional ChatResponseCache for prompts that start a conversation
+        self.response_cache = kwargs.get("response_cache", None)
+        if self.redis_connection and self.context_backend == "conversation":
+            if self.redis_client is None:
+                self.redis_client = Redis.from_url(self.redis_connection)
+            self.context = redis_conversation_dict(
+                redis_client=self.redis_client, key=f"mastodon_bot:chat:{self.persona_key}",
+                    max_age_hours=self.max_age_hours, max_messages=self.context_max_messages)
+        elif self.redis_connection:
             self.context = redis_timed_dict(
                 redis_connection=self.redis_connection, key=self.persona_key,
                     max_age_hours=self.max_age_hours)
@@ -154,51 +171,64 @@ class OpenAiChat:
         if self.context.max_age_hours is None:
             raise ValueError("max_age_hours is required")
 
-        try:
-            self.encoding = tiktoken.encoding_for_model(self.model)
-        except KeyError:
-            self.encoding = tiktoken.get_encoding("gpt-3.5-turbo")
+        self.encoding = encodings.for_model(self.model)
 
         openai.api_key = self.api_key
 
+    def message_tokens(self, message: dict):
+        """
+        Returns the number of tokens used by a single message, caching the count on the message
+        """
+        if "tokens" in message:
+            return message["tokens"]
+
+        # every message follows <im_start>{role/name}\n{content}<im_end>\n
+        num_tokens = 4
+        for key, value in message.items():
+            if key == "content" and message.get("role") == "system":
+                # the persona starts every conversation, so its count is remembered across them
+                num_tokens += count_tokens(self.encoding, value or "")
+            else:
+                num_tokens += len(self.encoding.encode(value or ""))
+            if key == "name":  # if there's a name, the role is omitted
+                num_tokens += -1  # role is always required and always 1 token
+
+        message["tokens"] = num_tokens
+        return num_tokens
+
     def num_tokens_from_messages(self, messages: list):
         """
         Returns the number of tokens used by a list of messages.
         """
-        # Returns the number of tokens used by a list of messages.
-        # if (
-        #     self.model == "gpt-3.5-turbo-0301"
-        # ):  # note: future models may deviate from this
-        num_tokens = 0
-        for message in messages:
-            # every message follows <im_start>{role/name}\n{content}<im_end>\n
-            num_tokens += 4
-            # logging.debug(f"message: {message}")
-            # logging.debug(f"message type: {type(message)}")
-
-            for key, value in message.items():
-                num_tokens += len(self.encoding.encode(value))
-                if key == "name":  # if there's a name, the role is omitted
-                    num_tokens += -1  # role is always required and always 1 token
+        num_tokens = sum(self.message_tokens(message) for message in messages)
         num_tokens += 2  # every reply is primed with <im_start>assistant
         return num_tokens
-        # else:
-        #     raise NotImplementedError(
-        #         f"""num_tokens_from_messages() is not presently implemented for model {self.model}.
-        #             See https://github.com/openai/openai-python/blob/main/chatml.md for information on how messages are converted to tokens."""
-        #     )
 
     def reduce_messages(self, messages: list, max_tokens=4096):
         """
-        Reduce messages to a given limit
+        Reduce messages to a given limit, keeping the system persona and dropping the oldest turns first
         """
         cur_tokens = self.num_tokens_from_messages(messages)
         mod_tokens = cur_tokens
-        while mod_tokens > max_tokens:
-            messages.pop()
-            mod_tokens = self.num_tokens_from_messages(messages=messages)
+
+        first_turn = 0
+        while first_turn < len(messages) and messages[first_turn]["role"] == "system":
+            first_turn += 1
+
+        last_dropped = first_turn
+        while mod_tokens > max_tokens and last_dropped < len(messages):
+            mod_tokens -= messages[last_dropped]["tokens"]
+            last_dropped += 1
+
+        del messages[first_turn:last_dropped]
         return cur_tokens, mod_tokens
 
+    def to_api_messages(self, messages: list):
+        """
+        Strip our cached token counts before sending messages to the api
+        """
+        return [{"role": message["role"], "content": message["content"]} for message in messages]
+
     def create(self, prompt: str, convo_id: str):
         """
         Prompt chat for a response, maintaining context of conversation by default
@@ -221,41 +251,32 @@ class OpenAiChat:
         # )
 
         try:
-            tmp_messages = []
-            if convo_id in self.context:
-                tmp_messages = self.context[convo_id]
-            # logging.debug(f"cached messages: {tmp_messages}")
-            # logging.debug(f"messages type: {type(tmp_messages)}")
+            tmp_messages, is_new = self.prepare_messages(prompt=prompt, convo_id=convo_id)
 
-            cur_tokens, mod_tokens = self.reduce_messages(
-                messages=tmp_messages)
-            if cur_tokens > mod_tokens:
-                logging.debug("max tokens exceeded! reduced by %s", cur_tokens - mod_tokens)
+            # only a prompt with no history always gets the same messages sent
+            use_cache = self.use_response_cache(is_new)
+            if use_cache:
+                result = self.response_cache.get(self.persona, self.model, self.temperature, prompt)
 
-            # for maintaining context/history of chat, using passed convo_id as key
-            msg_len = len(tmp_messages)
-            if msg_len < 3:
-                tmp_messages = self.init_messages(prompt=prompt)
-            # elif msg_len == 1:
-            #     tmp_messages = self.init_messages(prompt=prompt)
-            # elif msg_len == 2:
-            #     tmp_messages = self.init_messages(prompt=prompt)
-            else:
-                tmp_messages = self.append_prompt(
-                    messages=tmp_messages, prompt=prompt)
+            if result is None:
+                response = openai.chat.completions.create(
+                    model=self.model, messages=self.to_api_messages(tmp_messages), temperature=self.temperature
+                )
 
-            response = openai.chat.completions.create(
-                model=self.model, messages=tmp_messages, temperature=self.temperature
-            )
+                if response.choices and len(response.choices) > 0:
+                    result = response.choices[0].message.content
+                else:
+                    logging.debug("response unexpected: %s", response)
 
-            if response.choices and len(response.choices) > 0:
-                result = response.choices[0].message.content
+                if use_cache:
+                    self.response_cache.put(self.persona, self.model, self.temperature, prompt, result)
             else:
-                logging.debug("response unexpected: %s", response)
+                logging.debug("chat response cache hit for %s", prompt)
 
-            self.context[convo_id] = self.append_response(
+            tmp_messages = self.append_response(
                 messages=tmp_messages, response=result
             )
+            self.save_messages(convo_id=convo_id, messages=tmp_messages, is_new=is_new)
 
             return result
 
@@ -269,29 +290,134 @@ class OpenAiChat:
             logging.debug("open api error, http_status: %s, error: %s", e.status_code, e.response)
             raise e
 
+    def create_stream(self, prompt: str, convo_id: str):
+        """
+        Prompt chat for a response, yielding the text as it is generated.
+        The conversation is stored once the whole response has been received.
+        """
+        logging.debug("streaming chat with prompt %s", prompt)
+
+        try:
+            tmp_messages, is_new = self.prepare_messages(prompt=prompt, convo_id=convo_id)
+
+            use_cache = self.use_response_cache(is_new)
+            result = None
+            if use_cache:
+                result = self.response_cache.get(self.persona, self.model, self.temperature, prompt)
+
+            if result is not None:
+                logging.debug("chat response cache hit for %s", prompt)
+                yield result
+            else:
+                parts = []
+                stream = openai.chat.completions.create(
+                    model=self.model, messages=self.to_api_messages(tmp_messages), temperature=self.temperature,
+                    stream=True
+                )
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+
+                result = "".join(parts)
+                if use_cache:
+                    self.response_cache.put(self.persona, self.model, self.temperature, prompt, result)
+
+            tmp_messages = self.append_response(
+                messages=tmp_messages, response=result
+            )
+            self.save_messages(convo_id=convo_id, messages=tmp_messages, is_new=is_new)
+
+        except openai.APIConnectionError as e:
+            logging.debug("open api error,The server could not be reached, error: %s", e.__cause__)
+            raise e
+        except openai.RateLimitError as e:
+            logging.debug("open api error, A 429 status code was received; we should back off a bit")
+            raise e
+        except openai.APIStatusError as e:
+            logging.debug("open api error, http_status: %s, error: %s", e.status_code, e.response)
+            raise e
+
+    def prepare_messages(self, prompt: str, convo_id: str):
+        """
+        Returns the messages to send for prompt, with the conversation so far when there is one,
+        and whether this prompt starts a new conversation
+        """
+        tmp_messages = []
+        if convo_id in self.context:
+            tmp_messages = self.context[convo_id]
+        # logging.debug(f"cached messages: {tmp_messages}")
+        # logging.debug(f"messages type: {type(tmp_messages)}")
+
+        cur_tokens, mod_tokens = self.reduce_messages(
+            messages=tmp_messages)
+        if cur_tokens > mod_tokens:
+            logging.debug("max tokens exceeded! reduced by %s", cur_tokens - mod_tokens)
+
+        # for maintaining context/history of chat, using passed convo_id as key
+        msg_len = len(tmp_messages)
+        is_new = msg_len < 3
+        if is_new:
+            tmp_messages = self.init_messages(prompt=prompt)
+        # elif msg_len == 1:
+        #     tmp_messages = self.init_messages(prompt=prompt)
+        # elif msg_len == 2:
+        #     tmp_messages = self.init_messages(prompt=prompt)
+        else:
+            tmp_messages = self.append_prompt(
+                messages=tmp_messages, prompt=prompt)
+
+        return tmp_messages, is_new
+
+    def use_response_cache(self, is_new: bool):
+        """
+        Returns True when the response to a prompt can come from, and go to, the response cache
+        """
+        return is_new and self.response_cache is not None and self.response_cache.applies(self.temperature)
+
+    def save_messages(self, convo_id: str, messages: list, is_new: bool):
+        """
+        Store the conversation, appending only the latest prompt and response when the context supports it
+        """
+        if not is_new and hasattr(self.context, "append"):
+            self.context.append(convo_id, *messages[-2:])
+        else:
+            self.context[convo_id] = messages
+
     def init_messages(self, prompt):
         """
         Initialize messages for a new conversation
         """
         result = []
-        result.append({"role": "system", "content": self.persona})
-        result.append({"role": "user", "content": prompt})
+        result.append(self.new_message(role="system", content=self.persona))
+        result.append(self.new_message(role="user", content=prompt))
         return result
 
     def append_prompt(self, messages: list, prompt: str):
         """
         Append a prompt to an existing conversation
         """
-        messages.append({"role": "user", "content": prompt})
+        messages.append(self.new_message(role="user", content=prompt))
         return messages
 
     def append_response(self, messages: list, response: str):
         """
         Append a response to an existing conversation
         """
-        messages.append({"role": "assistant", "content": response})
+        messages.append(self.new_message(role="assistant", content=response))
         return messages
 
+    def new_message(self, role: str, content: str):
+        """
+        Returns a message with its token count computed once, up front
+        """
+        message = {"role": role, "content": content}
+        self.message_tokens(message)
+        return message
+
 
 class OpenAiImage:
     """
@@ -348,28 +474,22 @@ class OpenAiImage:
             logging.debug("open api error, http_status: %s, error: %s", e.status_code, e.response)
             return "beep bop. bot beep. Dave? Dave what is going on?"
 
-    def variation(self, image):
+    def variation(self, image, preprocessor=None):
         """
-        Prompt chat for an image variation of an existing image
+        Prompt chat for an image variation of an existing image, its path or bytes,
+        prepared by preprocessor when given
         """
 
         result = None
 
         logging.debug("creating variation of image")
 
-        with Image.open(BytesIO(image)) as img_convert:
-
-            # for size to match our intended, ignoring aspect ratio for now
-            img_convert = img_convert.resize((self.width, self.height))
-
-            # convert to png for submission, if necessary
-            if img_convert.format != "PNG":
-                logging.debug("converting image to png as format is %s", img_convert.format)
-                img_convert = img_convert.convert("RGB")
+        if preprocessor is not None:
+            png = preprocessor.prepare(image)
+        else:
+            png = prepare_variation_image(image, size=self.width)
 
-            img_buffer = BytesIO()
-            img_convert.save(img_buffer, format="PNG")
-            img_buffer.seek(0)
+        with BytesIO(png) as img_buffer:
 
             try:
                 # https://beta.openai.com/docs/api-reference/images/create-variation
@@ -417,8 +537,8 @@ class OpenAiTranscribe:
         logging.debug("creating transcription from audio file %s", audio_file)
 
         try:
-            audio = open(audio_file, "rb")
-            result = openai.audio.transcriptions.create(self.model, audio)
+            with open(audio_file, "rb") as audio:
+                result = openai.audio.transcriptions.create(file=audio, model=self.model)
 
             return result.text
 
@@ -430,4 +550,37 @@ class OpenAiTranscribe:
             raise e
         except openai.APIStatusError as e:
             logging.debug("open api error, http_status: %s, error: %s", e.status_code, e.response)
-            raise e
\ No newline at end of file
+            raise e
+
+    def create_with_retry(self, audio_file, max_attempts=3, backoff_seconds=2):
+        """
+        Transcribes audio_file, retrying connection errors, rate limits and server errors with a growing delay
+        """
+        for attempt in range(1, max_attempts + 1):
+            try:
+                return self.create(audio_file)
+            except (openai.APIConnectionError, openai.APIStatusError) as e:
+                retryable = not isinstance(e, openai.APIStatusError) or e.status_code == 429 or e.status_code >= 500
+                if not retryable or attempt >= max_attempts:
+                    raise e
+
+                delay = backoff_seconds * 2 ** (attempt - 1)
+                logging.info("transcribing %s failed on attempt %s, retrying in %ss", audio_file, attempt, delay)
+                time.sleep(delay)
+
+    def create_segmented(self, audio_file, segment_seconds=DEFAULT_SEGMENT_SECONDS, max_workers=4, max_attempts=3):
+        """
+        Splits audio_file into segments of at most segment_seconds, transcribes them concurrently
+        and joins the text back together in order. Each segment is retried on its own.
+        """
+        with audio_segments(audio_file, segment_seconds) as segments:
+            logging.debug("transcribing %s in %s segments", audio_file, len(segments))
+            if len(segments) == 1:
+                return self.create_with_retry(segments[0], max_attempts=max_attempts)
+
+            max_workers = max(1, min(max_workers, len(segments)))
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="whisper") as executor:
+                texts = list(executor.map(
+                    lambda segment: self.create_with_retry(segment, max_attempts=max_attempts), segments))
+
+        return " ".join(text.strip() for text in texts if text)
@@ -3,11 +3,15 @@ Interact with a plex server
 """
 import logging
 import urllib.parse
+from io import BytesIO
 
 from datetime import datetime, timedelta
 from plexapi.server import PlexServer
 from mastodon_bot.util import error_info
-from mastodon_bot.util import download_remote_file
+from mastodon_bot.util import open_remote_file_stream, copy_remote_file_stream
+
+# mastodon's own limit for an image upload
+POSTER_MAX_BYTES = 16 * 1024 * 1024
 
 
 class PlexInstance:
@@ -20,9 +24,10 @@ class PlexInstance:
         self.plex_token = plex_token
         self.plex_server_id = plex_server_id
 
-    def get_recently_added(self, hours_since: int):
+    def get_recently_added(self, hours_since: int, watermark=None):
         """
-        Get recently added media items
+        Get recently added media items, oldest first: those not yet posted according to watermark
+        when there is one, otherwise those added in the last hours_since hours
         """
         result = []
 
@@ -30,22 +35,28 @@ class PlexInstance:
 
         try:
             added = plex.library.recentlyAdded()
+            now = datetime.now()
             for media_item in added:
-                item_added_at = media_item.addedAt
-                now = datetime.now()
-                hours_age = (now - item_added_at) / timedelta(hours=1)
-                if hours_age <= hours_since:
-                    item_to_add = PlexRecentlyAddedItem(
-                        media_item=media_item, server_id=self.plex_server_id
-                    )
+                item_to_add = PlexRecentlyAddedItem(
+                    media_item=media_item, server_id=self.plex_server_id
+                )
+                if watermark is not None:
+                    is_new = watermark.is_new(item_to_add.get_added_at(), item_to_add.get_key())
+                else:
+                    hours_age = (now - media_item.addedAt) / timedelta(hours=1)
+                    is_new = hours_age <= hours_since
+
+                if is_new:
                     result.append(item_to_add)
                     logging.debug("Added to result: %s", media_item.title)
                 else:
-                    logging.debug("Not added: %s, added %s hours ago", media_item.title, hours_age)
+                    logging.debug("Not added: %s, added at %s", media_item.title, media_item.addedAt)
 
         except Exception as e:
             logging.error(error_info(e))
 
+        # posted in the order they were added, so the watermark only ever moves forward
+        result.sort(key=lambda item: item.get_added_at())
         return result
 
 
@@ -69,12 +80,26 @@ class PlexRecentlyAddedItem:
             desc = f"A {self.media_item.type} called {self.media_item.title} was added to Plex!.\n\nSummary:\n{self.media_item.summary}\n\n{self.get_public_uri()}"
         return desc
 
+    def get_added_at(self) -> float:
+        """
+        Get when this item was added, as a timestamp
+        """
+        return self.media_item.addedAt.timestamp()
+
+    def get_key(self) -> str:
+        """
+        Get the plex key for this item
+        """
+        return self.media_item.key
+
     def get_poster_image_data(self):
         """
         Get the poster image for this item
         """
-        content_data, file_extension = download_remote_file(self.media_item.posterUrl)
-        return content_data
+        response, file_extension = open_remote_file_stream(self.media_item.posterUrl, max_bytes=POSTER_MAX_BYTES)
+        buffer = BytesIO()
+        copy_remote_file_stream(response, buffer, max_bytes=POSTER_MAX_BYTES)
+        return buffer.getvalue()
 
     def get_post_image_file_name(self):
         """
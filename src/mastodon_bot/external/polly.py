@@ -6,11 +6,14 @@ import logging
 from contextlib import closing
 from tempfile import gettempdir
 import boto3
+from botocore.config import Config
 from botocore.exceptions import BotoCoreError, ClientError
+from mastodon_bot.lib.polly.voice_catalog import VoiceCatalog
 
 DEFAULT_REGION = "us-east-1"
 DEFAULT_URL = f"https://polly.{DEFAULT_REGION}.amazonaws.com"
 DEFAULT_PROFILE = ""
+DEFAULT_MAX_POOL_CONNECTIONS = 10
 
 
 class PollyWrapper:
@@ -18,7 +21,8 @@ class PollyWrapper:
     Wrapper class for AWS Polly.
     """
     def __init__(self, access_key_id: str, access_secret_key: str, region_name: str = DEFAULT_REGION,
-                 endpoint_url: str = DEFAULT_URL, profile_name: str = DEFAULT_PROFILE):
+                 endpoint_url: str = DEFAULT_URL, profile_name: str = DEFAULT_PROFILE,
+                 max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS, redis_client=None):
 
         boto3.set_stream_logger(
             name='botocore.credentials', level=logging.WARNING)
@@ -34,7 +38,10 @@ class PollyWrapper:
             session = boto3.Session(profile_name=profile_name)
 
         self.polly = session.client(
-            'polly', region_name=region_name, endpoint_url=endpoint_url)
+            'polly', region_name=region_name, endpoint_url=endpoint_url,
+            config=Config(max_pool_connections=max_pool_connections))
+
+        self.voice_catalog = VoiceCatalog(fetch_voices=self.get_voices, redis_client=redis_client)
 
     def start_speak(self, text: str, output_bucket: str, output_key_prefix: str,
                     format_type: str = 'mp3', voice_id: str = 'Brian'):
@@ -77,6 +84,18 @@ class PollyWrapper:
 
         return task_id
 
+    def get_task(self, task_id: str) -> dict:
+        """
+        Returns the SynthesisTask for task_id, with its TaskStatus and OutputUri.
+        """
+        try:
+            response = self.polly.get_speech_synthesis_task(TaskId=task_id)
+            return response['SynthesisTask']
+
+        except (BotoCoreError, ClientError) as e:
+            logging.error("aws polly error, %s", e)
+            raise e
+
     def speak(self, text: str, out_file: str, format_type: str = 'mp3', voice_id: str = 'Brian'):
         """
         Synthesizes speech from text, and saves it to a file.
@@ -132,12 +151,43 @@ class PollyWrapper:
             logging.error("aws polly error, %s", e)
             raise e
 
+    def synthesize(self, text: str, format_type: str = 'mp3', voice_id: str = 'Brian', engine: str = None) -> bytes:
+        """
+        Synthesizes speech from text in a single request and returns the audio.
+        Raises on any error, including text over the synthesize_speech limit.
+        """
+        text_type = "text"
+        if self.is_valid_sml(text):
+            text_type = "ssml"
+
+        if engine is None:
+            engine = self.decide_engine(voice_id)
+
+        try:
+            response = self.polly.synthesize_speech(
+                Text=text, OutputFormat=format_type, VoiceId=voice_id,
+                TextType=text_type, Engine=engine)
+
+            with closing(response["AudioStream"]) as stream:
+                return stream.read()
+
+        except (BotoCoreError, ClientError) as e:
+            logging.error("aws polly error, %s", e)
+            raise e
+
     def get_voices(self):
         """
         Returns a list of voices available for use when requesting speech synthesis.
         """
-        result = self.polly.describe_voices()
-        return result["Voices"]
+        result = []
+        request = {}
+        while True:
+            response = self.polly.describe_voices(**request)
+            result.extend(response["Voices"])
+            if "NextToken" not in response:
+                break
+            request["NextToken"] = response["NextToken"]
+        return result
 
     def is_valid_sml(self, sml_string):
         """
@@ -158,10 +208,6 @@ class PollyWrapper:
         Returns the engine to use based on the voice_id.
         """
         engine = "standard"
-        all_voices = self.get_voices()
-        for voice in all_voices:
-            if voice['Id'] == voice_id:
-                if "neural" in voice['SupportedEngines']:
-                    engine = "neural"
-                break
+        if self.voice_catalog.supports_engine(voice_id, "neural"):
+            engine = "neural"
         return engine
@@ -2,21 +2,29 @@
 Interact with aws s3 using boto3
 """
 import io
+import gzip
+import hashlib
+from urllib.parse import urlparse
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+DEFAULT_MAX_POOL_CONNECTIONS = 10
 
 class s3Wrapper:
     """
     Interact with aws s3 using boto3
     """
 
-    def __init__(self, access_key_id: str, access_secret_key: str, bucket_name: str, prefix_path: str):
+    def __init__(self, access_key_id: str, access_secret_key: str, bucket_name: str, prefix_path: str,
+                 max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS):
 
         session = boto3.Session(
             aws_access_key_id=access_key_id,
             aws_secret_access_key=access_secret_key
         )
 
-        self.s3 = session.client('s3')
+        self.s3 = session.client('s3', config=Config(max_pool_connections=max_pool_connections))
         self.bucket_name = bucket_name
         self.prefix_path = prefix_path
 
@@ -37,6 +45,23 @@ class s3Wrapper:
 
         return s3_url
 
+    def upload_compressed_to_s3(self, content: str, extension: str = ".html",
+                                content_type: str = "text/html; charset=utf-8") -> str:
+        """
+        Gzips content and uploads it, publicly readable with Content-Encoding: gzip, under a key
+        made from the hash of the content. When that key already exists, i.e. on a retry, nothing
+        is uploaded. Returns a publicly accessible URL.
+        """
+        content_bytes = content.encode("utf-8")
+        s3_key = f"{hashlib.sha256(content_bytes).hexdigest()}{extension}"
+
+        if not self.file_exists(s3_key):
+            # mtime=0 keeps the compressed bytes the same for the same content
+            self.upload_bytes_to_s3(content=gzip.compress(content_bytes, mtime=0), s3_key=s3_key,
+                                    content_type=content_type, public=True, content_encoding="gzip")
+
+        return self.get_public_url(s3_key)
+
     def upload_file_to_s3(self, file_path: str, s3_key: str, content_type: str) -> str:
         """
         Uploads a file to S3 and returns a publicly accessible URL.
@@ -56,13 +81,29 @@ class s3Wrapper:
 
         return s3_url
 
-    def get_file(self, s3_key: str) -> bytes:
+    def upload_bytes_to_s3(self, content: bytes, s3_key: str, content_type: str, public: bool = False,
+                           content_encoding: str = None) -> str:
         """
-        Gets a file from S3 and returns the bytes.
+        Uploads bytes to S3 and returns the URL, which is only publicly accessible when public is set.
         """
         if self.prefix_path:
             s3_key = f"{self.prefix_path}{s3_key}"
 
+        extra_args = {'ACL': 'public-read'} if public else {}
+        if content_encoding:
+            extra_args['ContentEncoding'] = content_encoding
+        self.s3.put_object(Body=content, Bucket=self.bucket_name,
+                           Key=s3_key, ContentType=content_type, **extra_args)
+
+        return f"https://{self.bucket_name}.s3.amazonaws.com/{s3_key}"
+
+    def get_file(self, s3_key: str, apply_prefix: bool = True) -> bytes:
+        """
+        Gets a file from S3 and returns the bytes.
+        """
+        if self.prefix_path and apply_prefix:
+            s3_key = f"{self.prefix_path}{s3_key}"
+
         bytes_buffer = io.BytesIO()
         self.s3.download_fileobj(Bucket=self.bucket_name, Key=s3_key, Fileobj=bytes_buffer)
         return bytes_buffer.getvalue()
@@ -74,11 +115,39 @@ class s3Wrapper:
         byte_value = self.get_file(s3_key=s3_key)
         return byte_value.decode() #python3, default decoding is utf-8
 
-    def get_public_url(self, s3_key: str) -> str:
+    def file_exists(self, s3_key: str, apply_prefix: bool = True) -> bool:
+        """
+        Returns True if the key exists, using a HEAD request so nothing is downloaded.
+        """
+        if self.prefix_path and apply_prefix:
+            s3_key = f"{self.prefix_path}{s3_key}"
+
+        try:
+            self.s3.head_object(Bucket=self.bucket_name, Key=s3_key)
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise e
+
+    def key_from_uri(self, uri: str) -> str:
+        """
+        Returns the object key from an s3 uri in path style (https://s3.region.amazonaws.com/bucket/key),
+        virtual host style (https://bucket.s3.amazonaws.com/key) or s3://bucket/key form.
+        """
+        parsed = urlparse(uri)
+        path = parsed.path.lstrip("/")
+        if parsed.scheme == "s3" or parsed.netloc.startswith(f"{self.bucket_name}."):
+            return path
+        if path.startswith(f"{self.bucket_name}/"):
+            return path[len(self.bucket_name) + 1:]
+        return path
+
+    def get_public_url(self, s3_key: str, apply_prefix: bool = True) -> str:
         """
         Returns a publicly accessible URL for the given S3 key.
         """
-        if self.prefix_path:
+        if self.prefix_path and apply_prefix:
             s3_key = f"{self.prefix_path}{s3_key}"
 
         return f"https://{self.bucket_name}.s3.amazonaws.com/{s3_key}"
@@ -2,7 +2,6 @@
 Interact with YouTube API
 """
 from pathlib import Path
-from pytube import YouTube
 
 class YouTubeWrapper:
     """
@@ -13,6 +12,9 @@ class YouTubeWrapper:
         """
         Download audio from YouTube video
         """
+        # only loaded when there is a video to download
+        from pytube import YouTube
+
         yt = YouTube(url)
         if filename is None:
             filename = Path(out_dir, self.to_snake_case(yt.title)).with_suffix(".mp4")
@@ -0,0 +1,200 @@
+"""
+Split audio files into time bounded segments
+"""
+import os
+import mmap
+import shutil
+import logging
+import tempfile
+import subprocess
+from contextlib import contextmanager
+
+DEFAULT_SEGMENT_SECONDS = 600
+
+# kbps by (is mpeg 1, layer)
+MP3_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+# hz by the version bits of the frame header
+MP3_SAMPLE_RATES = {
+    0: [11025, 12000, 8000],
+    2: [22050, 24000, 16000],
+    3: [44100, 48000, 32000],
+}
+
+
+def id3_tag_length(data, offset: int = 0) -> int:
+    """
+    Returns the length of the ID3v2 tag starting at offset, or 0 when there isn't one
+    """
+    if data[offset:offset + 3] != b"ID3" or len(data) < offset + 10:
+        return 0
+
+    size = 0
+    for byte in data[offset + 6:offset + 10]:
+        size = (size << 7) | (byte & 0x7F)
+
+    footer = 10 if data[offset + 5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def mp3_frame_header(data, offset: int):
+    """
+    Returns (frame length, duration in seconds) for the mpeg audio frame header at offset,
+    or None when offset isn't the start of a valid frame
+    """
+    if offset + 4 > len(data):
+        return None
+
+    b1, b2 = data[offset + 1], data[offset + 2]
+    if data[offset] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 0x03
+    layer = 4 - ((b1 >> 1) & 0x03)
+    bitrate_index = (b2 >> 4) & 0x0F
+    sample_rate_index = (b2 >> 2) & 0x03
+    padding = (b2 >> 1) & 0x01
+
+    # reserved version and layer, free format and bad bitrates, reserved sample rate
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    is_mpeg1 = version == 3
+    bitrate = MP3_BITRATES[(is_mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][sample_rate_index]
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if is_mpeg1 or layer == 2 else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+
+    return length, samples / sample_rate
+
+
+def mp3_frames(data):
+    """
+    Yields (offset, length, duration in seconds) for each mpeg audio frame in data,
+    skipping ID3 tags and resyncing past anything that isn't a frame
+    """
+    offset = id3_tag_length(data)
+    end = len(data)
+    while offset < end:
+        header = mp3_frame_header(data, offset)
+        if header is None:
+            tag_length = id3_tag_length(data, offset)
+            offset += tag_length if tag_length else 1
+            continue
+
+        length, duration = header
+        if offset + length > end:
+            break
+
+        yield offset, length, duration
+        offset += length
+
+
+def mp3_segment_ranges(data, segment_seconds: float) -> list:
+    """
+    Returns (start, end) byte ranges of data, cut on frame boundaries, each at most segment_seconds long
+    """
+    ranges = []
+    start = end = None
+    elapsed = 0.0
+    for offset, length, duration in mp3_frames(data):
+        if start is None or elapsed + duration > segment_seconds:
+            if start is not None:
+                ranges.append((start, end))
+            start = offset
+            elapsed = 0.0
+        end = offset + length
+        elapsed += duration
+
+    if start is not None:
+        ranges.append((start, end))
+    return ranges
+
+
+def split_mp3(audio_file: str, segment_seconds: float, out_dir: str) -> list:
+    """
+    Splits an mp3 into segments on frame boundaries without decoding it
+    """
+    if os.path.getsize(audio_file) == 0:
+        return [audio_file]
+
+    paths = []
+    with open(audio_file, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        ranges = mp3_segment_ranges(data, segment_seconds)
+        if len(ranges) <= 1:
+            return [audio_file]
+
+        for index, (start, end) in enumerate(ranges):
+            path = os.path.join(out_dir, f"segment_{index:04d}.mp3")
+            with open(path, "wb") as out_file:
+                out_file.write(data[start:end])
+            paths.append(path)
+
+    return paths
+
+
+def split_with_ffmpeg(audio_file: str, segment_seconds: float, out_dir: str) -> list:
+    """
+    Splits any container ffmpeg understands into segments, copying the audio stream as is
+    """
+    extension = os.path.splitext(audio_file)[1] or ".mp4"
+    subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", audio_file, "-vn",
+         "-f", "segment", "-segment_time", str(segment_seconds), "-c", "copy", "-reset_timestamps", "1",
+         os.path.join(out_dir, f"segment_%04d{extension}")],
+        check=True,
+    )
+
+    paths = sorted(os.path.join(out_dir, name) for name in os.listdir(out_dir))
+    return paths if len(paths) > 1 else [audio_file]
+
+
+def split_audio(audio_file: str, segment_seconds: float = DEFAULT_SEGMENT_SECONDS, out_dir: str = None) -> list:
+    """
+    Returns the paths of audio_file split into segments of at most segment_seconds, in order.
+
+    mp3 is cut on frame boundaries in process; anything else needs ffmpeg on the path.
+    When the audio can't be or doesn't need to be split, the list holds only audio_file.
+    """
+    if not segment_seconds or segment_seconds <= 0:
+        return [audio_file]
+
+    if out_dir is None:
+        out_dir = tempfile.mkdtemp(prefix="segments_")
+
+    if audio_file.lower().endswith(".mp3"):
+        return split_mp3(audio_file, segment_seconds, out_dir)
+
+    if shutil.which("ffmpeg"):
+        try:
+            return split_with_ffmpeg(audio_file, segment_seconds, out_dir)
+        except subprocess.CalledProcessError as e:
+            logging.error("ffmpeg could not split %s, transcribing it whole: %s", audio_file, e)
+            return [audio_file]
+
+    logging.debug("ffmpeg not found, not splitting %s", audio_file)
+    return [audio_file]
+
+
+@contextmanager
+def audio_segments(audio_file: str, segment_seconds: float = DEFAULT_SEGMENT_SECONDS):
+    """
+    Yields the segments of audio_file, removing them again on exit. audio_file itself is left alone.
+    """
+    out_dir = tempfile.mkdtemp(prefix="segments_")
+    try:
+        yield split_audio(audio_file, segment_seconds, out_dir)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
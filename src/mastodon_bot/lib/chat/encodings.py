@@ -0,0 +1,64 @@
+"""
+Process wide cache of tiktoken encodings and of token counts for text that repeats, like personas
+"""
+import os
+import logging
+import threading
+from functools import lru_cache
+import tiktoken
+
+# what the chat models use, and what unknown models fall back to
+DEFAULT_ENCODING = "cl100k_base"
+DEFAULT_MODELS = ("gpt-3.5-turbo", "gpt-4")
+# tiktoken reads and writes its bpe files here, so a directory filled at build time needs no network
+CACHE_DIR_ENV = "TIKTOKEN_CACHE_DIR"
+
+
+class EncodingRegistry:
+    """
+    Loads each tiktoken encoding once per process and remembers which encoding each model uses
+    """
+
+    def __init__(self, default_encoding: str = DEFAULT_ENCODING):
+        self.default_encoding = default_encoding
+        self._model_encodings = {}
+        self._lock = threading.Lock()
+
+    def for_model(self, model: str) -> tiktoken.Encoding:
+        """
+        Returns the encoding for model, or the default encoding when tiktoken doesn't know the model
+        """
+        encoding = self._model_encodings.get(model)
+        if encoding is not None:
+            return encoding
+
+        with self._lock:
+            encoding = self._model_encodings.get(model)
+            if encoding is None:
+                try:
+                    encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    logging.debug("no tiktoken encoding for %s, using %s", model, self.default_encoding)
+                    encoding = tiktoken.get_encoding(self.default_encoding)
+                self._model_encodings[model] = encoding
+            return encoding
+
+    def warm(self, models: tuple = DEFAULT_MODELS):
+        """
+        Loads the encodings for models, i.e. in a worker before it forks for jobs
+        """
+        for model in models:
+            encoding = self.for_model(model)
+            logging.info("loaded tiktoken encoding %s for %s", encoding.name, model)
+        logging.debug("tiktoken cache dir: %s", os.environ.get(CACHE_DIR_ENV, "tiktoken default"))
+
+
+@lru_cache(maxsize=128)
+def count_tokens(encoding: tiktoken.Encoding, text: str) -> int:
+    """
+    Returns the number of tokens in text, remembering the count for text seen recently
+    """
+    return len(encoding.encode(text))
+
+
+encodings = EncodingRegistry()
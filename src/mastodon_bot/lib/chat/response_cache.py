@@ -0,0 +1,101 @@
+"""
+Redis cache of chat completions for prompts that start a conversation
+"""
+import time
+import hashlib
+
+DEFAULT_KEY_PREFIX = "mastodon_bot:chat:cache"
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_TEMPERATURE = 0.3
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Returns prompt case folded, with runs of whitespace collapsed and surrounding punctuation removed
+    """
+    return " ".join(prompt.casefold().split()).strip(" .!?")
+
+
+class ChatResponseCache:
+    """
+    Completions keyed by persona, model, temperature and normalized prompt.
+
+    Each entry expires after ttl_seconds, and a sorted set of entries by last use keeps the
+    cache to max_entries, dropping the least recently used first.  Hits and misses are
+    counted in redis so they cover every worker.
+    """
+
+    def __init__(self, redis_client, ttl_seconds: int = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_temperature: float = DEFAULT_MAX_TEMPERATURE, key_prefix: str = DEFAULT_KEY_PREFIX):
+        self.redis_client = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_temperature = max_temperature
+        self.key_prefix = key_prefix
+
+    def _entry_key(self, persona: str, model: str, temperature: float, prompt: str) -> str:
+        digest = hashlib.sha256()
+        for part in (persona, model, float(temperature), normalize_prompt(prompt)):
+            digest.update(str(part).encode("utf-8"))
+            digest.update(b"\0")
+        return f"{self.key_prefix}:{digest.hexdigest()}"
+
+    def _index_key(self) -> str:
+        return f"{self.key_prefix}:index"
+
+    def _stats_key(self) -> str:
+        return f"{self.key_prefix}:stats"
+
+    def applies(self, temperature: float) -> bool:
+        """
+        Returns True when responses at temperature are stable enough to reuse
+        """
+        return temperature is not None and temperature <= self.max_temperature
+
+    def get(self, persona: str, model: str, temperature: float, prompt: str):
+        """
+        Returns the cached response, or None, counting the hit or miss
+        """
+        key = self._entry_key(persona, model, temperature, prompt)
+        response = self.redis_client.get(key)
+
+        pipeline = self.redis_client.pipeline(transaction=False)
+        if response is not None:
+            pipeline.zadd(self._index_key(), {key: time.time()})
+            pipeline.hincrby(self._stats_key(), "hits", 1)
+        else:
+            pipeline.hincrby(self._stats_key(), "misses", 1)
+        pipeline.execute()
+
+        return response.decode("utf-8") if response is not None else None
+
+    def put(self, persona: str, model: str, temperature: float, prompt: str, response: str):
+        """
+        Stores response, then trims the cache back to max_entries
+        """
+        if not response:
+            return
+
+        key = self._entry_key(persona, model, temperature, prompt)
+        now = time.time()
+
+        pipeline = self.redis_client.pipeline()
+        pipeline.set(key, response, ex=self.ttl_seconds)
+        pipeline.zadd(self._index_key(), {key: now})
+        # entries past their ttl are already gone, drop them from the index too
+        pipeline.zremrangebyscore(self._index_key(), "-inf", now - self.ttl_seconds)
+        pipeline.zcard(self._index_key())
+        size = pipeline.execute()[-1]
+
+        if size > self.max_entries:
+            evicted = self.redis_client.zpopmin(self._index_key(), size - self.max_entries)
+            if evicted:
+                self.redis_client.delete(*[entry_key for entry_key, _ in evicted])
+
+    def stats(self) -> dict:
+        """
+        Returns the hit and miss counts across every worker
+        """
+        stats = self.redis_client.hgetall(self._stats_key())
+        return {"hits": int(stats.get(b"hits", 0)), "misses": int(stats.get(b"misses", 0))}
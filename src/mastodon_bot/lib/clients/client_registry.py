@@ -0,0 +1,155 @@
+"""
+Process wide registry of long lived api clients used by the rq worker
+"""
+import os
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from redis import Redis
+from mastodon import Mastodon
+from mastodon_bot.external.s3 import s3Wrapper
+from mastodon_bot.external.polly import PollyWrapper
+from mastodon_bot.lib.clients.rate_limiter import MastodonRateLimiter, RateLimitedMastodon
+from mastodon_bot.lib.listen.listener_config import ListenerConfig
+
+DEFAULT_POOL_SIZE = 10
+
+
+class ClientRegistry:
+    """
+    Hands out long lived, thread safe clients keyed by the credential and host tuple they were built from.
+
+    Each client owns its own http connection pool, so reusing the client across jobs reuses
+    the tls connections and resolved credentials instead of building them again per job.
+    That needs the jobs run in the process that holds the registry, i.e. by rq's SimpleWorker,
+    as a forked work horse starts again with an empty registry.
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE):
+        self.pool_size = pool_size
+        self.hits = 0
+        self.misses = 0
+        self._clients = {}
+        # reentrant, so a factory can fetch the clients it depends on
+        self._lock = threading.RLock()
+
+    def get_or_create(self, key: tuple, factory):
+        """
+        Returns the client stored under key, building it with factory on first use
+        """
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self.hits += 1
+                return client
+
+            self.misses += 1
+            logging.debug("client registry miss for %s", key[0])
+            client = factory()
+            self._clients[key] = client
+            return client
+
+    def get_mastodon(self, config: ListenerConfig) -> Mastodon:
+        """
+        Returns a Mastodon client for the account in config. With a redis connection its posts
+        go through the rate limiter shared by every worker, otherwise Mastodon.py paces them.
+        """
+        key = ("mastodon", config.mastodon_host, config.mastodon_client_id,
+               config.mastodon_client_secret, config.mastodon_access_token, config.rq_redis_connection)
+
+        def factory():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            mastodon_api = Mastodon(
+                client_id=config.mastodon_client_id,
+                client_secret=config.mastodon_client_secret,
+                access_token=config.mastodon_access_token,
+                api_base_url=config.mastodon_host,
+                session=session,
+                ratelimit_method="wait" if config.rq_redis_connection else "pace",
+            )
+            if not config.rq_redis_connection:
+                return mastodon_api
+
+            limiter = MastodonRateLimiter(self.get_redis(config.rq_redis_connection),
+                                          account=f"{config.mastodon_host}:{config.mastodon_access_token}")
+            return RateLimitedMastodon(mastodon_api, limiter)
+
+        return self.get_or_create(key, factory)
+
+    def get_s3(self, config: ListenerConfig) -> s3Wrapper:
+        """
+        Returns an s3Wrapper for the bucket and credentials in config
+        """
+        key = ("s3", config.mastodon_s3_access_key_id, config.mastodon_s3_access_secret_key,
+               config.mastodon_s3_bucket_name, config.mastodon_s3_bucket_prefix_path)
+
+        def factory():
+            return s3Wrapper(access_key_id=config.mastodon_s3_access_key_id,
+                             access_secret_key=config.mastodon_s3_access_secret_key,
+                             bucket_name=config.mastodon_s3_bucket_name,
+                             prefix_path=config.mastodon_s3_bucket_prefix_path,
+                             max_pool_connections=self.pool_size)
+
+        return self.get_or_create(key, factory)
+
+    def get_polly(self, config: ListenerConfig) -> PollyWrapper:
+        """
+        Returns a PollyWrapper for the region and credentials in config
+        """
+        key = ("polly", config.mastodon_s3_access_key_id, config.mastodon_s3_access_secret_key,
+               config.aws_polly_region_name, config.rq_redis_connection)
+
+        def factory():
+            # the voice catalog shares its redis client, rather than opening another pool
+            redis_client = self.get_redis(config.rq_redis_connection) if config.rq_redis_connection else None
+            return PollyWrapper(access_key_id=config.mastodon_s3_access_key_id,
+                                access_secret_key=config.mastodon_s3_access_secret_key,
+                                region_name=config.aws_polly_region_name,
+                                endpoint_url=f"https://polly.{config.aws_polly_region_name}.amazonaws.com",
+                                max_pool_connections=self.pool_size,
+                                redis_client=redis_client)
+
+        return self.get_or_create(key, factory)
+
+    def get_redis(self, redis_connection: str) -> Redis:
+        """
+        Returns a Redis client, backed by its own connection pool, for the redis uri
+        """
+        key = ("redis", redis_connection)
+
+        def factory():
+            return Redis.from_url(redis_connection, max_connections=self.pool_size * 2)
+
+        return self.get_or_create(key, factory)
+
+    def stats(self) -> dict:
+        """
+        Returns the hit/miss counters and the number of clients held
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "clients": len(self._clients)}
+
+    def clear(self):
+        """
+        Drops every held client, i.e. after a credential rotation
+        """
+        with self._lock:
+            self._clients.clear()
+
+    def reset_after_fork(self):
+        """
+        Forgets the parent's clients in a forked child, whose sockets and boto3 clients can't be
+        shared with the parent. The lock is replaced, as another thread may have held it at the fork.
+        """
+        self._lock = threading.RLock()
+        self._clients = {}
+        self.hits = 0
+        self.misses = 0
+
+
+registry = ClientRegistry()
+os.register_at_fork(after_in_child=registry.reset_after_fork)
@@ -0,0 +1,199 @@
+"""
+Mastodon rate limiting shared through redis by every worker posting as an account
+"""
+import time
+import hashlib
+import logging
+import threading
+from dateutil.parser import parse as parse_date
+
+DEFAULT_KEY_PREFIX = "mastodon_bot:ratelimit"
+# mastodon's defaults until the first response tells us otherwise
+DEFAULT_LIMIT = 300
+DEFAULT_WINDOW_SECONDS = 300
+DEFAULT_MAX_WAIT_SECONDS = 15 * 60
+
+
+def take_token(state: dict, now: float, default_limit: int = DEFAULT_LIMIT,
+               window_seconds: int = DEFAULT_WINDOW_SECONDS) -> tuple:
+    """
+    Takes a token from the bucket in state, refilling it first if its reset has passed.
+    Returns the new state and the seconds to wait, 0 when a token was taken.
+    """
+    limit = int(state.get("limit", default_limit))
+    tokens = state.get("tokens")
+    reset = state.get("reset")
+
+    if tokens is None or reset is None or now >= float(reset):
+        tokens = limit
+        reset = now + window_seconds
+
+    tokens = float(tokens)
+    reset = float(reset)
+    wait = 0.0
+    if tokens >= 1:
+        tokens -= 1
+    else:
+        wait = reset - now
+
+    return {"tokens": tokens, "reset": reset, "limit": limit}, wait
+
+
+def rate_limit_from_headers(headers, now: float = None) -> tuple:
+    """
+    Returns (remaining, reset, limit) from a response's X-RateLimit-* headers, or None without them.
+    Like Mastodon.py, reset is an epoch or iso date, moved onto our clock by the response's Date.
+    """
+    if "X-RateLimit-Remaining" not in headers:
+        return None
+
+    reset_header = headers["X-RateLimit-Reset"]
+    try:
+        reset = float(int(reset_header))
+    except ValueError:
+        reset = parse_date(reset_header).timestamp()
+
+    if "Date" in headers:
+        now = time.time() if now is None else now
+        reset += now - parse_date(headers["Date"]).timestamp()
+
+    return int(headers["X-RateLimit-Remaining"]), reset, int(headers["X-RateLimit-Limit"])
+
+
+def sync_state(state: dict, remaining: int, reset: float, limit: int) -> dict:
+    """
+    Returns state brought in line with the remaining, reset and limit mastodon reported.
+    Within the same window the lower count wins, since other workers may have spent tokens
+    since the response was sent; a later reset means a new window, so its count is taken as is.
+    """
+    tokens = state.get("tokens")
+    stored_reset = state.get("reset")
+
+    if tokens is None or stored_reset is None or reset > float(stored_reset):
+        tokens = remaining
+    else:
+        tokens = min(float(tokens), remaining)
+
+    return {"tokens": float(tokens), "reset": float(reset), "limit": int(limit)}
+
+
+class MastodonRateLimiter:
+    """
+    Token bucket per account and endpoint kept in a redis hash, so every worker and every
+    post invocation for the account draws from the same budget.
+
+    The bucket is refilled when the reset mastodon reports passes and is synced from the
+    X-RateLimit-Remaining/Reset/Limit headers of each response, see RateLimitedMastodon.
+    """
+
+    def __init__(self, redis_client, account: str, key_prefix: str = DEFAULT_KEY_PREFIX,
+                 default_limit: int = DEFAULT_LIMIT, window_seconds: int = DEFAULT_WINDOW_SECONDS,
+                 max_wait_seconds: int = DEFAULT_MAX_WAIT_SECONDS):
+        self.redis_client = redis_client
+        # the access token only appears hashed in the key
+        self.account = hashlib.sha256(account.encode("utf-8")).hexdigest()[:16]
+        self.key_prefix = key_prefix
+        self.default_limit = default_limit
+        self.window_seconds = window_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.waited_seconds = 0.0
+
+    def _key(self, bucket: str) -> str:
+        return f"{self.key_prefix}:{self.account}:{bucket}"
+
+    def _update(self, bucket: str, update) -> float:
+        key = self._key(bucket)
+
+        def transaction(pipeline):
+            state = {name.decode("utf-8"): value.decode("utf-8")
+                     for name, value in pipeline.hgetall(key).items()}
+            new_state, wait = update(state)
+            pipeline.multi()
+            pipeline.hset(key, mapping=new_state)
+            pipeline.expire(key, max(int(new_state["reset"] - time.time()), 0) + self.window_seconds)
+            return wait
+
+        return self.redis_client.transaction(transaction, key, value_from_callable=True)
+
+    def acquire(self, bucket: str) -> float:
+        """
+        Blocks until a token is available in bucket, returning the seconds waited
+        """
+        waited = 0.0
+        while True:
+            wait = self._update(bucket, lambda state: take_token(state, time.time(), self.default_limit,
+                                                                 self.window_seconds))
+            if wait <= 0:
+                break
+
+            if waited + wait > self.max_wait_seconds:
+                # let Mastodon.py's own rate limit handling take it from here
+                logging.warning("rate limit for %s not reset after %ss, posting anyway", bucket, waited)
+                break
+
+            logging.info("rate limit for %s reached, waiting %.1fs", bucket, wait)
+            time.sleep(wait)
+            waited += wait
+
+        self.waited_seconds += waited
+        return waited
+
+    def sync(self, bucket: str, remaining: int, reset: float, limit: int):
+        """
+        Brings bucket in line with what mastodon reported on the last response
+        """
+        self._update(bucket, lambda state: (sync_state(state, remaining, reset, limit), 0.0))
+
+
+class RateLimitedMastodon:
+    """
+    Wraps a Mastodon client so status_post and media_post take a token from the shared limiter first
+    and sync it from the response. Everything else is passed through to the client.
+
+    The client is shared between threads, so its ratelimit_* attributes may come from another thread's
+    request. The headers are instead read by a hook on the client's session, which requests runs on the
+    thread that made the request.
+    """
+
+    def __init__(self, mastodon_api, limiter: MastodonRateLimiter):
+        self.mastodon_api = mastodon_api
+        self.limiter = limiter
+        self._local = threading.local()
+
+        hooks = getattr(getattr(mastodon_api, "session", None), "hooks", None)
+        if isinstance(hooks, dict):
+            hooks.setdefault("response", []).append(self._record_headers)
+
+    def __getattr__(self, name):
+        return getattr(self.mastodon_api, name)
+
+    def _record_headers(self, response, *args, **kwargs):
+        if getattr(self._local, "recording", False):
+            self._local.headers = response.headers
+
+    def _limited(self, bucket: str, call, *args, **kwargs):
+        self.limiter.acquire(bucket)
+
+        self._local.recording = True
+        self._local.headers = None
+        try:
+            result = call(*args, **kwargs)
+        finally:
+            self._local.recording = False
+
+        try:
+            rate_limit = rate_limit_from_headers(self._local.headers) if self._local.headers is not None else None
+            if rate_limit is not None:
+                remaining, reset, limit = rate_limit
+                self.limiter.sync(bucket, remaining=remaining, reset=reset, limit=limit)
+        except Exception as e:
+            # the post went out, a stale bucket only costs a 429 retry later
+            logging.error("could not sync rate limit for %s: %s", bucket, e)
+
+        return result
+
+    def status_post(self, *args, **kwargs):
+        return self._limited("statuses", self.mastodon_api.status_post, *args, **kwargs)
+
+    def media_post(self, *args, **kwargs):
+        return self._limited("media", self.mastodon_api.media_post, *args, **kwargs)
@@ -0,0 +1,152 @@
+"""
+Prepares uploaded images for the image variation api, in a process pool with bounded memory
+"""
+import logging
+import threading
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+# the variation api takes a square png under 4MB
+DEFAULT_SIZE = 1024
+DEFAULT_MAX_PNG_BYTES = 4 * 1024 * 1024
+# most pixels decoded for one image, after jpeg draft decoding has scaled it down
+DEFAULT_MAX_PIXELS = 40_000_000
+DEFAULT_MAX_WORKERS = 1
+DEFAULT_TIMEOUT_SECONDS = 60
+# smaller squares the api also takes, tried in turn when a png won't fit the limit
+FALLBACK_SIZES = (512, 256)
+
+
+class ImageTooLargeError(ValueError):
+    """
+    Raised for an image with more pixels to decode than the budget allows
+    """
+
+
+def save_png(image, optimize: bool) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", optimize=optimize)
+    return buffer.getvalue()
+
+
+def encode_png(image, max_png_bytes: int):
+    """
+    Returns image as the first png within max_png_bytes, trying the cheapest to make first, or None
+    """
+    from PIL import Image
+
+    for optimize in (False, True):
+        png = save_png(image, optimize)
+        if len(png) <= max_png_bytes:
+            return png
+
+    # a palette is a quarter the size of rgba before compression
+    png = save_png(image.quantize(colors=256, method=Image.Quantize.FASTOCTREE), True)
+    if len(png) <= max_png_bytes:
+        return png
+
+    return None
+
+
+def prepare_variation_image(image, size: int = DEFAULT_SIZE, max_pixels: int = DEFAULT_MAX_PIXELS,
+                            max_png_bytes: int = DEFAULT_MAX_PNG_BYTES) -> bytes:
+    """
+    Returns image, the path to an image file or its bytes, as a size x size png within max_png_bytes,
+    stretched to a square as before. Jpegs are decoded straight to the nearest scale above size,
+    and nothing over max_pixels is decoded.
+    """
+    from PIL import Image
+
+    try:
+        opened = Image.open(BytesIO(image) if isinstance(image, bytes) else image)
+    except Image.DecompressionBombError as e:
+        # pillow's own limit, checked on open, for images far past MAX_IMAGE_PIXELS
+        raise ImageTooLargeError(str(e)) from e
+
+    with opened as image:
+        source_format = image.format
+        # only reads the header, so this is cheap even for a huge upload
+        image.draft("RGB", (size, size))
+
+        width, height = image.size
+        if width * height > max_pixels:
+            raise ImageTooLargeError(f"image is {width}x{height}, over the {max_pixels} pixel budget")
+
+        image.load()
+        if source_format != "PNG" or image.mode not in ("RGB", "RGBA", "L", "LA"):
+            logging.debug("converting image to png as format is %s and mode %s", source_format, image.mode)
+            image = image.convert("RGBA" if "transparency" in image.info or "A" in image.mode else "RGB")
+
+        for target in (size,) + tuple(fallback for fallback in FALLBACK_SIZES if fallback < size):
+            # reducing_gap shrinks by whole factors first, which is much cheaper than resampling every pixel
+            resized = image.resize((target, target), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            png = encode_png(resized, max_png_bytes)
+            if png is not None:
+                logging.debug("prepared %s %sx%s image as a %s byte %sx%s png",
+                              source_format, width, height, len(png), target, target)
+                return png
+
+    raise ImageTooLargeError(f"image doesn't fit in a {max_png_bytes} byte png")
+
+
+class ImagePreprocessor:
+    """
+    Runs prepare_variation_image in a process pool, so decoding a large upload spikes the
+    memory and cpu of a pool process rather than the worker's. Given a path, the pool process
+    reads the file itself, so the upload is never held in the worker at all.
+
+    An image that takes longer than timeout_seconds is given up on. The pool is shut down and
+    its processes killed, so they stop decoding, and a new pool is started on the next call.
+    Other images in that pool at the time fail with BrokenProcessPool.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, size: int = DEFAULT_SIZE,
+                 max_pixels: int = DEFAULT_MAX_PIXELS, max_png_bytes: int = DEFAULT_MAX_PNG_BYTES,
+                 timeout_seconds: int = DEFAULT_TIMEOUT_SECONDS):
+        self.max_workers = max_workers
+        self.size = size
+        self.max_pixels = max_pixels
+        self.max_png_bytes = max_png_bytes
+        self.timeout_seconds = timeout_seconds
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def prepare(self, image) -> bytes:
+        """
+        Returns image, the path to an image file or its bytes, as a png ready for the variation api
+        """
+        executor = self.executor()
+        future = executor.submit(prepare_variation_image, image, size=self.size,
+                                 max_pixels=self.max_pixels, max_png_bytes=self.max_png_bytes)
+        try:
+            return future.result(timeout=self.timeout_seconds)
+        except TimeoutError as e:
+            if not future.cancel():
+                self.terminate(executor)
+            raise ImageTooLargeError(f"image took over {self.timeout_seconds}s to prepare") from e
+
+    def terminate(self, executor: ProcessPoolExecutor):
+        """
+        Kills the processes of executor, which a running future can't be cancelled without
+        """
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        logging.warning("terminating image preprocessing pool")
+        # the executor has no public way to reach its processes
+        processes = list((executor._processes or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
@@ -0,0 +1,174 @@
+"""
+Asyncio ingest of the mastodon user stream into the rq queue
+"""
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import mastodon
+from rq import Queue, Retry
+from mastodon_bot.worker import listener_respond
+from mastodon_bot.lib.clients.client_registry import registry
+from mastodon_bot.lib.listen.listener_config import ListenerConfig
+from mastodon_bot.lib.listen.status_event import parse_event
+from mastodon_bot.lib.listen.status_dedupe import claim_statuses
+
+
+class StreamBridge(mastodon.StreamListener):
+    """
+    Hands raw stream events to the event loop without doing any work on the stream thread,
+    with the time each was received
+    """
+
+    def __init__(self, loop, events: asyncio.Queue):
+        self.loop = loop
+        self.events = events
+
+    def _put(self, event_type, event):
+        self.loop.call_soon_threadsafe(self.events.put_nowait, (event_type, event, time.time()))
+
+    def on_update(self, status):
+        self._put("update", status)
+
+    def on_notification(self, notification):
+        self._put("notification", notification)
+
+    def on_conversation(self, conversation):
+        self._put("conversation", conversation)
+
+
+class AsyncStreamIngest:
+    """
+    Reads the user stream, parses events on an executor and enqueues listener_respond jobs
+    in pipelined batches, reporting how far intake is behind the stream: the time from the
+    stream handing over an event to its job being enqueued.
+    """
+
+    def __init__(self, mastodon_api, config: ListenerConfig, batch_size: int = 25,
+                 flush_interval: float = 0.25, parse_workers: int = 4, report_interval: int = 60):
+        if not config.rq_redis_connection:
+            raise ValueError("rq_redis_connection is required for async ingest")
+
+        self.mastodon_api = mastodon_api
+        self.config = config
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.parse_workers = parse_workers
+        self.report_interval = report_interval
+
+        self.redis_conn = registry.get_redis(config.rq_redis_connection)
+        self.queue = Queue(config.rq_queue_name, connection=self.redis_conn)
+
+        self.enqueued = 0
+        self.lag_samples = 0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+
+    def run(self):
+        """
+        Blocks, ingesting the stream until interrupted
+        """
+        asyncio.run(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        executor = ThreadPoolExecutor(max_workers=self.parse_workers, thread_name_prefix="ingest")
+
+        handle = self.mastodon_api.stream_user(StreamBridge(loop, events), run_async=True, reconnect_async=True)
+        logging.info("%s, Listening (async ingest)...", self.config.response_type)
+
+        reporter = asyncio.create_task(self._report(events))
+        try:
+            while True:
+                batch = await self._next_batch(events)
+                parsed = await asyncio.gather(*[
+                    loop.run_in_executor(executor, parse_event, event_type, event)
+                    for event_type, event, _ in batch
+                ])
+
+                jobs = []
+                for (_, _, received_at), result in zip(batch, parsed):
+                    if result is not None:
+                        jobs.append((received_at, result))
+
+                if jobs:
+                    await loop.run_in_executor(executor, self.enqueue_batch, jobs)
+        finally:
+            reporter.cancel()
+            handle.close()
+            executor.shutdown(wait=False)
+
+    async def _next_batch(self, events: asyncio.Queue) -> list:
+        batch = [await events.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(events.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def enqueue_batch(self, jobs: list):
+        """
+        Enqueues a listener_respond job per (received_at, parsed status), in a single redis round trip
+        """
+        claimed = claim_statuses(self.redis_conn, [result[0] for _, result in jobs],
+                                 ttl_seconds=self.config.rq_dedupe_ttl)
+        jobs = [job for job, is_claimed in zip(jobs, claimed) if is_claimed]
+        if not jobs:
+            return
+
+        job_datas = []
+        for _, (status_id, in_reply_to_id, image_url, inner_content, media_urls) in jobs:
+            logging.info("enqueuing: %s %s", status_id, in_reply_to_id)
+            job_datas.append(Queue.prepare_data(
+                listener_respond,
+                kwargs={
+                    'content': inner_content,
+                    'in_reply_to_id': in_reply_to_id,
+                    'image_url': image_url,
+                    'status_id': status_id,
+                    'config': self.config,
+                    'media_urls': media_urls
+                },
+                retry=Retry(max=self.config.rq_queue_retry_attempts,
+                            interval=self.config.rq_queue_retry_delay),
+                timeout=self.config.rq_queue_task_timeout
+            ))
+
+        # enqueue_many writes every job through one pipeline
+        self.queue.enqueue_many(job_datas)
+        self.enqueued += len(job_datas)
+
+        now = time.time()
+        for received_at, _ in jobs:
+            self.record_lag(received_at, now)
+
+    def record_lag(self, received_at: float, now: float):
+        """
+        Records how long after the stream handed over the event it made it onto the queue.
+        Measured from our own clock, so federation delay and remote clock skew aren't counted.
+        """
+        lag = max(now - received_at, 0.0)
+        self.lag_samples += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+
+    def lag_stats(self) -> dict:
+        """
+        Returns the enqueued count and the average and max ingest lag in seconds
+        """
+        average_lag = self.total_lag / self.lag_samples if self.lag_samples else 0.0
+        return {"enqueued": self.enqueued, "average_lag": average_lag, "max_lag": self.max_lag}
+
+    async def _report(self, events: asyncio.Queue):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            stats = self.lag_stats()
+            logging.info("ingest: %s enqueued, %s waiting, average lag %.3fs, max lag %.3fs",
+                         stats["enqueued"], events.qsize(), stats["average_lag"], stats["max_lag"])
+            self.max_lag = 0.0
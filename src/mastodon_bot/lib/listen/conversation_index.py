@@ -0,0 +1,68 @@
+"""
+Redis backed index of status id to the root status id of its conversation
+"""
+import logging
+from mastodon_bot.util import convo_root
+
+DEFAULT_KEY_PREFIX = "mastodon_bot:convo_root"
+
+
+class ConversationRootIndex:
+    """
+    Maps status ids to the first status of their conversation.
+
+    The index is filled as the bot posts and sees replies, so most lookups are answered
+    from redis.  On a miss the root is resolved with a single status_context call and every
+    ancestor returned is indexed as well, unless the context is missing the root.
+    """
+
+    def __init__(self, redis_client, max_age_hours: int = 24, key_prefix: str = DEFAULT_KEY_PREFIX):
+        if redis_client is None:
+            raise ValueError("redis_client not provided")
+
+        self.redis_client = redis_client
+        self.max_age_hours = max_age_hours
+        self.key_prefix = key_prefix
+
+    def _key(self, status_id) -> str:
+        return f"{self.key_prefix}:{status_id}"
+
+    def get_root(self, status_id) -> str:
+        """
+        Returns the indexed root status id for status_id, or None
+        """
+        value = self.redis_client.get(self._key(status_id))
+        if value is None:
+            return None
+        return value.decode("utf-8")
+
+    def set_root(self, root_id, *status_ids):
+        """
+        Indexes each of status_ids, and root_id itself, as belonging to root_id
+        """
+        expire_seconds = None
+        if self.max_age_hours and self.max_age_hours > 0:
+            expire_seconds = self.max_age_hours * 60 * 60
+
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for status_id in {str(root_id), *[str(s) for s in status_ids if s is not None]}:
+            pipeline.set(self._key(status_id), str(root_id), ex=expire_seconds)
+        pipeline.execute()
+
+    def resolve(self, mastodon_api, in_reply_to_id) -> tuple:
+        """
+        Returns the root status id of the conversation in_reply_to_id belongs to, and whether it
+        was confirmed as the root. Only a confirmed root is indexed.
+        """
+        root_id = self.get_root(in_reply_to_id)
+        if root_id is not None:
+            return root_id, True
+
+        logging.debug("conversation root index miss for %s", in_reply_to_id)
+        root_id, confirmed, ancestors = convo_root(mastodon_api, in_reply_to_id)
+        if confirmed:
+            self.set_root(root_id, in_reply_to_id, *[ancestor["id"] for ancestor in ancestors])
+        else:
+            logging.debug("not indexing conversation of %s as its root wasn't found", in_reply_to_id)
+
+        return str(root_id), confirmed
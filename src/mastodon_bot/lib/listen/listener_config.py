@@ -16,6 +16,8 @@ class ListenerConfig:
         self.chat_max_age_hours_context = kwargs.get(
             "chat_max_age_hours_context", None)
         self.chat_persona = kwargs.get("chat_persona", None)
+        self.chat_context_backend = kwargs.get("chat_context_backend", "hash")
+        self.chat_context_max_messages = kwargs.get("chat_context_max_messages", 50)
         self.mastodon_client_id = kwargs.get("mastodon_client_id", None)
         self.mastodon_client_secret = kwargs.get(
             "mastodon_client_secret", None)
@@ -26,12 +28,30 @@ class ListenerConfig:
         self.rq_queue_retry_attempts = kwargs.get("rq_queue_retry_attempts", 3)
         self.rq_queue_retry_delay = kwargs.get("rq_queue_retry_delay", 60)
         self.rq_queue_task_timeout = kwargs.get("rq_queue_task_timeout", 3600)
+        self.rq_dedupe_ttl = kwargs.get("rq_dedupe_ttl", 300)
         self.mastodon_s3_bucket_name = kwargs.get("mastodon_s3_bucket_name", None)
         self.mastodon_s3_bucket_prefix_path = kwargs.get("mastodon_s3_bucket_prefix_path", "/")
         self.mastodon_s3_access_key_id = kwargs.get("mastodon_s3_access_key_id", None)
         self.mastodon_s3_access_secret_key = kwargs.get("mastodon_s3_access_secret_key", None)
         self.aws_polly_region_name = kwargs.get("aws_polly_region_name", "us-east-1")
         self.aws_polly_voice_id = kwargs.get("aws_polly_voice_id", "Brian")
+        self.transcribe_max_workers = kwargs.get("transcribe_max_workers", 3)
+        self.transcribe_error_policy = kwargs.get("transcribe_error_policy", "inline")
+        self.download_max_bytes = kwargs.get("download_max_bytes", 200 * 1024 * 1024)
+        self.transcribe_segment_seconds = kwargs.get("transcribe_segment_seconds", 600)
+        self.transcribe_segment_workers = kwargs.get("transcribe_segment_workers", 4)
+        self.polly_max_workers = kwargs.get("polly_max_workers", 4)
+        self.speech_upload_workers = kwargs.get("speech_upload_workers", 2)
+        self.chat_response_cache = kwargs.get("chat_response_cache", False)
+        self.chat_response_cache_ttl = kwargs.get("chat_response_cache_ttl", 24 * 60 * 60)
+        self.chat_response_cache_max_entries = kwargs.get("chat_response_cache_max_entries", 10000)
+        self.chat_response_cache_max_temperature = kwargs.get("chat_response_cache_max_temperature", 0.3)
+        self.chat_stream = kwargs.get("chat_stream", False)
+        self.image_preprocess_workers = kwargs.get("image_preprocess_workers", 1)
+        self.image_max_pixels = kwargs.get("image_max_pixels", 40_000_000)
+        self.tts_cache_dir = kwargs.get("tts_cache_dir", None)
+        self.tts_cache_max_bytes = kwargs.get("tts_cache_max_bytes", 500 * 1024 * 1024)
+        self.tts_cache_s3_prefix = kwargs.get("tts_cache_s3_prefix", "tts-cache/")
 
 
     def get_openai_api_key(self):
@@ -94,6 +114,18 @@ class ListenerConfig:
     def set_chat_persona(self, chat_persona):
         self.chat_persona = chat_persona
 
+    def get_chat_context_backend(self):
+        return self.chat_context_backend
+
+    def set_chat_context_backend(self, chat_context_backend):
+        self.chat_context_backend = chat_context_backend
+
+    def get_chat_context_max_messages(self):
+        return self.chat_context_max_messages
+
+    def set_chat_context_max_messages(self, chat_context_max_messages):
+        self.chat_context_max_messages = chat_context_max_messages
+
     def get_mastodon_client_id(self):
         return self.mastodon_client_id
     
@@ -142,6 +174,12 @@ class ListenerConfig:
     def set_rq_queue_retry_delay(self, rq_queue_retry_delay):
         self.rq_queue_retry_delay = rq_queue_retry_delay
 
+    def get_rq_dedupe_ttl(self):
+        return self.rq_dedupe_ttl
+
+    def set_rq_dedupe_ttl(self, rq_dedupe_ttl):
+        self.rq_dedupe_ttl = rq_dedupe_ttl
+
     def get_mastodon_s3_bucket_name(self):
         return self.mastodon_s3_bucket_name
 
@@ -183,4 +221,105 @@ class ListenerConfig:
     
     def set_aws_polly_voice_id(self, aws_polly_voice_id):
         self.aws_polly_voice_id = aws_polly_voice_id
-    
\ No newline at end of file
+
+    def get_transcribe_max_workers(self):
+        return self.transcribe_max_workers
+
+    def set_transcribe_max_workers(self, transcribe_max_workers):
+        self.transcribe_max_workers = transcribe_max_workers
+
+    def get_transcribe_error_policy(self):
+        return self.transcribe_error_policy
+
+    def set_transcribe_error_policy(self, transcribe_error_policy):
+        self.transcribe_error_policy = transcribe_error_policy
+
+    def get_download_max_bytes(self):
+        return self.download_max_bytes
+
+    def set_download_max_bytes(self, download_max_bytes):
+        self.download_max_bytes = download_max_bytes
+
+    def get_transcribe_segment_seconds(self):
+        return self.transcribe_segment_seconds
+
+    def set_transcribe_segment_seconds(self, transcribe_segment_seconds):
+        self.transcribe_segment_seconds = transcribe_segment_seconds
+
+    def get_transcribe_segment_workers(self):
+        return self.transcribe_segment_workers
+
+    def set_transcribe_segment_workers(self, transcribe_segment_workers):
+        self.transcribe_segment_workers = transcribe_segment_workers
+
+    def get_polly_max_workers(self):
+        return self.polly_max_workers
+
+    def set_polly_max_workers(self, polly_max_workers):
+        self.polly_max_workers = polly_max_workers
+
+    def get_tts_cache_dir(self):
+        return self.tts_cache_dir
+
+    def set_tts_cache_dir(self, tts_cache_dir):
+        self.tts_cache_dir = tts_cache_dir
+
+    def get_tts_cache_max_bytes(self):
+        return self.tts_cache_max_bytes
+
+    def set_tts_cache_max_bytes(self, tts_cache_max_bytes):
+        self.tts_cache_max_bytes = tts_cache_max_bytes
+
+    def get_tts_cache_s3_prefix(self):
+        return self.tts_cache_s3_prefix
+
+    def set_tts_cache_s3_prefix(self, tts_cache_s3_prefix):
+        self.tts_cache_s3_prefix = tts_cache_s3_prefix
+
+    def get_speech_upload_workers(self):
+        return self.speech_upload_workers
+
+    def set_speech_upload_workers(self, speech_upload_workers):
+        self.speech_upload_workers = speech_upload_workers
+
+    def get_chat_response_cache(self):
+        return self.chat_response_cache
+
+    def set_chat_response_cache(self, chat_response_cache):
+        self.chat_response_cache = chat_response_cache
+
+    def get_chat_response_cache_ttl(self):
+        return self.chat_response_cache_ttl
+
+    def set_chat_response_cache_ttl(self, chat_response_cache_ttl):
+        self.chat_response_cache_ttl = chat_response_cache_ttl
+
+    def get_chat_response_cache_max_entries(self):
+        return self.chat_response_cache_max_entries
+
+    def set_chat_response_cache_max_entries(self, chat_response_cache_max_entries):
+        self.chat_response_cache_max_entries = chat_response_cache_max_entries
+
+    def get_chat_response_cache_max_temperature(self):
+        return self.chat_response_cache_max_temperature
+
+    def set_chat_response_cache_max_temperature(self, chat_response_cache_max_temperature):
+        self.chat_response_cache_max_temperature = chat_response_cache_max_temperature
+
+    def get_chat_stream(self):
+        return self.chat_stream
+
+    def set_chat_stream(self, chat_stream):
+        self.chat_stream = chat_stream
+
+    def get_image_preprocess_workers(self):
+        return self.image_preprocess_workers
+
+    def set_image_preprocess_workers(self, image_preprocess_workers):
+        self.image_preprocess_workers = image_preprocess_workers
+
+    def get_image_max_pixels(self):
+        return self.image_max_pixels
+
+    def set_image_max_pixels(self, image_max_pixels):
+        self.image_max_pixels = image_max_pixels
@@ -0,0 +1,29 @@
+"""
+Claim statuses in redis so each one is responded to once, however many events it arrives in
+"""
+DEFAULT_KEY_PREFIX = "mastodon_bot:listen:claimed"
+DEFAULT_TTL_SECONDS = 300
+
+
+def claim_statuses(redis_conn, status_ids: list, ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                   key_prefix: str = DEFAULT_KEY_PREFIX) -> list:
+    """
+    Atomically claims each status id with a set-if-absent, in one round trip.
+    Returns a list of booleans, True where this caller won the claim.
+    """
+    pipeline = redis_conn.pipeline(transaction=False)
+    for status_id in status_ids:
+        pipeline.set(f"{key_prefix}:{status_id}", 1, nx=True, ex=ttl_seconds)
+
+    return [bool(claimed) for claimed in pipeline.execute()]
+
+
+def claim_status(redis_conn, status_id, ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 key_prefix: str = DEFAULT_KEY_PREFIX) -> bool:
+    """
+    Returns True if this caller is the first to claim status_id within the ttl
+    """
+    if status_id is None:
+        return True
+
+    return claim_statuses(redis_conn, [status_id], ttl_seconds=ttl_seconds, key_prefix=key_prefix)[0]
@@ -0,0 +1,50 @@
+"""
+Parse mastodon streaming events into the values we enqueue a response for
+"""
+import logging
+from bs4 import BeautifulSoup
+
+
+def parse_status(status, account):
+    """
+    Returns (status_id, in_reply_to_id, image_url, inner_content, media_urls) for a status,
+    or None when there is nothing to respond to, i.e. the status was posted by a bot
+    """
+    if status is None or "content" not in status:
+        return None
+
+    status_id = status.get("id", None)
+    in_reply_to_id = None
+    image_url = None
+    media_urls = []
+
+    if "in_reply_to_id" in status and status["in_reply_to_id"] != "":
+        in_reply_to_id = status["in_reply_to_id"]
+
+    logging.debug("pre BeautifulSoup content: %s", status["content"])
+
+    inner_content = BeautifulSoup(status["content"], "html.parser").text
+
+    if "media_attachments" in status and len(status["media_attachments"]) > 0:
+        media_urls = [attachment.url for attachment in status["media_attachments"]]
+        image_url = media_urls[0]
+        logging.debug("image_url: %s", image_url)
+
+    if account is not None and account["bot"]:
+        logging.debug("i'm a bot, so not responding")
+        return None
+
+    return status_id, in_reply_to_id, image_url, inner_content, media_urls
+
+
+def parse_event(event_type: str, event):
+    """
+    Returns the parsed status for an update, notification or conversation event
+    """
+    if event_type == "update":
+        return parse_status(event, event.get("account", None))
+
+    if "status" in event:
+        return parse_status(event["status"], event.get("account", None))
+
+    return None
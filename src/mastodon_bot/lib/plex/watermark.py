@@ -0,0 +1,96 @@
+"""
+Remembers how far through a plex server's recently added items the post source has got
+"""
+import os
+import json
+import logging
+import tempfile
+
+DEFAULT_KEY_PREFIX = "mastodon_bot:plex:watermark"
+
+
+class PlexWatermark:
+    """
+    The addedAt of the newest item posted, and the keys of the items posted with that addedAt.
+    addedAt is only to the second, so the keys tell apart items added in the same second.
+    """
+
+    def __init__(self, added_at: float = 0.0, keys: list = None):
+        self.added_at = added_at
+        self.keys = set(keys or [])
+
+    def is_new(self, added_at: float, key: str) -> bool:
+        """
+        Returns True for an item that hasn't been posted yet
+        """
+        return added_at > self.added_at or (added_at == self.added_at and key not in self.keys)
+
+    def advance(self, added_at: float, key: str):
+        """
+        Marks an item as posted
+        """
+        if added_at > self.added_at:
+            self.added_at = added_at
+            self.keys = {key}
+        elif added_at == self.added_at:
+            self.keys.add(key)
+
+    def to_dict(self) -> dict:
+        return {"added_at": self.added_at, "keys": sorted(self.keys)}
+
+    @classmethod
+    def from_dict(cls, state: dict):
+        return cls(added_at=float(state.get("added_at", 0.0)), keys=state.get("keys", []))
+
+
+class RedisWatermarkStore:
+    """
+    Keeps the watermark for a server in redis, for cron runs on any host
+    """
+
+    def __init__(self, redis_client, server: str, key_prefix: str = DEFAULT_KEY_PREFIX):
+        self.redis_client = redis_client
+        self.key = f"{key_prefix}:{server}"
+
+    def load(self):
+        """
+        Returns the stored watermark, or None before the first run
+        """
+        state = self.redis_client.get(self.key)
+        if state is None:
+            return None
+        return PlexWatermark.from_dict(json.loads(state))
+
+    def save(self, watermark: PlexWatermark):
+        self.redis_client.set(self.key, json.dumps(watermark.to_dict()))
+
+
+class FileWatermarkStore:
+    """
+    Keeps the watermark for a server in a local json file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self):
+        """
+        Returns the stored watermark, or None before the first run
+        """
+        try:
+            with open(self.path, "r") as file:
+                return PlexWatermark.from_dict(json.load(file))
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logging.error("ignoring unreadable plex watermark %s: %s", self.path, e)
+            return None
+
+    def save(self, watermark: PlexWatermark):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        file_descriptor, temp_path = tempfile.mkstemp(prefix=".", dir=directory)
+        with os.fdopen(file_descriptor, "w") as file:
+            json.dump(watermark.to_dict(), file)
+        # rename so an interrupted run never leaves half a file
+        os.replace(temp_path, self.path)
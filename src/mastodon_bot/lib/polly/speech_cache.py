@@ -0,0 +1,202 @@
+"""
+Content addressed cache of synthesized speech, on local disk and in s3
+"""
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from botocore.exceptions import ClientError
+from redis.exceptions import LockError
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "mastodon_bot_tts")
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+DEFAULT_S3_PREFIX = "tts-cache/"
+DEFAULT_LOCK_KEY_PREFIX = "mastodon_bot:tts:lock"
+DEFAULT_LOCK_TIMEOUT = 120
+
+
+def speech_cache_key(text: str, voice_id: str, engine: str, format_type: str) -> str:
+    """
+    Returns the sha256 of everything that changes the synthesized audio
+    """
+    digest = hashlib.sha256()
+    for part in (text, voice_id, engine, format_type):
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SpeechCache:
+    """
+    Synthesized audio keyed by a hash of text, voice, engine and format.
+
+    Lookups try the local disk tier, then the s3 tier, which fills the disk tier on a hit.
+    The disk tier is evicted least recently used first once it grows past max_bytes; the s3
+    tier is left to a lifecycle rule on its prefix.  With a redis client, concurrent misses
+    for the same key, from any worker, wait on one lock so only one of them calls polly.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 s3_wrapper=None, s3_prefix: str = DEFAULT_S3_PREFIX, redis_client=None,
+                 lock_key_prefix: str = DEFAULT_LOCK_KEY_PREFIX, lock_timeout: int = DEFAULT_LOCK_TIMEOUT):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.s3_wrapper = s3_wrapper
+        self.s3_prefix = s3_prefix
+        self.redis_client = redis_client
+        self.lock_key_prefix = lock_key_prefix
+        self.lock_timeout = lock_timeout
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _s3_key(self, key: str) -> str:
+        return f"{self.s3_prefix}{key}"
+
+    def _entries(self) -> list:
+        entries = []
+        with os.scandir(self.cache_dir) as scan:
+            for entry in scan:
+                if entry.is_file() and not entry.name.startswith("."):
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def get_local(self, key: str):
+        """
+        Returns the audio from the disk tier, marking it recently used, or None
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                audio = file.read()
+            os.utime(path)
+            return audio
+        except FileNotFoundError:
+            return None
+
+    def put_local(self, key: str, audio: bytes):
+        """
+        Writes audio to the disk tier, then evicts the least recently used entries past max_bytes
+        """
+        file_descriptor, temp_path = tempfile.mkstemp(prefix=".", dir=self.cache_dir)
+        with os.fdopen(file_descriptor, "wb") as file:
+            file.write(audio)
+        # rename so other workers never read a partial file
+        os.replace(temp_path, self._path(key))
+
+        with self._lock:
+            self._size += len(audio)
+            if self._size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used disk entries until the tier is back under max_bytes
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for path, entry_size, _ in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                size -= entry_size
+            except FileNotFoundError:
+                pass
+        self._size = size
+
+    def get_s3(self, key: str):
+        """
+        Returns the audio from the s3 tier, or None
+        """
+        if self.s3_wrapper is None:
+            return None
+
+        try:
+            return self.s3_wrapper.get_file(self._s3_key(key))
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise e
+
+    def put_s3(self, key: str, audio: bytes, format_type: str):
+        if self.s3_wrapper is not None:
+            self.s3_wrapper.upload_bytes_to_s3(content=audio, s3_key=self._s3_key(key),
+                                               content_type=f"audio/{format_type}")
+
+    def get(self, key: str):
+        """
+        Returns cached audio for key from the first tier that has it, or None
+        """
+        audio = self.get_local(key)
+        if audio is not None:
+            return audio
+
+        audio = self.get_s3(key)
+        if audio is not None:
+            self.put_local(key, audio)
+        return audio
+
+    def put(self, key: str, audio: bytes, format_type: str = "mp3"):
+        self.put_local(key, audio)
+        try:
+            self.put_s3(key, audio, format_type)
+        except ClientError as e:
+            # the disk tier still has it, so this only costs other workers a synthesis
+            logging.error("could not store speech %s in s3: %s", key, e)
+
+    def get_or_synthesize(self, text: str, voice_id: str, engine: str, format_type: str, synthesize) -> bytes:
+        """
+        Returns cached audio for the request, calling synthesize() at most once across workers on a miss
+        """
+        key = speech_cache_key(text, voice_id, engine, format_type)
+
+        audio = self.get(key)
+        if audio is not None:
+            self.hits += 1
+            logging.debug("speech cache hit %s", key)
+            return audio
+
+        if self.redis_client is None:
+            return self._synthesize(key, format_type, synthesize)
+
+        lock = self.redis_client.lock(f"{self.lock_key_prefix}:{key}", timeout=self.lock_timeout,
+                                      blocking_timeout=self.lock_timeout)
+        acquired = lock.acquire()
+        try:
+            if acquired:
+                # another worker may have finished it while we waited
+                audio = self.get(key)
+                if audio is not None:
+                    self.hits += 1
+                    return audio
+            else:
+                logging.info("timed out waiting on speech %s, synthesizing it here", key)
+
+            return self._synthesize(key, format_type, synthesize)
+        finally:
+            if acquired:
+                try:
+                    lock.release()
+                except LockError:
+                    pass
+
+    def _synthesize(self, key: str, format_type: str, synthesize) -> bytes:
+        self.misses += 1
+        audio = synthesize()
+        self.put(key, audio, format_type)
+        return audio
+
+    def stats(self) -> dict:
+        """
+        Returns the hit/miss counters and the size of the disk tier
+        """
+        return {"hits": self.hits, "misses": self.misses, "local_bytes": self._size}
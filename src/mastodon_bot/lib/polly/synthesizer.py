@@ -0,0 +1,213 @@
+"""
+Synthesize text of any length with AWS Polly, chunked and in parallel
+"""
+import re
+import html
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from mastodon_bot.lib.audio.segments import mp3_frames
+
+# synthesize_speech limits: billed characters exclude ssml tags, total characters include them
+MAX_BILLED_CHARS = 3000
+MAX_TOTAL_CHARS = 6000
+
+DEFAULT_CHUNK_CHARS = 1500
+DEFAULT_MAX_WORKERS = 4
+
+SSML_TAG = re.compile(r"<[^>]+>")
+SSML_TOKEN = re.compile(r"<[^>]+>|[^<]+")
+SSML_SPEAK = re.compile(r"\s*(<speak(?:\s[^>]*)?>)(.*)</speak>\s*", re.S)
+SSML_ELEMENT = re.compile(r"(<([\w:-]+)[^>]*>)(.*)(</\2>)", re.S)
+SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+|\n+")
+
+
+def billed_characters(text: str, is_ssml: bool = False) -> int:
+    """
+    Returns the number of characters polly bills for text, which for ssml leaves out the tags
+    """
+    if is_ssml:
+        return len(html.unescape(SSML_TAG.sub("", text)))
+    return len(text)
+
+
+def pack(pieces: list, max_chars: int, is_ssml: bool = False) -> list:
+    """
+    Greedily joins consecutive pieces into chunks of at most max_chars billed characters
+    """
+    chunks = []
+    current = ""
+    for piece in pieces:
+        candidate = f"{current} {piece}" if current else piece
+        if current and (billed_characters(candidate, is_ssml) > max_chars or len(candidate) > MAX_TOTAL_CHARS):
+            chunks.append(current)
+            candidate = piece
+        current = candidate
+
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_words(text: str, max_chars: int) -> list:
+    """
+    Splits a single run of text longer than max_chars on whitespace, and words longer than max_chars anywhere
+    """
+    words = []
+    for word in text.split():
+        words.extend(word[index:index + max_chars] for index in range(0, len(word), max_chars))
+    return words
+
+
+def split_text(text: str, max_chars: int = DEFAULT_CHUNK_CHARS) -> list:
+    """
+    Splits plain text into chunks of at most max_chars, on sentence boundaries wherever possible
+    """
+    pieces = []
+    for sentence in SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) > max_chars:
+            pieces.extend(split_words(sentence, max_chars))
+        else:
+            pieces.append(sentence)
+    return pack(pieces, max_chars)
+
+
+def ssml_units(fragment: str) -> list:
+    """
+    Splits an ssml fragment into its top level elements, and the sentences of the text between them
+    """
+    units = []
+    current = ""
+    depth = 0
+    for token in SSML_TOKEN.finditer(fragment):
+        value = token.group(0)
+        if value.startswith("<"):
+            if value.startswith("</"):
+                depth -= 1
+            elif not value.endswith("/>") and not value.startswith(("<?", "<!")):
+                depth += 1
+            current += value
+            if depth <= 0:
+                units.append(current)
+                current = ""
+                depth = 0
+        elif depth == 0:
+            units.extend(sentence for sentence in SENTENCE_END.split(value) if sentence.strip())
+        else:
+            current += value
+
+    if current:
+        units.append(current)
+    return units
+
+
+def split_ssml_fragment(fragment: str, max_chars: int) -> list:
+    """
+    Splits an ssml fragment into chunks of at most max_chars billed characters, on element and sentence
+    boundaries. An element too long to fit is split inside, with its tag repeated around each part.
+    """
+    pieces = []
+    for unit in ssml_units(fragment):
+        if billed_characters(unit, True) <= max_chars:
+            pieces.append(unit.strip())
+            continue
+
+        element = SSML_ELEMENT.fullmatch(unit.strip())
+        if element:
+            open_tag, _, inner, close_tag = element.groups()
+            pieces.extend(f"{open_tag}{part}{close_tag}" for part in split_ssml_fragment(inner, max_chars))
+        else:
+            pieces.extend(split_text(SSML_TAG.sub("", unit), max_chars))
+
+    return pack(pieces, max_chars, is_ssml=True)
+
+
+def split_ssml(ssml: str, max_chars: int = DEFAULT_CHUNK_CHARS) -> list:
+    """
+    Splits an ssml document into chunks of at most max_chars billed characters, each its own <speak> document
+    with the attributes of the original, i.e. xml:lang
+    """
+    speak = SSML_SPEAK.fullmatch(ssml)
+    open_tag, inner = speak.groups() if speak else ("<speak>", ssml)
+    return [f"{open_tag}{chunk}</speak>" for chunk in split_ssml_fragment(inner, max_chars)]
+
+
+def concat_audio(parts: list, format_type: str = "mp3") -> bytes:
+    """
+    Joins synthesized audio in order. mp3 is joined frame by frame, leaving out anything between frames.
+    """
+    if format_type == "mp3":
+        return b"".join(
+            part[offset:offset + length] for part in parts for offset, length, _ in mp3_frames(part))
+
+    if format_type == "pcm":
+        return b"".join(parts)
+
+    raise ValueError(f"{format_type} audio cannot be concatenated")
+
+
+class PollySynthesizer:
+    """
+    Synthesizes text with a single synthesize_speech call when it is within the limit,
+    otherwise splits it on sentence and ssml boundaries, synthesizes the chunks concurrently
+    and joins the audio back together in order.
+    """
+
+    def __init__(self, polly_wrapper, max_workers: int = DEFAULT_MAX_WORKERS, chunk_chars: int = DEFAULT_CHUNK_CHARS,
+                 speech_cache=None):
+        self.polly_wrapper = polly_wrapper
+        self.max_workers = max_workers
+        self.chunk_chars = min(chunk_chars, MAX_BILLED_CHARS)
+        self.speech_cache = speech_cache
+
+    def chunk(self, text: str) -> list:
+        """
+        Returns text as it will be sent to polly: whole when within the limit, otherwise in chunks
+        """
+        is_ssml = self.polly_wrapper.is_valid_sml(text)
+        if billed_characters(text, is_ssml) <= MAX_BILLED_CHARS and len(text) <= MAX_TOTAL_CHARS:
+            return [text]
+
+        if is_ssml:
+            return split_ssml(text, self.chunk_chars)
+        return split_text(text, self.chunk_chars)
+
+    def synthesize(self, text: str, voice_id: str, format_type: str = "mp3") -> bytes:
+        """
+        Returns the synthesized audio for text, from the speech cache when it has it
+        """
+        engine = self.polly_wrapper.decide_engine(voice_id)
+
+        if self.speech_cache is None:
+            return self._synthesize(text, voice_id, engine, format_type)
+
+        return self.speech_cache.get_or_synthesize(
+            text, voice_id, engine, format_type,
+            lambda: self._synthesize(text, voice_id, engine, format_type))
+
+    def _synthesize(self, text: str, voice_id: str, engine: str, format_type: str) -> bytes:
+        chunks = self.chunk(text)
+
+        if len(chunks) == 1:
+            return self.polly_wrapper.synthesize(chunks[0], format_type=format_type, voice_id=voice_id,
+                                                 engine=engine)
+
+        logging.debug("synthesizing %s billed characters in %s chunks", billed_characters(text), len(chunks))
+        max_workers = max(1, min(self.max_workers, len(chunks)))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="polly") as executor:
+            parts = list(executor.map(
+                lambda chunk: self.polly_wrapper.synthesize(chunk, format_type=format_type, voice_id=voice_id,
+                                                            engine=engine),
+                chunks))
+
+        return concat_audio(parts, format_type)
+
+    def synthesize_to_file(self, text: str, out_file: str, voice_id: str, format_type: str = "mp3"):
+        """
+        Synthesizes text and writes the audio to out_file
+        """
+        audio = self.synthesize(text, voice_id=voice_id, format_type=format_type)
+        with open(out_file, "wb") as file:
+            file.write(audio)
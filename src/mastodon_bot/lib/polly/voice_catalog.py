@@ -0,0 +1,125 @@
+"""
+In memory index of the aws polly voices, seeded from the bundled voices.json
+"""
+import os
+import json
+import time
+import logging
+import threading
+
+BUNDLED_VOICES_PATH = os.path.join(os.path.dirname(__file__), "voices.json")
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_REDIS_KEY = "mastodon_bot:polly:voices"
+
+
+class VoiceCatalog:
+    """
+    Index of polly voices keyed by voice id, with language and engine lookups.
+
+    The index starts from the bundled voices.json and is refreshed from fetch_voices
+    (i.e. DescribeVoices) once the ttl has passed.  When a redis client is given the
+    fetched list is shared between workers so only one of them has to call aws per ttl.
+    """
+
+    def __init__(self, fetch_voices=None, ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 redis_client=None, redis_key: str = DEFAULT_REDIS_KEY,
+                 seed_path: str = BUNDLED_VOICES_PATH):
+        self.fetch_voices = fetch_voices
+        self.ttl_seconds = ttl_seconds
+        self.redis_key = redis_key
+        self.redis_client = redis_client
+        self.refreshed_at = 0
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._by_language = {}
+        self._by_engine = {}
+
+        with open(seed_path, "r") as seed_file:
+            self._index(json.load(seed_file))
+
+    def _index(self, voices: list):
+        by_id = {}
+        by_language = {}
+        by_engine = {}
+        for voice in voices:
+            by_id[voice["Id"]] = voice
+            by_language.setdefault(voice["LanguageCode"], []).append(voice)
+            for engine in voice.get("SupportedEngines", []):
+                by_engine.setdefault(engine, []).append(voice)
+
+        # swap the whole index at once so readers never see a partial refresh
+        self._by_id, self._by_language, self._by_engine = by_id, by_language, by_engine
+
+    def is_stale(self) -> bool:
+        """
+        Returns True once the ttl has passed since the last refresh
+        """
+        return self.fetch_voices is not None and time.time() - self.refreshed_at >= self.ttl_seconds
+
+    def refresh(self, force: bool = False):
+        """
+        Refreshes the index from redis or aws if it is stale
+        """
+        with self._lock:
+            if not force and not self.is_stale():
+                return
+
+            try:
+                voices = None
+                if self.redis_client is not None and not force:
+                    cached = self.redis_client.get(self.redis_key)
+                    if cached is not None:
+                        voices = json.loads(cached)
+
+                if voices is None:
+                    logging.debug("refreshing polly voice catalog from aws")
+                    voices = self.fetch_voices()
+                    if self.redis_client is not None:
+                        self.redis_client.set(self.redis_key, json.dumps(voices), ex=self.ttl_seconds)
+
+                self._index(voices)
+            except Exception as e:
+                # keep serving the current index, we will try again after the next ttl
+                logging.error("Error refreshing polly voice catalog: %s", e)
+
+            self.refreshed_at = time.time()
+
+    def _current(self):
+        if self.is_stale():
+            self.refresh()
+        return self._by_id, self._by_language, self._by_engine
+
+    def get(self, voice_id: str) -> dict:
+        """
+        Returns the voice for voice_id, or None if it is unknown
+        """
+        by_id, _, _ = self._current()
+        return by_id.get(voice_id)
+
+    def voices(self) -> list:
+        """
+        Returns every voice in the catalog
+        """
+        by_id, _, _ = self._current()
+        return list(by_id.values())
+
+    def by_language(self, language_code: str) -> list:
+        """
+        Returns the voices for a language code, i.e. en-US
+        """
+        _, by_language, _ = self._current()
+        return list(by_language.get(language_code, []))
+
+    def by_engine(self, engine: str) -> list:
+        """
+        Returns the voices supporting an engine, i.e. neural
+        """
+        _, _, by_engine = self._current()
+        return list(by_engine.get(engine, []))
+
+    def supports_engine(self, voice_id: str, engine: str) -> bool:
+        """
+        Returns True if voice_id supports engine
+        """
+        voice = self.get(voice_id)
+        return voice is not None and engine in voice.get("SupportedEngines", [])
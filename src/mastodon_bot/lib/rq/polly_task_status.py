@@ -1,47 +1,126 @@
+import time
 import logging
-from mastodon import Mastodon
+from datetime import timedelta
+from rq import Queue, Retry, get_current_job
 from mastodon.errors import MastodonAPIError
 from mastodon_bot.lib.listen.listener_config import ListenerConfig
-from mastodon_bot.external.s3 import s3Wrapper
+from mastodon_bot.lib.clients.client_registry import registry
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
+# seconds before each status check: doubling from the first delay up to the max, then every max delay
+DEFAULT_FIRST_DELAY = 2
+DEFAULT_MAX_DELAY = 30
+# give up on a task after an hour, as the old blind retries did
+DEFAULT_MAX_WAIT = 60 * 60
+
+
+def next_delay(attempt: int, first_delay: int = DEFAULT_FIRST_DELAY, max_delay: int = DEFAULT_MAX_DELAY) -> int:
+    """
+    Returns the seconds to wait before status check number attempt, counting from 0
+    """
+    return min(first_delay * 2 ** attempt, max_delay)
+
+
+def schedule_polly_status_job(config: ListenerConfig, in_reply_to_id: str, polly_task_id: str,
+                              attempt: int = 0, started_at: float = None):
+    """
+    Schedules the next status check for a polly task on the rq queue.
+    Needs a worker running with the scheduler, i.e. rq worker --with-scheduler
+    """
+    if started_at is None:
+        started_at = time.time()
+
+    delay = next_delay(attempt)
+    logging.info("checking polly task %s in %ss", polly_task_id, delay)
+
+    queue = Queue(config.rq_queue_name, connection=registry.get_redis(config.rq_redis_connection))
+    return queue.enqueue_in(
+        timedelta(seconds=delay),
+        polly_status_job,
+        kwargs={
+            'in_reply_to_id': in_reply_to_id,
+            'polly_task_id': polly_task_id,
+            'config': config,
+            'attempt': attempt,
+            'started_at': started_at
+        },
+        # retries only cover errors talking to aws or mastodon, not waiting on the task
+        retry=Retry(max=config.rq_queue_retry_attempts,
+                    interval=config.rq_queue_retry_delay),
+        job_timeout=config.rq_queue_task_timeout
+    )
+
+
+def record_completion(polly_task_id: str, status: str, attempt: int, started_at: float) -> float:
+    """
+    Records on the current job how long the task took to be seen finished, and returns it in seconds
+    """
+    latency = time.time() - started_at
+    logging.info("polly task %s %s after %.1fs and %s checks", polly_task_id, status, latency, attempt + 1)
+
+    job = get_current_job()
+    if job is not None:
+        job.meta["polly_task_id"] = polly_task_id
+        job.meta["polly_task_status"] = status
+        job.meta["polly_completion_latency"] = latency
+        job.meta["polly_status_checks"] = attempt + 1
+        job.save_meta()
 
-def polly_status_job(in_reply_to_id: str, polly_task_id: str, config: ListenerConfig):
+    return latency
+
+
+def polly_status_job(in_reply_to_id: str, polly_task_id: str, config: ListenerConfig,
+                     attempt: int = 0, started_at: float = None):
     if config == None:
         raise ValueError("ListenerConfig cannot be None")
 
-    logging.getLogger().setLevel(logging.DEBUG)
+    if started_at is None:
+        started_at = time.time()
+
+    task = registry.get_polly(config).get_task(polly_task_id)
+    status = task['TaskStatus']
+    logging.debug("polly task %s is %s", polly_task_id, status)
 
-    # we do not want to catch exceptions here, as the rq job retry will retry if we let exceptions bubble up
-    # in this case, if the s3 file does not exist when we ask for it, we want to let the 404 exception bubble up
-    # so rq can retry
+    mastodon_api = registry.get_mastodon(config)
 
-    wrapper = s3Wrapper(access_key_id=config.mastodon_s3_access_key_id,
-                        access_secret_key=config.mastodon_s3_access_secret_key, bucket_name=config.mastodon_s3_bucket_name,
-                        prefix_path=config.mastodon_s3_bucket_prefix_path)
+    if status == 'failed':
+        record_completion(polly_task_id, status, attempt, started_at)
+        post_polly_response(mastodon_api, in_reply_to_id,
+                            f"AWS Polly task failed: {task.get('TaskStatusReason', 'unknown reason')}")
+        return None
 
-    task_s3_key = f".{polly_task_id}.mp3"
-    try_file = wrapper.get_file(task_s3_key)
+    if status == 'completed':
+        wrapper = registry.get_s3(config)
+        task_s3_key = wrapper.key_from_uri(task['OutputUri'])
 
-    if try_file == None:
-        raise Exception(f"S3 file {task_s3_key} not found yet")
+        # the task can report completed a moment before the object is visible
+        if wrapper.file_exists(task_s3_key, apply_prefix=False):
+            latency = record_completion(polly_task_id, status, attempt, started_at)
+            post_polly_audio(mastodon_api, wrapper, in_reply_to_id, task_s3_key)
+            return latency
 
+    if time.time() - started_at > DEFAULT_MAX_WAIT:
+        record_completion(polly_task_id, "timed out", attempt, started_at)
+        post_polly_response(mastodon_api, in_reply_to_id, "AWS Polly task did not finish in time")
+        return None
+
+    schedule_polly_status_job(config, in_reply_to_id, polly_task_id, attempt=attempt + 1, started_at=started_at)
+    return None
+
+
+def post_polly_audio(mastodon_api, wrapper, in_reply_to_id: str, task_s3_key: str):
+    """
+    Downloads the finished audio once and posts it, or a link to it in S3 when mastodon won't take it
+    """
     s3_url = None
     media_post_ids = []
 
     try:
-        mastodon_api = Mastodon(
-            client_id=config.mastodon_client_id,
-            client_secret=config.mastodon_client_secret,
-            access_token=config.mastodon_access_token,
-            api_base_url=config.mastodon_host,
-        )
-
         ai_media_post = mastodon_api.media_post(
-            media_file=try_file,
-            file_name=task_s3_key,
+            media_file=wrapper.get_file(task_s3_key, apply_prefix=False),
+            file_name=task_s3_key.rsplit("/", 1)[-1],
             mime_type="mime_type='audio/mp3'",
             synchronous=True
         )
@@ -52,18 +131,22 @@ def polly_status_job(in_reply_to_id: str, polly_task_id: str, config: ListenerCo
         logging.error(f"Exception: {e}")
         logging.info(f"Returning existing link to S3 instead")
 
-        s3_url = s3Wrapper.get_public_url(task_s3_key)
+        s3_url = wrapper.get_public_url(task_s3_key, apply_prefix=False)
 
     if s3_url is not None:
         response_content = f"Audio Stored in S3: {s3_url}"
     else:
         response_content = f"Audio attached"
 
+    post_polly_response(mastodon_api, in_reply_to_id, response_content, media_post_ids)
+
+
+def post_polly_response(mastodon_api, in_reply_to_id: str, response_content: str, media_post_ids: list = None):
     mastodon_api.status_post(
         response_content,
         sensitive=False,
         visibility="private",
         spoiler_text=None,
         in_reply_to_id=in_reply_to_id,
-        media_ids=media_post_ids,
+        media_ids=media_post_ids or [],
     )
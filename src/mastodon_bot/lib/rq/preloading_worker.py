@@ -0,0 +1,84 @@
+"""
+rq worker that imports the job code and its heavy dependencies before it forks a work horse per job
+"""
+import time
+import logging
+import importlib
+from rq import Worker
+from mastodon_bot.lib.chat.encodings import encodings
+
+# everything a job imports on its first call that is slow to import or initialize
+PRELOAD_MODULES = (
+    "openai",
+    "boto3",
+    "botocore.session",
+    "tiktoken",
+    "PIL.Image",
+    "bs4",
+    "mistune",
+    "pygments",
+    "pygments.lexers",
+    "pygments.formatters",
+    "mastodon",
+    "mastodon_bot.worker",
+    "mastodon_bot.lib.rq.polly_task_status",
+)
+
+
+def preload(modules: tuple = PRELOAD_MODULES) -> dict:
+    """
+    Imports modules and loads the tiktoken encodings and pygments lexers that jobs use,
+    returning the seconds each took. Failing to warm is logged and left for the job to retry.
+    """
+    timings = {}
+    for module in modules:
+        started_at = time.monotonic()
+        importlib.import_module(module)
+        timings[module] = time.monotonic() - started_at
+
+    started_at = time.monotonic()
+    try:
+        encodings.warm()
+    except Exception as e:
+        logging.warning("could not load tiktoken encodings, jobs will load them: %s", e)
+    timings["tiktoken encodings"] = time.monotonic() - started_at
+
+    started_at = time.monotonic()
+    # pygments finds lexers by name through a lookup that imports every lexer module
+    from pygments.lexers import get_lexer_by_name
+    get_lexer_by_name("python")
+    timings["pygments lexers"] = time.monotonic() - started_at
+
+    logging.info("preloaded in %.0fms", sum(timings.values()) * 1000)
+    for name, seconds in timings.items():
+        logging.debug("preloaded %s in %.0fms", name, seconds * 1000)
+    return timings
+
+
+class PreloadingWorker(Worker):
+    """
+    Worker that logs, per job, the time from forking the work horse to the job starting.
+
+    Run after preload(), the work horse inherits the imported modules copy on write from
+    this process, so that time is only the fork itself.
+    """
+
+    fork_started_at = None
+
+    def fork_work_horse(self, job, queue):
+        # monotonic is the same clock on both sides of the fork
+        self.fork_started_at = time.monotonic()
+        return super().fork_work_horse(job, queue)
+
+    def perform_job(self, job, queue):
+        if self.fork_started_at is not None:
+            try:
+                # resolving the job function imports its module, when it isn't loaded already
+                job.func
+            except Exception:
+                # left for perform_job to fail the job with
+                pass
+            overhead = time.monotonic() - self.fork_started_at
+            logging.info("job %s started %.1fms after fork", job.id, overhead * 1000)
+
+        return super().perform_job(job, queue)
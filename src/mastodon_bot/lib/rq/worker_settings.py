@@ -0,0 +1,12 @@
+"""
+rq worker settings, imported once by the worker process before its first job,
+so whatever is loaded here is shared by every job instead of loaded by each one:
+
+    rq worker -w rq.worker.SimpleWorker -c mastodon_bot.lib.rq.worker_settings --with-scheduler
+
+SimpleWorker runs the jobs in the worker process, so they also share the clients in the client registry.
+mastodonbotcli work does the same.
+"""
+from mastodon_bot.lib.rq.preloading_worker import preload
+
+preload()
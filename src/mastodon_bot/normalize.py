@@ -0,0 +1,35 @@
+"""
+Normalizes the text of an incoming status once, for every response type to reuse
+"""
+from dataclasses import dataclass, field
+from mastodon_bot.util import URI_PATTERN
+
+
+@dataclass
+class NormalizedStatus:
+    """
+    A status split into what the bot responds to and what it refers to.
+
+    text is the content with mentions removed, whitespace collapsed when there were any,
+    as filter_words/remove_word produced it. uris are found in text, in order.
+    """
+    content: str
+    text: str
+    uris: list = field(default_factory=list)
+
+
+def normalize_status(content: str) -> NormalizedStatus:
+    """
+    Strips mentions and collects uris from content.
+    The words are only split out when there is a mention to remove, and the uri pattern
+    only runs when the text has a scheme in it.
+    """
+    text = content
+    if "@" in content:
+        words = content.split()
+        if any(word[0] == "@" for word in words):
+            text = " ".join([word for word in words if word[0] != "@"])
+
+    uris = URI_PATTERN.findall(text) if "://" in text else []
+
+    return NormalizedStatus(content=content, text=text, uris=uris)
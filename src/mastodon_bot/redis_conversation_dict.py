@@ -0,0 +1,113 @@
+import pickle
+import json
+from collections import UserDict
+
+
+class redis_conversation_dict(UserDict):
+    """
+    Conversation context stored as one redis list per conversation.
+
+    Leading system messages (the persona) are kept under their own key, the remaining turns
+    are appended one entry per message and trimmed to a bounded window.  Each conversation
+    has its own expiry, refreshed whenever it is written to.  redis_client is shared, i.e. from the client registry.
+    """
+
+    def __init__(self, redis_client, key, max_age_hours=24, max_messages=50):
+        super().__init__()
+
+        if redis_client is None:
+            raise Exception("redis_client not provided")
+
+        self.redis_client = redis_client
+
+        self.key = key
+        self.max_age_hours = max_age_hours
+        self.max_messages = max_messages
+
+    def _head_key(self, key):
+        return f"{self.key}:{key}:head"
+
+    def _turns_key(self, key):
+        return f"{self.key}:{key}:turns"
+
+    def _expire(self, pipeline, key):
+        if self.max_age_hours > 0:
+            expire_seconds = self.max_age_hours * 60 * 60
+            pipeline.expire(self._head_key(key), expire_seconds)
+            pipeline.expire(self._turns_key(key), expire_seconds)
+
+    def _push_turns(self, pipeline, key, messages):
+        if messages:
+            pipeline.rpush(self._turns_key(key), *[json.dumps(message) for message in messages])
+            if self.max_messages > 0:
+                pipeline.ltrim(self._turns_key(key), -self.max_messages, -1)
+
+    def __getitem__(self, key):
+        pipeline = self.redis_client.pipeline(transaction=False)
+        pipeline.get(self._head_key(key))
+        pipeline.lrange(self._turns_key(key), 0, -1)
+        head, turns = pipeline.execute()
+        if head is None and not turns:
+            raise KeyError(key)
+
+        messages = json.loads(head) if head is not None else []
+        messages.extend(json.loads(turn) for turn in turns)
+        return messages
+
+    def __setitem__(self, key, value):
+        head = []
+        for message in value:
+            if message["role"] != "system":
+                break
+            head.append(message)
+
+        pipeline = self.redis_client.pipeline()
+        pipeline.delete(self._head_key(key), self._turns_key(key))
+        if head:
+            pipeline.set(self._head_key(key), json.dumps(head))
+        self._push_turns(pipeline, key, value[len(head):])
+        self._expire(pipeline, key)
+        pipeline.execute()
+
+    def append(self, key, *messages):
+        """
+        Appends messages to the end of a conversation without rewriting it
+        """
+        pipeline = self.redis_client.pipeline()
+        self._push_turns(pipeline, key, messages)
+        self._expire(pipeline, key)
+        pipeline.execute()
+
+    def __delitem__(self, key):
+        result = self.redis_client.delete(self._head_key(key), self._turns_key(key))
+        if result == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self.redis_client.exists(self._head_key(key), self._turns_key(key)) > 0
+
+    def keys(self):
+        prefix = f"{self.key}:"
+        keys = set()
+        for redis_key in self.redis_client.scan_iter(match=f"{prefix}*"):
+            keys.add(redis_key.decode('utf-8')[len(prefix):].rsplit(":", 1)[0])
+        return list(keys)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def serialize(self):
+        return pickle.dumps(self)
+
+    @staticmethod
+    def deserialize(data):
+        return pickle.loads(data)
@@ -9,8 +9,27 @@ import re
 import csv
 import html
 import mimetypes
+import tempfile
+from collections import deque
 from urllib.parse import urlparse
 
+DEFAULT_DOWNLOAD_MAX_BYTES = 200 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_TIMEOUT_SECONDS = 30
+
+# full URIs
+URI_PATTERN = re.compile(r"https?://[\w\-\.]+\.\w{2,}(?:/[\w\.?=%&=\-+]*)*|ftp://[\w\-\.]+\.\w{2,}(?:/[\w\.?=%&=\-+]*)*")
+VALID_URI_PATTERN = re.compile(
+    r'^(?:http|ftp)s?://'  # scheme
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'  # domain...
+    r'localhost|'  # localhost...
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # ...or IP
+    r'(?::\d+)?'  # optional port
+    r'(?:/?|[/?]\S+)$', re.IGNORECASE)
+# code blocks and inline code in Markdown
+CODE_BLOCK_PATTERN = re.compile(r"```[\w+\s]*\n([\s\S]*?)\n```", re.MULTILINE | re.DOTALL)
+INLINE_CODE_PATTERN = re.compile(r"`([^`]+)`")
+
 def stopwatch(message: str):
     """Context manager to print how long a block of code took."""
     t0 = time.time()
@@ -81,18 +100,42 @@ def split_string_by_words(text: str, max_length: int = 0):
 
     # Join the wrapped text into groups of 'width' characters
     groups = []
-    current_group = ''
+    current_group = []
+    current_length = 0
     for word in wrapped_text:
-        if len(current_group) + len(word) <= max_length:
-            current_group += word
+        if current_length + len(word) <= max_length:
+            current_group.append(word)
+            current_length += len(word)
         else:
-            groups.append(current_group)
-            current_group = word
+            groups.append(''.join(current_group))
+            current_group = [word]
+            current_length = len(word)
     if current_group:
-        groups.append(current_group)
+        groups.append(''.join(current_group))
 
     return groups
 
+def split_stream_by_words(chunks, max_length: int):
+    """
+    Splits text arriving in chunks into segments of at most max_length, breaking on whitespace.
+    Yields (segment, is_last): a segment is yielded as soon as more text is known to follow it,
+    and the rest, possibly empty, is yielded with is_last True once chunks is exhausted.
+    """
+    buffer = ""
+    for chunk in chunks:
+        buffer = (buffer + chunk).lstrip()
+        while len(buffer) > max_length:
+            cut = max(buffer.rfind(" ", 0, max_length + 1), buffer.rfind("\n", 0, max_length + 1))
+            if cut <= 0:
+                cut = max_length
+            # only whitespace after the cut so far, so this may yet be the last segment
+            if not buffer[cut:].strip():
+                break
+            yield buffer[:cut].rstrip(), False
+            buffer = buffer[cut:].lstrip()
+
+    yield buffer.strip(), True
+
 # example usage
 # my_string = "This is a string with a word that needs to be removed."
 # filtered_string = remove_word(my_string, "a")
@@ -157,6 +200,65 @@ def download_remote_file(url: str, allow_mime_types: list = None) -> str:
 
     return response.content, file_extension
 
+def open_remote_file_stream(url: str, allow_mime_types: list = None, max_bytes: int = DEFAULT_DOWNLOAD_MAX_BYTES):
+    """
+    Starts a streamed download, checking the content type and length from the headers before any of the body is read.
+    Returns the open response and the file extension.
+    """
+    logging.debug(f"streaming file: {url}")
+    response = requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT_SECONDS)
+    try:
+        response.raise_for_status()
+
+        if allow_mime_types and len(allow_mime_types) > 0:
+            content_type = response.headers.get('content-type', '')
+            mime_type = content_type.split(';')[0].strip()
+            if mime_type not in allow_mime_types:
+                raise Exception(f"Content type {content_type} not allowed")
+
+        content_length = response.headers.get('content-length')
+        if max_bytes and content_length and int(content_length) > max_bytes:
+            raise Exception(f"File size {content_length} exceeds the {max_bytes} byte limit")
+
+        file_extension = get_file_extension(url, response)
+    except Exception:
+        response.close()
+        raise
+
+    return response, file_extension
+
+def copy_remote_file_stream(response, out_file, max_bytes: int = DEFAULT_DOWNLOAD_MAX_BYTES) -> int:
+    """
+    Copies a streamed download into out_file chunk by chunk, enforcing max_bytes as it goes.
+    Returns the number of bytes written.
+    """
+    total_bytes = 0
+    with response:
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            total_bytes += len(chunk)
+            if max_bytes and total_bytes > max_bytes:
+                raise Exception(f"File size exceeds the {max_bytes} byte limit")
+            out_file.write(chunk)
+    return total_bytes
+
+def download_remote_file_to_path(url: str, allow_mime_types: list = None, max_bytes: int = DEFAULT_DOWNLOAD_MAX_BYTES,
+                                 prefix: str = "download_") -> tuple:
+    """
+    Streams a remote file straight to a temp file, without holding it in memory.
+    Returns the temp file path, which the caller is responsible for removing, and the file extension.
+    """
+    response, file_extension = open_remote_file_stream(url, allow_mime_types=allow_mime_types, max_bytes=max_bytes)
+
+    file_descriptor, file_path = tempfile.mkstemp(prefix=prefix, suffix=file_extension)
+    try:
+        with os.fdopen(file_descriptor, 'wb') as out_file:
+            copy_remote_file_stream(response, out_file, max_bytes=max_bytes)
+    except Exception:
+        os.remove(file_path)
+        raise
+
+    return file_path, file_extension
+
 def save_local_file(content, filename):
     logging.debug(f"saving file: {filename}")
     with open(filename, 'wb') as f:
@@ -173,11 +275,9 @@ def open_local_file_as_string(file_path):
     return file_string
 
 def extract_uris(content: str) -> list[any]:
-    logging.debug(f"extracting URIs: {content}")
-    # regular expression pattern for full URIs
-    pattern = re.compile(r"https?://[\w\-\.]+\.\w{2,}(?:/[\w\.?=%&=\-+]*)*|ftp://[\w\-\.]+\.\w{2,}(?:/[\w\.?=%&=\-+]*)*")
+    logging.debug("extracting URIs: %s", content)
     # search for URIs in the text
-    uris = pattern.findall(content)
+    uris = URI_PATTERN.findall(content)
     return uris
 
 
@@ -188,32 +288,48 @@ def base64_encode_long_string(long_string) -> str:
     return encoded_string
 
 
-def convo_first_status_id(mastodon_api, in_reply_to_id) -> str:
-    first_status = False
-    last_status_id = in_reply_to_id
-    while not first_status:
-        last_status = mastodon_api.status(last_status_id)
-        last_status_in_reply_to_id = last_status["in_reply_to_id"]
-        if last_status_in_reply_to_id == None:
-            first_status = True
-        else:
-            last_status_id = last_status_in_reply_to_id
+def walk_to_first_status_id(mastodon_api, status) -> tuple:
+    """
+    Follows in_reply_to_id up from status one status at a time. Returns the first status id of the
+    conversation and True, or when a status on the way can't be fetched, i.e. it was deleted, is private
+    or from a blocked account, the oldest status id reached and False
+    """
+    while status["in_reply_to_id"] is not None:
+        try:
+            status = mastodon_api.status(status["in_reply_to_id"])
+        except Exception as e:
+            logging.warning("conversation of %s is broken at %s: %s", status["id"], status["in_reply_to_id"], e)
+            return status["id"], False
 
-    status_id = last_status_id
-    return status_id
+    return status["id"], True
+
+
+def convo_root(mastodon_api, in_reply_to_id) -> tuple:
+    """
+    Returns the first status id of the conversation in_reply_to_id is part of, whether that was
+    confirmed as the first, and the ancestors of in_reply_to_id
+    """
+    ancestors = mastodon_api.status_context(in_reply_to_id)["ancestors"]
+    # ancestors are returned oldest first, but leave out the statuses we can't see,
+    # so the first one only starts the conversation when it isn't a reply itself
+    oldest = ancestors[0] if ancestors else mastodon_api.status(in_reply_to_id)
+    if oldest["in_reply_to_id"] is None:
+        return oldest["id"], True, ancestors
+
+    root_id, confirmed = walk_to_first_status_id(mastodon_api, oldest)
+    return root_id, confirmed, ancestors
 
-def detect_code_in_markdown(markdown_text):
-    # Regular expression pattern to match code blocks in Markdown
-    code_block_pattern = r"```[\w+\s]*\n([\s\S]*?)\n```"
 
-    # Regular expression pattern to match inline code in Markdown
-    inline_code_pattern = r"`([^`]+)`"
+def convo_first_status_id(mastodon_api, in_reply_to_id) -> str:
+    root_id, _, _ = convo_root(mastodon_api, in_reply_to_id)
+    return root_id
 
+def detect_code_in_markdown(markdown_text):
     # Find code blocks in the Markdown text
-    code_blocks = re.findall(code_block_pattern, markdown_text, re.MULTILINE | re.DOTALL)
+    code_blocks = CODE_BLOCK_PATTERN.findall(markdown_text)
 
     # Find inline code in the Markdown text
-    inline_code = re.findall(inline_code_pattern, markdown_text)
+    inline_code = INLINE_CODE_PATTERN.findall(markdown_text)
 
     return code_blocks or inline_code
 
@@ -238,23 +354,33 @@ def break_long_string_into_paragraphs(long_string, sentences_per_paragraph):
     return paragraphs
 
 def process_csv_to_dict(file_path: str) -> list:
-    results = []
-    
-    with open(file_path, 'r') as csv_file:
+    return list(iter_csv_rows(file_path))
+
+def iter_csv_rows(file_path: str):
+    """
+    Yields each row of a csv file as a dict, reading the file as it goes
+    """
+    with open(file_path, 'r', newline='') as csv_file:
         reader = csv.DictReader(csv_file)
         for row in reader:
-            results.append(dict(row))
-    return results
+            yield dict(row)
+
+def ordered_bounded_map(executor, fn, iterable, max_in_flight: int):
+    """
+    Yields fn(item) for each item in order, running up to max_in_flight calls at once on executor.
+    Items are only taken from iterable as slots free up, so it is never read far ahead.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
 
 def is_valid_uri(uri):
-    regex = re.compile(
-        r'^(?:http|ftp)s?://'  # scheme
-        r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'  # domain...
-        r'localhost|'  # localhost...
-        r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # ...or IP
-        r'(?::\d+)?'  # optional port
-        r'(?:/?|[/?]\S+)$', re.IGNORECASE)
-    return bool(re.match(regex, uri))
+    return bool(VALID_URI_PATTERN.match(uri))
 
 def convert_text_to_html(text):
     html_text = html.escape(text)
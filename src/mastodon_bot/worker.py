@@ -1,35 +1,42 @@
 """
 This module contains the worker function that is called by the RQ worker
 """
-import time
 import logging
 import uuid
 import re
 import os
+from concurrent.futures import ThreadPoolExecutor
 from tempfile import gettempdir
-import redis
 from bs4 import BeautifulSoup
-from rq import Queue, Retry
-from mastodon import Mastodon
+from rq import get_current_job
 from mastodon.errors import MastodonAPIError
-from mastodon_bot.util import filter_words, remove_word, split_string_by_words, convo_first_status_id, download_remote_file
-from mastodon_bot.util import save_local_file, detect_code_in_markdown, extract_uris, open_local_file_as_bytes
-from mastodon_bot.util import break_long_string_into_paragraphs, open_local_file_as_string, is_valid_uri, convert_text_to_html, process_csv_to_dict
+from botocore.exceptions import BotoCoreError, ClientError
+from mastodon_bot.util import split_string_by_words, split_stream_by_words, convo_root
+from mastodon_bot.util import download_remote_file_to_path, DEFAULT_DOWNLOAD_MAX_BYTES
+from mastodon_bot.util import detect_code_in_markdown, extract_uris, open_local_file_as_bytes
+from mastodon_bot.util import break_long_string_into_paragraphs, open_local_file_as_string, is_valid_uri, convert_text_to_html
+from mastodon_bot.util import iter_csv_rows, ordered_bounded_map
 from mastodon_bot.external import openai
-from mastodon_bot.external.s3 import s3Wrapper
 from mastodon_bot.external.youtube import YouTubeWrapper
-from mastodon_bot.external.polly import PollyWrapper
+from mastodon_bot.lib.clients.client_registry import registry
 from mastodon_bot.lib.listen.listener_config import ListenerConfig
+from mastodon_bot.lib.listen.conversation_index import ConversationRootIndex
 from mastodon_bot.lib.listen.listener_response_type import ListenerResponseType
-from mastodon_bot.lib.rq.polly_task_status import polly_status_job
+from mastodon_bot.lib.polly.synthesizer import PollySynthesizer
+from mastodon_bot.lib.polly.speech_cache import SpeechCache
+from mastodon_bot.lib.chat.response_cache import ChatResponseCache
+from mastodon_bot.lib.image.preprocess import ImagePreprocessor, ImageTooLargeError
+from mastodon_bot.lib.rq.polly_task_status import schedule_polly_status_job
 from mastodon_bot.markdown import to_text
+from mastodon_bot.normalize import normalize_status
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
 
 def listener_respond(
-    content: str, in_reply_to_id: str, image_url: str, status_id: str, config: ListenerConfig
+    content: str, in_reply_to_id: str, image_url: str, status_id: str, config: ListenerConfig,
+    media_urls: list = None
 ):
     """
     Respond to a status with a response based on the config
@@ -39,21 +46,16 @@ def listener_respond(
 
     logging.getLogger().setLevel(logging.DEBUG)
 
-    words_to_filter = filter_words(content, "@")
-    filtered_content = content
+    status = normalize_status(content)
+    filtered_content = status.text
     response_content = None
     media_ids = []
     chat_context = None
+    convo_root_id = None
+    reply_status_id = status_id
+    posted_status_ids = None
 
-    mastodon_api = Mastodon(
-        client_id=config.mastodon_client_id,
-        client_secret=config.mastodon_client_secret,
-        access_token=config.mastodon_access_token,
-        api_base_url=config.mastodon_host,
-    )
-
-    for word in words_to_filter:
-        filtered_content = remove_word(string=filtered_content, word=word)
+    mastodon_api = registry.get_mastodon(config)
 
     logging.debug("responding with %s", config.response_type)
 
@@ -65,8 +67,11 @@ def listener_respond(
         if status_id is not None and in_reply_to_id is None:
             is_new = True
 
+        root_confirmed = True
         if not is_new:
-            status_id = convo_first_status_id(mastodon_api, in_reply_to_id)
+            status_id, root_confirmed = conversation_root_id(mastodon_api, config, in_reply_to_id)
+        # a root that may not be the conversation's first status isn't remembered for its replies
+        convo_root_id = status_id if root_confirmed else None
 
         if chat_context is None:
             chat_context = openai.OpenAiPrompt(
@@ -93,9 +98,10 @@ def listener_respond(
         if status_id is not None and in_reply_to_id is None:
             is_new = True
 
+        root_confirmed = True
         if not is_new:
-            status_id = convo_first_status_id(
-                mastodon_api=mastodon_api, in_reply_to_id=in_reply_to_id)
+            status_id, root_confirmed = conversation_root_id(mastodon_api, config, in_reply_to_id)
+        convo_root_id = status_id if root_confirmed else None
 
         if chat_context is None:
             chat_context = openai.OpenAiChat(
@@ -106,23 +112,25 @@ def listener_respond(
                 max_age_hours=config.chat_max_age_hours_context,
                 persona=config.chat_persona,
                 redis_connection=config.rq_redis_connection,
+                redis_client=registry.get_redis(config.rq_redis_connection) if config.rq_redis_connection else None,
+                context_backend=config.chat_context_backend,
+                context_max_messages=config.chat_context_max_messages,
+                response_cache=chat_response_cache(config),
             )
-        response_content = chat_context.create(
-            convo_id=str(status_id), prompt=filtered_content
-        )
 
-        if detect_code_in_markdown(response_content):
-            logging.debug(
-                "Detected code in chat response, posting link to code file")
+        if config.chat_stream:
+            if in_reply_to_id is None:
+                in_reply_to_id = status_id
 
-            response_content += unroll_response_content(
-                in_reply_to_id, status_id, config, filtered_content, response_content, False)
-
-        elif len(response_content) > 1000:
-            logging.debug(
-                "Long chat response, posting link to unrolled response")
-            response_content += unroll_response_content(
-                in_reply_to_id, status_id, config, filtered_content, response_content, True)
+            response_content, streamed_status_ids = stream_chat_response(
+                mastodon_api, config, chat_context, in_reply_to_id, status_id, filtered_content)
+            posted_status_ids = [reply_status_id] + streamed_status_ids
+        else:
+            response_content = chat_context.create(
+                convo_id=str(status_id), prompt=filtered_content
+            )
+            response_content += chat_response_links(
+                in_reply_to_id, status_id, config, filtered_content, response_content)
 
     if config.response_type == ListenerResponseType.OPEN_AI_IMAGE:
         response_content = get_image_response_content(
@@ -130,40 +138,28 @@ def listener_respond(
             openai_api_key=config.openai_api_key,
             image_url=image_url,
             filtered_content=filtered_content,
-            media_ids=media_ids
+            media_ids=media_ids,
+            max_bytes=config.download_max_bytes,
+            preprocessor=image_preprocessor(config)
         )
 
     if config.response_type == ListenerResponseType.OPEN_AI_TRANSCRIBE:
         if in_reply_to_id is None:
             in_reply_to_id = status_id
 
-        if image_url is not None and len(image_url) > 0:
+        # uploaded files first, in attachment order, then any url(s) in the content of the post
+        if not media_urls and image_url:
+            media_urls = [image_url]
+        audio_items = [(None, url) for url in media_urls or []]
+        audio_items += [(uri, uri) for uri in status.uris]
+        logging.debug("Transcribing %s item(s) from post: %s", len(audio_items), filtered_content)
 
-            logging.debug("Transcribing from uploaded file: %s", image_url)
-            response_content = get_transcribe_response_content(
-                mastodon_api=mastodon_api,
-                in_reply_to_id=in_reply_to_id,
-                audio_model=config.chat_model,
-                openai_api_key=config.openai_api_key,
-                audio_url=image_url
-            )
-        else:
-            logging.debug("Transcribing from posted content: %s", filtered_content)
-            response_content = ""
-            # attempt to get url(s) to transcribe from content of post
-            uris_to_try = extract_uris(content=filtered_content)
-            for uri in uris_to_try:
-                try:
-                    transcribed = get_transcribe_response_content(
-                        mastodon_api=mastodon_api,
-                        in_reply_to_id=in_reply_to_id,
-                        audio_model=config.chat_model,
-                        openai_api_key=config.openai_api_key,
-                        audio_url=uri
-                    )
-                    response_content += f"{uri}: \n\n {transcribed}\n\n"
-                except Exception as e:
-                    logging.error("Error trying to transcribe %s: %s", uri, e)
+        response_content = transcribe_all(
+            mastodon_api=mastodon_api,
+            config=config,
+            in_reply_to_id=in_reply_to_id,
+            audio_items=audio_items
+        )
 
         if len(response_content) > 1000:
             logging.debug("Response content is long, posting link to transcription file")
@@ -175,7 +171,7 @@ def listener_respond(
             in_reply_to_id = status_id
 
         response_content = prepare_text_to_speech_content(
-            in_reply_to_id, config, filtered_content, response_content, media_ids, mastodon_api)
+            in_reply_to_id, config, filtered_content, response_content, media_ids, mastodon_api, uris=status.uris)
 
     logging.debug("status_post: %s", response_content)
 
@@ -183,50 +179,252 @@ def listener_respond(
     if in_reply_to_id is None:
         in_reply_to_id = status_id
 
-    split_response_content = split_string_by_words(response_content, 493)
-    counter = 1
-    total_posts = len(split_response_content)
-    for split_content in split_response_content:
-        if (total_posts - counter) > 0:
-            split_content += f" .../{counter}"
-        else:
-            split_content += f" /{counter}"
+    # a streamed response has already been posted as it was generated
+    if posted_status_ids is None:
+        split_response_content = split_string_by_words(response_content, 493)
+        total_posts = len(split_response_content)
+        posted_status_ids = [reply_status_id]
+        for counter, split_content in enumerate(split_response_content, start=1):
+            toot = post_reply_part(mastodon_api, split_content, counter, counter == total_posts,
+                                   in_reply_to_id, media_ids)
+            posted_status_ids.append(toot["id"])
 
-        toot = mastodon_api.status_post(
-            split_content,
-            sensitive=False,
-            visibility="private",
-            spoiler_text=None,
-            in_reply_to_id=in_reply_to_id,
-            media_ids=media_ids,
-        )
-        counter += 1
-        logging.debug(toot["url"])
-        time.sleep(0.5)
+    if convo_root_id is not None:
+        remember_conversation(config, convo_root_id, posted_status_ids)
 
+    logging.debug("client registry: %s", registry.stats())
     logging.debug("\n")
     return response_content
 
 
-def prepare_text_to_speech_content(in_reply_to_id, config, filtered_content, response_content, media_ids, mastodon_api):
+# key of the streamed reply's progress in the rq job's meta
+STREAM_PROGRESS_META = "chat_stream"
+
+
+def post_reply_part(mastodon_api, content, number, is_last, in_reply_to_id, media_ids):
+    """
+    Posts one part of a reply thread, numbered, with ... until the last part
+    """
+    if is_last:
+        content += f" /{number}"
+    else:
+        content += f" .../{number}"
+
+    toot = mastodon_api.status_post(
+        content,
+        sensitive=False,
+        visibility="private",
+        spoiler_text=None,
+        in_reply_to_id=in_reply_to_id,
+        media_ids=media_ids,
+    )
+    logging.debug(toot["url"])
+    return toot
+
+
+def chat_response_links(in_reply_to_id, status_id, config, filtered_content, response_content):
+    """
+    Returns a link to the unrolled response for chat responses with code or too long to read as a thread, or ""
+    """
+    if detect_code_in_markdown(response_content):
+        logging.debug(
+            "Detected code in chat response, posting link to code file")
+
+        return unroll_response_content(
+            in_reply_to_id, status_id, config, filtered_content, response_content, False)
+
+    if len(response_content) > 1000:
+        logging.debug(
+            "Long chat response, posting link to unrolled response")
+        return unroll_response_content(
+            in_reply_to_id, status_id, config, filtered_content, response_content, True)
+
+    return ""
+
+
+def stream_chat_response(mastodon_api, config, chat_context, in_reply_to_id, status_id, filtered_content):
+    """
+    Streams the chat response, posting each part of the reply thread as soon as it is complete.
+    Any link to the unrolled response goes on the last part, once the whole response is known.
+    Returns the response, with that link, and the ids of the statuses posted.
+
+    Run as an rq job, the parts posted so far are recorded in the job's meta around each post, and the job
+    isn't retried once a part may have been posted, as a new response can't carry on a thread already
+    posted. A retry that finds posted parts anyway, i.e. after the work horse was killed, ends that thread
+    rather than posting the whole response again.
+    """
+    job = get_current_job()
+    progress = job.meta.get(STREAM_PROGRESS_META) if job is not None else None
+    if progress:
+        return end_interrupted_stream(mastodon_api, in_reply_to_id, progress)
+
+    status_ids = []
+    offset = 0
+
+    def record_progress(done=False):
+        if job is not None:
+            job.meta[STREAM_PROGRESS_META] = {"status_ids": list(status_ids), "offset": offset, "done": done}
+            job.save_meta()
+
+    def post_part(content, is_last):
+        nonlocal offset
+        # recorded before posting too, so a retry knows a part may have been posted
+        record_progress()
+        if job is not None:
+            job.retries_left = 0
+
+        toot = post_reply_part(mastodon_api, content, len(status_ids) + 1, is_last, in_reply_to_id, [])
+        status_ids.append(toot["id"])
+        offset += len(content)
+        record_progress(done=is_last)
+
+    parts = []
+
+    def collect(chunks):
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+
+    chunks = collect(chat_context.create_stream(convo_id=str(status_id), prompt=filtered_content))
+
+    response_content = ""
+    for segment, is_last in split_stream_by_words(chunks, 493):
+        if not is_last:
+            post_part(segment, False)
+            continue
+
+        response_content = "".join(parts)
+        links = chat_response_links(in_reply_to_id, status_id, config, filtered_content, response_content)
+        response_content += links
+
+        last_parts = split_string_by_words(segment + links, 493)
+        for index, last_part in enumerate(last_parts, start=1):
+            post_part(last_part, index == len(last_parts))
+
+    logging.debug("streamed chat response in %s posts", len(status_ids))
+    return response_content, status_ids
+
+
+def end_interrupted_stream(mastodon_api, in_reply_to_id, progress):
+    """
+    Ends a reply thread a failed streaming attempt left unfinished, under the last part it recorded posting
+    """
+    status_ids = list(progress["status_ids"])
+    if progress.get("done"):
+        return "", status_ids
+
+    logging.warning("chat response stream was interrupted after %s characters in %s posts",
+                    progress["offset"], len(status_ids))
+
+    last_status_id = status_ids[-1] if status_ids else in_reply_to_id
+    toot = post_reply_part(mastodon_api, "beep bop, the rest of this response was lost", len(status_ids) + 1,
+                           True, last_status_id, [])
+    return "", status_ids + [toot["id"]]
+
+
+def conversation_index(config):
+    """
+    Returns the conversation root index for config, or None when there is no redis connection
+    """
+    if not config.rq_redis_connection:
+        return None
+
+    return ConversationRootIndex(registry.get_redis(config.rq_redis_connection),
+                                 max_age_hours=config.chat_max_age_hours_context or 24)
+
+
+def chat_response_cache(config):
+    """
+    Returns the chat response cache for config, or None when it is not enabled or there is no redis connection
+    """
+    if not config.chat_response_cache or not config.rq_redis_connection:
+        return None
+
+    return ChatResponseCache(registry.get_redis(config.rq_redis_connection),
+                             ttl_seconds=config.chat_response_cache_ttl,
+                             max_entries=config.chat_response_cache_max_entries,
+                             max_temperature=config.chat_response_cache_max_temperature)
+
+
+def speech_cache(config):
+    """
+    Returns the process wide speech cache for config, or None when no cache directory is configured
+    """
+    if not config.tts_cache_dir:
+        return None
+
+    s3_wrapper = None
+    if config.mastodon_s3_bucket_name and config.tts_cache_s3_prefix:
+        s3_wrapper = registry.get_s3(config)
+
+    redis_client = None
+    if config.rq_redis_connection:
+        redis_client = registry.get_redis(config.rq_redis_connection)
+
+    key = ("speech_cache", config.tts_cache_dir, config.tts_cache_max_bytes, config.tts_cache_s3_prefix,
+           id(s3_wrapper), id(redis_client))
+    return registry.get_or_create(key, lambda: SpeechCache(cache_dir=config.tts_cache_dir,
+                                                           max_bytes=config.tts_cache_max_bytes,
+                                                           s3_wrapper=s3_wrapper,
+                                                           s3_prefix=config.tts_cache_s3_prefix,
+                                                           redis_client=redis_client))
+
+
+def image_preprocessor(config):
+    """
+    Returns the process wide pool preparing images for variations
+    """
+    key = ("image_preprocessor", config.image_preprocess_workers, config.image_max_pixels)
+    return registry.get_or_create(key, lambda: ImagePreprocessor(max_workers=config.image_preprocess_workers,
+                                                                 max_pixels=config.image_max_pixels))
+
+
+def conversation_root_id(mastodon_api, config, in_reply_to_id):
+    """
+    Returns the first status id of the conversation in_reply_to_id is part of, and whether it was
+    confirmed as the first
+    """
+    index = conversation_index(config)
+    if index is None:
+        root_id, confirmed, _ = convo_root(mastodon_api=mastodon_api, in_reply_to_id=in_reply_to_id)
+        return root_id, confirmed
+
+    return index.resolve(mastodon_api=mastodon_api, in_reply_to_id=in_reply_to_id)
+
+
+def remember_conversation(config, convo_root_id, status_ids):
     """
-    Prepares the content for text to speech
+    Indexes the statuses we have seen and posted as part of the conversation rooted at convo_root_id
+    """
+    index = conversation_index(config)
+    if index is None:
+        return
+
+    try:
+        index.set_root(convo_root_id, *status_ids)
+    except Exception as e:
+        # the index is only an optimization, the next reply will resolve from mastodon instead
+        logging.error("Error indexing conversation %s: %s", convo_root_id, e)
+
+
+def prepare_text_to_speech_content(in_reply_to_id, config, filtered_content, response_content, media_ids, mastodon_api,
+                                   uris: list = None):
+    """
+    Prepares the content for text to speech, from uris when already extracted from filtered_content
     """
     if response_content is None:
         response_content = ""
 
-    uris_to_try = extract_uris(content=filtered_content)
+    uris_to_try = uris if uris is not None else extract_uris(content=filtered_content)
     if (len(uris_to_try)) > 0:
         for uri in uris_to_try:
+            temp_file_path = None
             try:
                 # allow all types of content-types we can parse for text
                 allow_file_types = ["text/html",
                                     "text/plain", "text/csv", "text/markdown"]
-                file_bytes, file_extension = download_remote_file(
-                    uri, allow_mime_types=allow_file_types)
-
-                temp_file_path = f"{gettempdir()}/speech_{str(uuid.uuid4())}{file_extension}"
-                save_local_file(content=file_bytes, filename=temp_file_path)
+                temp_file_path, file_extension = download_remote_file_to_path(
+                    uri, allow_mime_types=allow_file_types, max_bytes=config.download_max_bytes, prefix="speech_")
 
                 if file_extension == ".txt":
                     logging.debug("Extracting content from txt file")
@@ -267,35 +465,17 @@ def prepare_text_to_speech_content(in_reply_to_id, config, filtered_content, res
 
                 elif file_extension == ".csv":
                     logging.debug("Extracting content from csv file")
-                    csv_data = process_csv_to_dict(temp_file_path)
-                    for row in csv_data:
-                        row_text_to_use = ""
-                        voice_id_to_use = config.aws_polly_voice_id
-
-                        if "content" in row:
-                            row_text_to_use = row["content"]
-                        elif "text" in row:
-                            row_text_to_use = row["text"]
-                        elif "prompt" in row:
-                            row_text_to_use = row["prompt"]
-                        else:
-                            row_text_to_use = row[0]
-
-                        if "voice_id" in row:
-                            voice_id_to_use = row["voice_id"]
-                        elif "voice" in row:
-                            voice_id_to_use = row["voice"]
-
-                        speech_content = get_speech_response_content(mastodon_api=mastodon_api,
-                                                                     media_ids=media_ids,
-                                                                     config=config,
-                                                                     filtered_content=row_text_to_use,
-                                                                     in_reply_to_id=in_reply_to_id,
-                                                                     voice_id=voice_id_to_use)
-                        response_content += f"\n\n{speech_content}\n\n"
+                    response_content += speak_csv_rows(mastodon_api=mastodon_api,
+                                                       media_ids=media_ids,
+                                                       config=config,
+                                                       rows=iter_csv_rows(temp_file_path),
+                                                       in_reply_to_id=in_reply_to_id)
 
             except Exception as e:
                 logging.error("Error trying to transcribe %s: %s", uri, e)
+            finally:
+                if temp_file_path and os.path.exists(temp_file_path):
+                    os.remove(temp_file_path)
     else:
         response_content = get_speech_response_content(mastodon_api=mastodon_api,
                                                        media_ids=media_ids,
@@ -307,6 +487,71 @@ def prepare_text_to_speech_content(in_reply_to_id, config, filtered_content, res
     return response_content
 
 
+def csv_row_speech(row: dict, default_voice_id: str):
+    """
+    Returns the text and voice id to speak for a csv row
+    """
+    if "content" in row:
+        row_text_to_use = row["content"]
+    elif "text" in row:
+        row_text_to_use = row["text"]
+    elif "prompt" in row:
+        row_text_to_use = row["prompt"]
+    else:
+        row_text_to_use = next(iter(row.values()), "")
+
+    voice_id_to_use = row.get("voice_id") or row.get("voice") or default_voice_id
+    return row_text_to_use, voice_id_to_use
+
+
+def speak_csv_rows(mastodon_api, media_ids, config, rows, in_reply_to_id):
+    """
+    Synthesizes and posts the speech for each csv row, reading rows lazily through a bounded
+    synthesis stage that feeds a separate bounded upload stage. Results are returned in row order.
+    Each row's chunks are synthesized one at a time, so polly_max_workers bounds the polly calls for the job.
+    """
+    def synthesize_row(indexed_row):
+        row_index, row = indexed_row
+        row_text_to_use, voice_id_to_use = csv_row_speech(row, config.aws_polly_voice_id)
+        try:
+            temp_file_path = synthesize_speech_file(config=config, filtered_content=row_text_to_use,
+                                                    in_reply_to_id=in_reply_to_id, voice_id=voice_id_to_use,
+                                                    max_workers=1)
+            return row_index, row_text_to_use, temp_file_path, None
+        except Exception as e:
+            logging.error("Error synthesizing csv row %s: %s", row_index, e)
+            return row_index, row_text_to_use, None, f"Error generating speech for row {row_index + 1}"
+
+    def upload_row(synthesized):
+        row_index, row_text_to_use, temp_file_path, error = synthesized
+        if error is not None:
+            return None, error
+        if temp_file_path is None:
+            return None, "AWS Polly task enqueued, please wait..."
+
+        try:
+            return post_speech_file(mastodon_api=mastodon_api, config=config, temp_file_path=temp_file_path,
+                                    filtered_content=row_text_to_use,
+                                    s3_key=f"{in_reply_to_id}_{row_index}.mp3")
+        except Exception as e:
+            logging.error("Error posting csv row %s: %s", row_index, e)
+            return None, f"Error posting speech for row {row_index + 1}"
+
+    synthesize_workers = max(1, config.polly_max_workers or 1)
+    upload_workers = max(1, config.speech_upload_workers or 1)
+
+    response_content = ""
+    with ThreadPoolExecutor(max_workers=synthesize_workers, thread_name_prefix="speech") as synthesize_pool, \
+            ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix="speech_upload") as upload_pool:
+        synthesized = ordered_bounded_map(synthesize_pool, synthesize_row, enumerate(rows), synthesize_workers * 2)
+        for media_id, speech_content in ordered_bounded_map(upload_pool, upload_row, synthesized, upload_workers * 2):
+            if media_id is not None:
+                media_ids.append(media_id)
+            response_content += f"\n\n{speech_content}\n\n"
+
+    return response_content
+
+
 def unroll_response_content(in_reply_to_id, status_id, config, filtered_content, response_content, split_into_paragraphs: bool = False):
     """
     Unrolls the response content and returns the url to the unrolled content
@@ -317,16 +562,10 @@ def unroll_response_content(in_reply_to_id, status_id, config, filtered_content,
         filtered_content=filtered_content, response_content=response_content, stylesheet_link=stylesheet_link,
         split_into_paragraphs=split_into_paragraphs)
 
-    s3 = s3Wrapper(access_key_id=config.mastodon_s3_access_key_id,
-                   access_secret_key=config.mastodon_s3_access_secret_key,
-                   bucket_name=config.mastodon_s3_bucket_name,
-                   prefix_path=config.mastodon_s3_bucket_prefix_path)
-
-    s3_file_name = f"{status_id}.html"
-    if in_reply_to_id:
-        s3_file_name = f"{status_id}_{in_reply_to_id}.html"
+    s3 = registry.get_s3(config)
 
-    s3_url = s3.upload_string_to_s3(html_full, s3_file_name)
+    # keyed by content, so a retried job finds its page already there
+    s3_url = s3.upload_compressed_to_s3(html_full)
 
     logging.debug("s3_url: %s", s3_url)
 
@@ -365,9 +604,65 @@ def prepare_content_for_archive(filtered_content, response_content, stylesheet_l
     return html_full
 
 
-def get_transcribe_response_content(mastodon_api, openai_api_key, in_reply_to_id, audio_url, audio_model):
+def transcribe_all(mastodon_api, config, in_reply_to_id, audio_items):
+    """
+    Transcribes each (label, url) in audio_items through a bounded pool, returning the results in post order
+    """
+    if len(audio_items) == 0:
+        return "No valid audio provided, cannot transcribe"
+
+    post_transcribe_notice(mastodon_api, in_reply_to_id)
+
+    max_workers = max(1, min(config.transcribe_max_workers or 1, len(audio_items)))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="transcribe") as executor:
+        futures = [
+            executor.submit(transcribe_audio_url, openai_api_key=config.openai_api_key,
+                            audio_url=url, audio_model=config.chat_model,
+                            max_bytes=config.download_max_bytes,
+                            segment_seconds=config.transcribe_segment_seconds,
+                            segment_workers=config.transcribe_segment_workers)
+            for _, url in audio_items
+        ]
+
+        label_results = len(audio_items) > 1
+        response_content = ""
+        for (label, url), future in zip(audio_items, futures):
+            try:
+                transcribed = future.result()
+            except Exception as e:
+                logging.error("Error trying to transcribe %s: %s", url, e)
+                if config.transcribe_error_policy == "fail":
+                    raise e
+                if config.transcribe_error_policy == "skip":
+                    continue
+                transcribed = f"Error trying to transcribe {url}"
+
+            if label is None and not label_results:
+                response_content += transcribed
+            else:
+                response_content += f"{label or url}: \n\n {transcribed}\n\n"
+
+    return response_content
+
+
+def post_transcribe_notice(mastodon_api, in_reply_to_id):
+    """
+    Lets the poster know their transcription has started
+    """
+    mastodon_api.status_post(
+        "Please wait while I transcribe your audio.  On average, this will take fifty percent of the total time of the audio posted.",
+        sensitive=False,
+        visibility="private",
+        spoiler_text=None,
+        in_reply_to_id=in_reply_to_id,
+        media_ids=[],
+    )
+
+
+def transcribe_audio_url(openai_api_key, audio_url, audio_model, max_bytes=None, segment_seconds=600,
+                         segment_workers=4):
     """
-    Gets the transcribe response content
+    Downloads the audio at audio_url and transcribes it, segment_seconds at a time, raising on any error
     """
     transcribe_ai = openai.OpenAiTranscribe(
         openai_api_key=openai_api_key, model=audio_model)
@@ -375,42 +670,25 @@ def get_transcribe_response_content(mastodon_api, openai_api_key, in_reply_to_id
     temp_file_path = ""
 
     try:
-        if audio_url and len(audio_url) > 0:
-
-            if not is_valid_uri(audio_url):
-                raise Exception(
-                    f"Invalid audio url provided: {audio_url}")
-
-            mastodon_api.status_post(
-                "Please wait while I transcribe your audio.  On average, this will take fifty percent of the total time of the audio posted.",
-                sensitive=False,
-                visibility="private",
-                spoiler_text=None,
-                in_reply_to_id=in_reply_to_id,
-                media_ids=[],
-            )
-
-            # does audio_url contain youtube link?
-            youtube_link_regex = r"https://www.youtube.com/watch\?v="
-            youtube_link_match = re.search(youtube_link_regex, audio_url)
-            if youtube_link_match:
-                temp_file_path = f"{gettempdir()}/audio_{str(uuid.uuid4())}.mp4"
-                wrapper = YouTubeWrapper()
-                wrapper.download_youtube_audio(
-                    url=audio_url, filename=temp_file_path)
-            else:
-                audio_bytes, file_extension = download_remote_file(
-                    audio_url, allow_mime_types=['audio/mp3', 'audio/mpeg', 'video/mp4'])
-                temp_file_path = f"{gettempdir()}/audio_{str(uuid.uuid4())}.{file_extension}"
-                save_local_file(content=audio_bytes, filename=temp_file_path)
+        if not is_valid_uri(audio_url):
+            raise Exception(
+                f"Invalid audio url provided: {audio_url}")
+
+        # does audio_url contain youtube link?
+        youtube_link_regex = r"https://www.youtube.com/watch\?v="
+        youtube_link_match = re.search(youtube_link_regex, audio_url)
+        if youtube_link_match:
+            temp_file_path = f"{gettempdir()}/audio_{str(uuid.uuid4())}.mp4"
+            wrapper = YouTubeWrapper()
+            wrapper.download_youtube_audio(
+                url=audio_url, filename=temp_file_path)
         else:
-            transcribe_result = "No valid audio provided, cannot transcribe"
+            temp_file_path, _ = download_remote_file_to_path(
+                audio_url, allow_mime_types=['audio/mp3', 'audio/mpeg', 'video/mp4'], max_bytes=max_bytes,
+                prefix="audio_")
 
-        transcribe_result = transcribe_ai.create(audio_file=temp_file_path)
-
-    except Exception as e:
-        logging.error("Error trying to transcribe %s: %s", audio_url, e)
-        transcribe_result = f"Error trying to transcribe {audio_url}"
+        transcribe_result = transcribe_ai.create_segmented(
+            audio_file=temp_file_path, segment_seconds=segment_seconds, max_workers=segment_workers)
 
     finally:
         # we now need to delete the temp file path if it exists
@@ -420,19 +698,26 @@ def get_transcribe_response_content(mastodon_api, openai_api_key, in_reply_to_id
     return transcribe_result
 
 
-def get_image_response_content(mastodon_api, openai_api_key, image_url, filtered_content, media_ids):
+def get_image_response_content(mastodon_api, openai_api_key, image_url, filtered_content, media_ids,
+                               max_bytes=DEFAULT_DOWNLOAD_MAX_BYTES, preprocessor=None):
     """
     Gets the image response content
     """
 
     image_ai = openai.OpenAiImage(openai_api_key)
 
-    if image_url:
-        image_byes, file_extension = download_remote_file(image_url)
-        logging.debug("file_extension: %s", file_extension)
-
     if image_url and filtered_content == "variation":
-        image_result = image_ai.variation(image=image_byes)
+        # only the path goes to the preprocessor, which reads the image in its own process
+        temp_file_path, file_extension = download_remote_file_to_path(image_url, max_bytes=max_bytes, prefix="image_")
+        logging.debug("file_extension: %s", file_extension)
+        try:
+            image_result = image_ai.variation(image=temp_file_path, preprocessor=preprocessor)
+        except ImageTooLargeError as e:
+            logging.info("not creating variation: %s", e)
+            return "Image is too large to create a variation of"
+        finally:
+            if os.path.exists(temp_file_path):
+                os.remove(temp_file_path)
 
     elif image_url and filtered_content == "edit":
         logging.debug("Not yet implemented")
@@ -457,9 +742,28 @@ def get_speech_response_content(mastodon_api, media_ids, config, filtered_conten
     """
     Gets the speech response content
     """
-    polly_wrapper = PollyWrapper(access_key_id=config.mastodon_s3_access_key_id,
-                                 access_secret_key=config.mastodon_s3_access_secret_key,
-                                 regionName=config.aws_polly_region_name,)
+    temp_file_path = synthesize_speech_file(config=config, filtered_content=filtered_content,
+                                            in_reply_to_id=in_reply_to_id, voice_id=voice_id)
+    if temp_file_path is None:
+        return "AWS Polly task enqueued, please wait..."
+
+    media_id, response_content = post_speech_file(mastodon_api=mastodon_api, config=config,
+                                                  temp_file_path=temp_file_path,
+                                                  filtered_content=filtered_content,
+                                                  s3_key=f"{in_reply_to_id}.mp3")
+    if media_id is not None:
+        media_ids.append(media_id)
+
+    return response_content
+
+
+def synthesize_speech_file(config, filtered_content, in_reply_to_id, voice_id, max_workers: int = None):
+    """
+    Synthesizes filtered_content to a temp mp3 and returns its path,
+    or None when it was handed to an async polly task instead.
+    Its chunks are synthesized max_workers at a time, config.polly_max_workers by default.
+    """
+    polly_wrapper = registry.get_polly(config)
 
     temp_file_name = f"speech_{str(uuid.uuid4())}.mp3"
     temp_file_path = f"{gettempdir()}/{temp_file_name}"
@@ -467,63 +771,63 @@ def get_speech_response_content(mastodon_api, media_ids, config, filtered_conten
     if voice_id is None:
         voice_id = config.aws_polly_voice_id
 
-    speak_direct = polly_wrapper.speak(
-        text=filtered_content, voice_id=voice_id, out_file=temp_file_path)
-    if speak_direct is False:
-        logging.debug("enqueing polly task due to large text {temp_file_name}")
-        polly_task_id = polly_wrapper.start_speak(text=filtered_content, voice_id=config.aws_polly_voice_id,
-                                                  output_bucket=config.mastodon_s3_bucket_name, output_key_prefix=config.mastodon_s3_bucket_prefix_path)
-        logging.info("enqueuing polly status job: {polly_task_id} {in_reply_to_id}")
-        redis_conn = redis.from_url(config.rq_redis_connection)
-        queue = Queue(config.rq_queue_name, connection=redis_conn)
-        queue.enqueue(
-            polly_status_job,
-            kwargs={
-                'in_reply_to_id': in_reply_to_id,
-                'polly_task_id': polly_task_id,
-                'config': config
-            },
-            # we retry up to one hour for these async jobs
-            retry=Retry(max=60,
-                        interval=60),  # in seconds
-            job_timeout=config.rq_queue_task_timeout
+    if max_workers is None:
+        max_workers = config.polly_max_workers
+
+    synthesizer = PollySynthesizer(polly_wrapper, max_workers=max_workers,
+                                   speech_cache=speech_cache(config))
+    try:
+        synthesizer.synthesize_to_file(text=filtered_content, voice_id=voice_id, out_file=temp_file_path)
+        return temp_file_path
+    except (BotoCoreError, ClientError) as e:
+        # fall back to an async polly task written to s3
+        logging.error("chunked polly synthesis failed, %s", e)
+
+    logging.debug("enqueing polly task for %s", temp_file_name)
+    polly_task_id = polly_wrapper.start_speak(text=filtered_content, voice_id=voice_id,
+                                              output_bucket=config.mastodon_s3_bucket_name, output_key_prefix=config.mastodon_s3_bucket_prefix_path)
+    logging.info("scheduling polly status job: %s %s", polly_task_id, in_reply_to_id)
+    schedule_polly_status_job(config=config, in_reply_to_id=in_reply_to_id, polly_task_id=polly_task_id)
+    return None
+
+
+def post_speech_file(mastodon_api, config, temp_file_path, filtered_content, s3_key):
+    """
+    Posts the speech at temp_file_path to mastodon, or to s3 when mastodon won't take it, then removes it.
+    Returns the media id, if posted to mastodon, and the response content
+    """
+    temp_file_name = os.path.basename(temp_file_path)
+    logging.debug("posting media to mastodon with name %s", temp_file_name)
+
+    # attempt to post to mastodon with audio file.
+    # if to large, exception will be raised and we then upload to s3 and return link
+    media_id = None
+    s3_url = None
+    try:
+        ai_media_post = mastodon_api.media_post(
+            media_file=open_local_file_as_bytes(temp_file_path),
+            file_name=temp_file_name,
+            mime_type="mime_type='audio/mp3'",
+            synchronous=True
         )
-        response_content = "AWS Polly task enqueued, please wait..."
-    else:
-        logging.debug("posting media to mastodon with name %s", temp_file_name)
+        media_id = ai_media_post["id"]
+    except MastodonAPIError as e:
+        logging.error("MastodonAPIError: %s", e)
+        logging.info("Uploading to S3 and returning link instead")
 
-        # attempt to post to mastodon with audio file.
-        # if to large, exception will be raised and we then upload to s3 and return link
-        s3_url = None
-        try:
-            ai_media_post = mastodon_api.media_post(
-                media_file=open_local_file_as_bytes(temp_file_path),
-                file_name=temp_file_name,
-                mime_type="mime_type='audio/mp3'",
-                synchronous=True
-            )
-            media_ids.append(ai_media_post["id"])
-        except MastodonAPIError as e:
-            logging.error("MastodonAPIError: %s", e)
-            logging.info("Uploading to S3 and returning link instead")
-
-            # also post to s3:
-            s3 = s3Wrapper(access_key_id=config.mastodon_s3_access_key_id,
-                           access_secret_key=config.mastodon_s3_access_secret_key,
-                           bucket_name=config.mastodon_s3_bucket_name,
-                           prefix_path=config.mastodon_s3_bucket_prefix_path)
-
-            s3_key = f"{in_reply_to_id}.mp3"
-            s3_url = s3.upload_file_to_s3(
-                file_path=temp_file_path, s3_key=s3_key, content_type="audio/mp3")
-        finally:
-            # we now need to delete the temp file path if it exists
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
+        # also post to s3:
+        s3 = registry.get_s3(config)
 
-        if s3_url is not None:
-            response_content = f"Audio Generated from: {filtered_content} \n\n  View unrolled: {s3_url}"
-        else:
-            response_content = f"Audio Generated from: {filtered_content}"
+        s3_url = s3.upload_file_to_s3(
+            file_path=temp_file_path, s3_key=s3_key, content_type="audio/mp3")
+    finally:
+        # we now need to delete the temp file path if it exists
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
 
-    return response_content
+    if s3_url is not None:
+        response_content = f"Audio Generated from: {filtered_content} \n\n  View unrolled: {s3_url}"
+    else:
+        response_content = f"Audio Generated from: {filtered_content}"
+
+    return media_id, response_content
@@ -0,0 +1,188 @@
+"""
+In memory stand in for the parts of redis-py the tests use, shared by every test module
+so the fakes can't drift apart
+"""
+import fnmatch
+import threading
+from unittest.mock import Mock
+
+
+def encode(value) -> bytes:
+    # redis stores everything as bytes, like redis-py returns it
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode("utf-8")
+
+
+def score(value) -> float:
+    return float(value.decode() if isinstance(value, bytes) else value)
+
+
+class SortedSet(dict):
+    """
+    member -> score, kept apart from hashes, which are plain dicts
+    """
+
+
+class FakePipeline:
+    """
+    Buffers commands until execute, except in a transaction before multi(), where
+    commands run straight away like they do on a watched redis-py pipeline
+    """
+
+    def __init__(self, redis, immediate=False):
+        self.redis = redis
+        self.immediate = immediate
+        self.commands = []
+
+    def multi(self):
+        self.immediate = False
+
+    def __getattr__(self, name):
+        command = getattr(self.redis, name)
+
+        def call(*args, **kwargs):
+            if self.immediate:
+                return command(*args, **kwargs)
+            self.commands.append((command, args, kwargs))
+            return self
+        return call
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        return [command(*args, **kwargs) for command, args, kwargs in commands]
+
+
+class FakeRedis:
+
+    def __init__(self):
+        self.store = {}
+        self.expiries = {}
+        self.locks = {}
+        self.guard = threading.RLock()
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def transaction(self, func, *keys, value_from_callable=False):
+        pipeline = FakePipeline(self, immediate=True)
+        value = func(pipeline)
+        results = pipeline.execute()
+        return value if value_from_callable else results
+
+    def lock(self, name, timeout=None, blocking_timeout=None):
+        with self.guard:
+            lock = self.locks.setdefault(name, threading.Lock())
+        fake = Mock()
+        fake.acquire.side_effect = lambda: lock.acquire(timeout=blocking_timeout if blocking_timeout else -1)
+        fake.release.side_effect = lock.release
+        return fake
+
+    # keys
+
+    def delete(self, *keys):
+        with self.guard:
+            deleted = 0
+            for key in keys:
+                key = key.decode("utf-8") if isinstance(key, bytes) else key
+                if self.store.pop(key, None) is not None:
+                    deleted += 1
+                self.expiries.pop(key, None)
+            return deleted
+
+    def exists(self, *keys):
+        return sum(1 for key in keys if key in self.store)
+
+    def expire(self, key, seconds):
+        if key not in self.store:
+            return False
+        self.expiries[key] = seconds
+        return True
+
+    def ttl(self, key):
+        if key not in self.store:
+            return -2
+        return self.expiries.get(key, -1)
+
+    def scan_iter(self, match=None):
+        for key in list(self.store):
+            if match is None or fnmatch.fnmatchcase(key, match):
+                yield encode(key)
+
+    # strings
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        with self.guard:
+            if nx and key in self.store:
+                return None
+            self.store[key] = encode(value)
+            if ex is not None:
+                self.expiries[key] = ex
+            else:
+                self.expiries.pop(key, None)
+            return True
+
+    # lists
+
+    def rpush(self, key, *values):
+        items = self.store.setdefault(key, [])
+        items.extend(encode(value) for value in values)
+        return len(items)
+
+    def lrange(self, key, start, end):
+        items = self.store.get(key, [])
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    def ltrim(self, key, start, end):
+        items = self.store.get(key, [])
+        self.store[key] = items[start:] if end == -1 else items[start:end + 1]
+        return True
+
+    def llen(self, key):
+        return len(self.store.get(key, []))
+
+    # hashes
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        fields = self.store.setdefault(key, {})
+        if field is not None:
+            fields[encode(field)] = encode(value)
+        for name, item in (mapping or {}).items():
+            fields[encode(name)] = encode(item)
+        return True
+
+    def hgetall(self, key):
+        return dict(self.store.get(key, {}))
+
+    def hincrby(self, key, field, amount=1):
+        fields = self.store.setdefault(key, {})
+        value = int(fields.get(encode(field), b"0")) + amount
+        fields[encode(field)] = encode(value)
+        return value
+
+    # sorted sets
+
+    def zadd(self, key, mapping):
+        members = self.store.setdefault(key, SortedSet())
+        members.update({encode(member): float(value) for member, value in mapping.items()})
+        return len(mapping)
+
+    def zremrangebyscore(self, key, low, high):
+        members = self.store.get(key, SortedSet())
+        removed = [member for member, value in members.items() if score(low) <= value <= score(high)]
+        for member in removed:
+            del members[member]
+        return len(removed)
+
+    def zcard(self, key):
+        return len(self.store.get(key, SortedSet()))
+
+    def zpopmin(self, key, count=1):
+        members = self.store.get(key, SortedSet())
+        popped = sorted(members.items(), key=lambda item: item[1])[:count]
+        for member, _ in popped:
+            del members[member]
+        return popped
@@ -0,0 +1,113 @@
+import time
+import asyncio
+import unittest
+from unittest.mock import patch, Mock
+
+
+class AsyncIngestTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def new_ingest(self, **kwargs):
+        from mastodon_bot.lib.listen.async_ingest import AsyncStreamIngest
+        from mastodon_bot.lib.listen.listener_config import ListenerConfig
+
+        config = ListenerConfig(rq_redis_connection="redis://localhost:6379/0", rq_queue_name="test",
+                                rq_queue_retry_attempts=3, rq_queue_retry_delay=5, rq_queue_task_timeout=120)
+        with patch('mastodon_bot.lib.listen.async_ingest.registry'), \
+                patch('mastodon_bot.lib.listen.async_ingest.Queue'):
+            ingest = AsyncStreamIngest(mastodon_api=Mock(), config=config, **kwargs)
+
+        ingest.redis_conn = Mock()
+        ingest.queue = Mock()
+        return ingest
+
+    def parsed(self, status_id):
+        return (status_id, None, None, f"hello {status_id}", [])
+
+    def test_requires_redis(self):
+        from mastodon_bot.lib.listen.async_ingest import AsyncStreamIngest
+        from mastodon_bot.lib.listen.listener_config import ListenerConfig
+
+        with self.assertRaises(ValueError):
+            AsyncStreamIngest(mastodon_api=Mock(), config=ListenerConfig())
+
+    def test_enqueue_batch_drops_claimed_duplicates(self):
+        ingest = self.new_ingest()
+        # the second status was claimed already, i.e. by the update for the same mention
+        ingest.redis_conn.pipeline.return_value.execute.return_value = [True, None, True]
+
+        received_at = time.time()
+        jobs = [(received_at, self.parsed(1)), (received_at, self.parsed(2)), (received_at, self.parsed(3))]
+        ingest.enqueue_batch(jobs)
+
+        ingest.queue.enqueue_many.assert_called_once()
+        job_datas = ingest.queue.enqueue_many.call_args.args[0]
+        self.assertEqual([job_data.kwargs["status_id"] for job_data in job_datas], [1, 3])
+        for job_data in job_datas:
+            self.assertEqual(job_data.retry.max, 3)
+            self.assertEqual(job_data.retry.intervals, [5])
+            self.assertEqual(job_data.timeout, 120)
+        self.assertEqual(ingest.lag_stats()["enqueued"], 2)
+        self.assertEqual(ingest.lag_samples, 2)
+
+    def test_enqueue_batch_all_claimed(self):
+        ingest = self.new_ingest()
+        ingest.redis_conn.pipeline.return_value.execute.return_value = [None]
+
+        ingest.enqueue_batch([(time.time(), self.parsed(1))])
+
+        ingest.queue.enqueue_many.assert_not_called()
+
+    def test_record_lag(self):
+        ingest = self.new_ingest()
+
+        ingest.record_lag(98.0, 100.0)
+        ingest.record_lag(96.0, 100.0)
+        # a clock step backwards isn't counted as negative lag
+        ingest.record_lag(101.0, 100.0)
+
+        self.assertEqual(ingest.lag_stats(), {"enqueued": 0, "average_lag": 2.0, "max_lag": 4.0})
+
+    def test_next_batch_stops_at_batch_size(self):
+        ingest = self.new_ingest(batch_size=3, flush_interval=0.05)
+
+        async def next_batches():
+            events = asyncio.Queue()
+            for index in range(5):
+                events.put_nowait(("update", {"id": index}, 0.0))
+            return await ingest._next_batch(events), await ingest._next_batch(events)
+
+        first, second = asyncio.run(asyncio.wait_for(next_batches(), timeout=1))
+
+        self.assertEqual([event["id"] for _, event, _ in first], [0, 1, 2])
+        # a partial batch is flushed once the interval has passed
+        self.assertEqual([event["id"] for _, event, _ in second], [3, 4])
+
+    def test_next_batch_waits_for_first_event(self):
+        ingest = self.new_ingest(batch_size=3, flush_interval=0.01)
+
+        async def next_batch():
+            events = asyncio.Queue()
+            asyncio.get_running_loop().call_later(0.05, events.put_nowait, ("update", {"id": 1}, 0.0))
+            return await ingest._next_batch(events)
+
+        batch = asyncio.run(asyncio.wait_for(next_batch(), timeout=1))
+
+        self.assertEqual([event["id"] for _, event, _ in batch], [1])
+
+    def test_stream_bridge_hands_events_to_loop(self):
+        from mastodon_bot.lib.listen.async_ingest import StreamBridge
+
+        async def bridge_events():
+            events = asyncio.Queue()
+            bridge = StreamBridge(asyncio.get_running_loop(), events)
+            await asyncio.to_thread(bridge.on_update, {"id": 1})
+            await asyncio.to_thread(bridge.on_notification, {"id": 2})
+            return [await events.get(), await events.get()]
+
+        received = asyncio.run(asyncio.wait_for(bridge_events(), timeout=1))
+
+        self.assertEqual([(event_type, event) for event_type, event, _ in received],
+                         [("update", {"id": 1}), ("notification", {"id": 2})])
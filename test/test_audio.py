@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+
+# MPEG 1 layer III, 128kbps, 44100hz, no padding: 417 bytes and 1152 samples a frame
+FRAME_HEADER = b'\xff\xfb\x90\x00'
+FRAME_LENGTH = 417
+FRAME_SECONDS = 1152 / 44100
+
+
+def mp3_bytes(frame_count, id3=False):
+    frames = b''.join(FRAME_HEADER + bytes([index % 256]) * (FRAME_LENGTH - 4) for index in range(frame_count))
+    if id3:
+        # 20 byte tag, size stored as a syncsafe integer
+        frames = b'ID3\x04\x00\x00\x00\x00\x00\x14' + b'\x00' * 20 + frames
+    return frames
+
+
+class AudioSegmentsTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def test_mp3_frames(self):
+        from mastodon_bot.lib.audio.segments import mp3_frames
+
+        frames = list(mp3_frames(mp3_bytes(3, id3=True)))
+
+        self.assertEqual([offset for offset, _, _ in frames], [30, 30 + FRAME_LENGTH, 30 + 2 * FRAME_LENGTH])
+        self.assertTrue(all(length == FRAME_LENGTH for _, length, _ in frames))
+        self.assertAlmostEqual(frames[0][2], FRAME_SECONDS)
+
+    def test_mp3_frames_resyncs_past_garbage(self):
+        from mastodon_bot.lib.audio.segments import mp3_frames
+
+        data = mp3_bytes(1) + b'garbage' + mp3_bytes(1)
+
+        frames = list(mp3_frames(data))
+
+        self.assertEqual([offset for offset, _, _ in frames], [0, FRAME_LENGTH + 7])
+
+    def test_split_audio_mp3(self):
+        from mastodon_bot.lib.audio.segments import audio_segments
+
+        data = mp3_bytes(100, id3=True)
+        file_descriptor, audio_file = tempfile.mkstemp(suffix=".mp3")
+        with os.fdopen(file_descriptor, 'wb') as file:
+            file.write(data)
+
+        try:
+            with audio_segments(audio_file, segment_seconds=1) as segments:
+                self.assertEqual(len(segments), 3)
+                segment_bytes = []
+                for segment in segments:
+                    with open(segment, 'rb') as file:
+                        segment_bytes.append(file.read())
+
+            # 38 frames fit in a second, the id3 tag is left out
+            self.assertEqual([len(chunk) // FRAME_LENGTH for chunk in segment_bytes], [38, 38, 24])
+            self.assertEqual(b''.join(segment_bytes), data[30:])
+            self.assertFalse(any(os.path.exists(segment) for segment in segments))
+
+            with audio_segments(audio_file, segment_seconds=600) as segments:
+                self.assertEqual(segments, [audio_file])
+            self.assertTrue(os.path.exists(audio_file))
+        finally:
+            os.remove(audio_file)
@@ -0,0 +1,82 @@
+import os
+import unittest
+from unittest.mock import patch, Mock, MagicMock
+from mastodon_bot.lib.clients.client_registry import registry
+
+
+def registry_job():
+    return id(registry.get_or_create(("test", "registry_job"), object))
+
+
+class ClientRegistryTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def test_get_or_create(self):
+
+        from mastodon_bot.lib.clients.client_registry import ClientRegistry
+
+        registry = ClientRegistry()
+        factory = Mock(side_effect=lambda: object())
+
+        first = registry.get_or_create(("s3", "key", "secret"), factory)
+        second = registry.get_or_create(("s3", "key", "secret"), factory)
+        other = registry.get_or_create(("s3", "key2", "secret"), factory)
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+        self.assertEqual(factory.call_count, 2)
+        self.assertEqual(registry.stats(), {"hits": 1, "misses": 2, "clients": 2})
+
+    def test_get_mastodon(self):
+
+        from mastodon_bot.lib.clients.client_registry import ClientRegistry
+        from mastodon_bot.lib.listen.listener_config import ListenerConfig
+
+        registry = ClientRegistry()
+        config = ListenerConfig(mastodon_host="https://example.social", mastodon_client_id="id",
+                                mastodon_client_secret="secret", mastodon_access_token="token")
+
+        with patch('mastodon_bot.lib.clients.client_registry.Mastodon') as mock_mastodon:
+            first = registry.get_mastodon(config)
+            second = registry.get_mastodon(config)
+
+            self.assertIs(first, second)
+            mock_mastodon.assert_called_once()
+
+    def test_reused_across_jobs(self):
+        from rq import Queue, SimpleWorker
+        from rq.job import Job
+
+        connection = MagicMock()
+        # read by rq to decide how it records job results
+        setattr(connection, "__rq_redis_server_version", (7, 0, 0))
+        queue = Queue("test", connection=connection)
+        worker = SimpleWorker([queue], connection=connection)
+
+        registry.clear()
+        jobs = [Job.create(registry_job, connection=connection) for _ in range(2)]
+        for job in jobs:
+            worker.execute_job(job, queue)
+
+        self.assertEqual(jobs[0]._result, jobs[1]._result)
+        self.assertEqual(registry.stats()["clients"], 1)
+        registry.clear()
+
+    def test_empty_after_fork(self):
+        registry.get_or_create(("test", "parent"), object)
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            os.write(write_fd, str(registry.stats()["clients"]).encode())
+            os._exit(0)
+
+        os.close(write_fd)
+        os.waitpid(pid, 0)
+        with os.fdopen(read_fd) as child_output:
+            self.assertEqual(child_output.read(), "0")
+        self.assertGreater(registry.stats()["clients"], 0)
+        registry.clear()
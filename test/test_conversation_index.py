@@ -0,0 +1,79 @@
+import unittest
+from unittest.mock import Mock
+from fake_redis import FakeRedis
+
+
+class ConversationIndexTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def test_resolve_with_one_context_call(self):
+
+        from mastodon_bot.lib.listen.conversation_index import ConversationRootIndex
+
+        mastodon_api = Mock()
+        mastodon_api.status_context.return_value = {
+            "ancestors": [
+                {"id": 100, "in_reply_to_id": None},
+                {"id": 101, "in_reply_to_id": 100},
+                {"id": 102, "in_reply_to_id": 101},
+            ],
+            "descendants": []
+        }
+
+        index = ConversationRootIndex(FakeRedis())
+        self.assertEqual(index.resolve(mastodon_api, 103), ("100", True))
+        mastodon_api.status_context.assert_called_once_with(103)
+        mastodon_api.status.assert_not_called()
+
+        # every ancestor was indexed, so another reply in the thread needs no call at all
+        self.assertEqual(index.resolve(mastodon_api, 101), ("100", True))
+        mastodon_api.status_context.assert_called_once()
+
+    def test_resolve_root(self):
+
+        from mastodon_bot.lib.listen.conversation_index import ConversationRootIndex
+
+        mastodon_api = Mock()
+        mastodon_api.status_context.return_value = {"ancestors": [], "descendants": []}
+        mastodon_api.status.return_value = {"id": 100, "in_reply_to_id": None}
+
+        index = ConversationRootIndex(FakeRedis())
+        self.assertEqual(index.resolve(mastodon_api, 100), ("100", True))
+
+    def test_set_root(self):
+
+        from mastodon_bot.lib.listen.conversation_index import ConversationRootIndex
+
+        mastodon_api = Mock()
+        index = ConversationRootIndex(FakeRedis())
+        index.set_root(100, 200, 201)
+
+        self.assertEqual(index.resolve(mastodon_api, 201), ("100", True))
+        self.assertEqual(index.get_root(100), "100")
+        mastodon_api.status_context.assert_not_called()
+
+    def test_resolve_context_missing_root(self):
+
+        from mastodon_bot.lib.listen.conversation_index import ConversationRootIndex
+
+        # 100 is the root, but the context leaves it out, i.e. its author blocked the bot
+        mastodon_api = Mock()
+        mastodon_api.status_context.return_value = {
+            "ancestors": [{"id": 102, "in_reply_to_id": 101}, {"id": 103, "in_reply_to_id": 102}],
+            "descendants": []
+        }
+        statuses = {101: {"id": 101, "in_reply_to_id": 100}, 100: {"id": 100, "in_reply_to_id": None}}
+        mastodon_api.status.side_effect = lambda status_id: statuses[status_id]
+
+        redis_client = FakeRedis()
+        index = ConversationRootIndex(redis_client)
+        self.assertEqual(index.resolve(mastodon_api, 104), ("100", True))
+        self.assertEqual(index.get_root(102), "100")
+
+        # with the root gone, the oldest status reached is used but not indexed
+        del statuses[100]
+        redis_client.store.clear()
+        self.assertEqual(index.resolve(mastodon_api, 104), ("101", False))
+        self.assertIsNone(index.get_root(104))
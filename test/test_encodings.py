@@ -0,0 +1,42 @@
+import unittest
+from unittest.mock import patch, Mock
+
+
+class EncodingRegistryTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def test_for_model_loads_once(self):
+        from mastodon_bot.lib.chat.encodings import EncodingRegistry
+
+        registry = EncodingRegistry()
+        encoding = Mock()
+
+        with patch('mastodon_bot.lib.chat.encodings.tiktoken.encoding_for_model', return_value=encoding) as mock_for_model:
+            self.assertIs(registry.for_model("gpt-3.5-turbo"), encoding)
+            self.assertIs(registry.for_model("gpt-3.5-turbo"), encoding)
+
+        mock_for_model.assert_called_once_with("gpt-3.5-turbo")
+
+    def test_unknown_model_falls_back_to_default_encoding(self):
+        from mastodon_bot.lib.chat.encodings import EncodingRegistry
+
+        registry = EncodingRegistry()
+        encoding = Mock()
+
+        with patch('mastodon_bot.lib.chat.encodings.tiktoken.encoding_for_model', side_effect=KeyError("nope")), \
+                patch('mastodon_bot.lib.chat.encodings.tiktoken.get_encoding', return_value=encoding) as mock_get:
+            self.assertIs(registry.for_model("my-fine-tune"), encoding)
+
+        mock_get.assert_called_once_with("cl100k_base")
+
+    def test_count_tokens_is_memoized(self):
+        from mastodon_bot.lib.chat.encodings import count_tokens
+
+        encoding = Mock()
+        encoding.encode.side_effect = lambda text: text.split()
+
+        self.assertEqual(count_tokens(encoding, "you are a helpful bot"), 5)
+        self.assertEqual(count_tokens(encoding, "you are a helpful bot"), 5)
+        encoding.encode.assert_called_once()
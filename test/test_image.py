@@ -0,0 +1,144 @@
+import os
+import time
+import multiprocessing
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+from PIL import Image
+
+
+def slow_prepare(image, **kwargs):
+    # stands in for a decode that never finishes, in the pool process
+    time.sleep(60)
+
+
+class ImagePreprocessTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def encode(self, image, image_format):
+        buffer = BytesIO()
+        image.save(buffer, format=image_format)
+        return buffer.getvalue()
+
+    def test_prepare_variation_image_from_jpeg(self):
+        from mastodon_bot.lib.image.preprocess import prepare_variation_image
+
+        jpeg = self.encode(Image.new("RGB", (3000, 2000), (200, 30, 30)), "JPEG")
+        png = prepare_variation_image(jpeg)
+
+        with Image.open(BytesIO(png)) as image:
+            self.assertEqual(image.format, "PNG")
+            self.assertEqual(image.size, (1024, 1024))
+            self.assertEqual(image.mode, "RGB")
+
+    def test_pixel_budget_applies_after_draft(self):
+        from mastodon_bot.lib.image.preprocess import prepare_variation_image, ImageTooLargeError
+
+        image = Image.new("RGB", (4096, 4096), (10, 120, 10))
+
+        # a jpeg is decoded at 1/4 scale, within the budget
+        prepare_variation_image(self.encode(image, "JPEG"), max_pixels=1024 * 1024)
+
+        # a png can't be, so it is refused before decoding
+        with self.assertRaises(ImageTooLargeError):
+            prepare_variation_image(self.encode(image, "PNG"), max_pixels=1024 * 1024)
+
+    def test_falls_back_to_smaller_png(self):
+        from mastodon_bot.lib.image.preprocess import prepare_variation_image, ImageTooLargeError
+
+        noise = Image.frombytes("RGB", (600, 600), os.urandom(600 * 600 * 3))
+        png = prepare_variation_image(self.encode(noise, "PNG"), size=512, max_png_bytes=100 * 1024)
+
+        self.assertLessEqual(len(png), 100 * 1024)
+        with Image.open(BytesIO(png)) as image:
+            self.assertLess(image.size[0], 512)
+
+        with self.assertRaises(ImageTooLargeError):
+            prepare_variation_image(self.encode(noise, "PNG"), size=512, max_png_bytes=1024)
+
+    def test_decompression_bomb_is_too_large(self):
+        from mastodon_bot.lib.image.preprocess import prepare_variation_image, ImageTooLargeError
+
+        png = self.encode(Image.new("RGB", (100, 100)), "PNG")
+        with patch.object(Image, "MAX_IMAGE_PIXELS", 1000), self.assertRaises(ImageTooLargeError):
+            prepare_variation_image(png, max_pixels=1_000_000)
+
+    def test_preprocessor_kills_pool_on_timeout(self):
+        from mastodon_bot.lib.image.preprocess import ImagePreprocessor, ImageTooLargeError
+
+        preprocessor = ImagePreprocessor(size=256, timeout_seconds=0.5)
+        try:
+            with patch('mastodon_bot.lib.image.preprocess.prepare_variation_image', slow_prepare):
+                started = time.monotonic()
+                with self.assertRaises(ImageTooLargeError):
+                    preprocessor.prepare(b"image")
+
+            self.assertLess(time.monotonic() - started, 10)
+            self.assertIsNone(preprocessor._executor)
+            # the pool process stopped decoding rather than sleeping on
+            deadline = time.monotonic() + 5
+            while multiprocessing.active_children() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(multiprocessing.active_children(), [])
+
+            # the next image gets a new pool
+            png = preprocessor.prepare(self.encode(Image.new("RGB", (300, 300)), "PNG"))
+            self.assertIsNotNone(preprocessor._executor)
+            self.assertTrue(png.startswith(b"\x89PNG"))
+        finally:
+            preprocessor.shutdown()
+
+    def test_preprocessor_runs_in_pool(self):
+        from mastodon_bot.lib.image.preprocess import ImagePreprocessor
+
+        preprocessor = ImagePreprocessor(size=256)
+        try:
+            png = preprocessor.prepare(self.encode(Image.new("RGBA", (300, 500), (0, 0, 0, 0)), "PNG"))
+        finally:
+            preprocessor.shutdown()
+
+        with Image.open(BytesIO(png)) as image:
+            self.assertEqual(image.size, (256, 256))
+            self.assertEqual(image.mode, "RGBA")
+
+    def test_preprocessor_reads_path_in_pool(self):
+        import tempfile
+        from mastodon_bot.lib.image.preprocess import ImagePreprocessor
+
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as image_file:
+            Image.new("RGB", (2000, 1000), (30, 30, 200)).save(image_file, format="JPEG")
+            image_file.flush()
+
+            preprocessor = ImagePreprocessor(size=256)
+            try:
+                png = preprocessor.prepare(image_file.name)
+            finally:
+                preprocessor.shutdown()
+
+        with Image.open(BytesIO(png)) as image:
+            self.assertEqual(image.size, (256, 256))
+
+    def test_variation_response_passes_path(self):
+        import tempfile
+        from unittest.mock import patch, Mock
+        from mastodon_bot.worker import get_image_response_content
+
+        file_descriptor, image_path = tempfile.mkstemp(prefix="image_")
+        os.close(file_descriptor)
+
+        mastodon_api = Mock()
+        mastodon_api.media_post.return_value = {"id": 1}
+        media_ids = []
+        with patch('mastodon_bot.worker.download_remote_file_to_path', return_value=(image_path, ".jpg")) \
+                as mock_download, \
+                patch('mastodon_bot.worker.openai.OpenAiImage') as mock_image_ai:
+            mock_image_ai.return_value.variation.return_value = b"png"
+            get_image_response_content(mastodon_api, "key", "https://example.social/image.jpg", "variation",
+                                       media_ids, max_bytes=1024)
+
+        self.assertEqual(mock_download.call_args.kwargs["max_bytes"], 1024)
+        self.assertEqual(mock_image_ai.return_value.variation.call_args.kwargs["image"], image_path)
+        self.assertEqual(media_ids, [1])
+        self.assertFalse(os.path.exists(image_path))
@@ -0,0 +1,37 @@
+import os
+import sys
+import json
+import unittest
+import subprocess
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# slow to import and only needed by some commands
+HEAVY_MODULES = ["openai", "PIL", "dropbox", "plexapi", "boto3", "tiktoken", "rq", "mastodon", "pytube", "bs4",
+                 "mistune", "pygments"]
+
+
+class ImportTimeTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def loaded_modules(self, command: str = None) -> list:
+        # a fresh interpreter, so nothing the other tests imported counts
+        code = (
+            "import sys, json\n"
+            "from mastodon_bot.app import cli\n"
+            f"if {command!r}: cli.get_command(None, {command!r})\n"
+            f"print(json.dumps([module for module in {HEAVY_MODULES!r} if module in sys.modules]))\n"
+        )
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([SRC_DIR, os.environ.get("PYTHONPATH", "")]))
+        output = subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True)
+        return json.loads(output.stdout.strip().splitlines()[-1])
+
+    def test_app_imports_no_heavy_modules(self):
+        self.assertEqual(self.loaded_modules(), [])
+
+    def test_commands_import_only_what_they_use(self):
+        self.assertEqual(self.loaded_modules("init"), [])
+        self.assertEqual(self.loaded_modules("post"), ["mastodon"])
+        self.assertEqual(self.loaded_modules("get"), ["boto3"])
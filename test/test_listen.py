@@ -0,0 +1,51 @@
+import unittest
+from unittest.mock import patch, Mock
+
+
+
+class ListenTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def test_duplicate_events_respond_once(self):
+
+        from mastodon_bot.commands.listen import Listener
+
+        status = {
+            "id": 2,
+            "in_reply_to_id": None,
+            "content": "<p>@bot hello</p>",
+            "media_attachments": [],
+            "account": {"bot": False},
+        }
+        notification = {"type": "mention", "status": status, "account": {"bot": False}}
+
+        with patch('mastodon_bot.commands.listen.listener_respond') as mock_respond:
+            listener = Listener()
+            listener.on_update(status)
+            listener.on_notification(notification)
+
+            mock_respond.assert_called_once()
+
+    def test_claim_statuses(self):
+
+        from mastodon_bot.lib.listen.status_dedupe import claim_statuses
+
+        redis_conn = Mock()
+        redis_conn.pipeline.return_value.execute.return_value = [True, None]
+
+        self.assertEqual(claim_statuses(redis_conn, [1, 1], ttl_seconds=60), [True, False])
+        redis_conn.pipeline.return_value.set.assert_called_with(
+            "mastodon_bot:listen:claimed:1", 1, nx=True, ex=60)
+
+    def test_async_ingest_requires_redis(self):
+
+        from click.testing import CliRunner
+        from mastodon_bot.commands.listen import listen
+
+        result = CliRunner().invoke(listen, ["https://example.social", "id", "secret", "token",
+                                             "--ingest-mode", "async"])
+
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn("rq_redis_connection", result.output)
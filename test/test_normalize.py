@@ -0,0 +1,40 @@
+import unittest
+
+
+class NormalizeTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def legacy_normalize(self, content):
+        from mastodon_bot.util import filter_words, remove_word, extract_uris
+
+        filtered_content = content
+        for word in filter_words(content, "@"):
+            filtered_content = remove_word(string=filtered_content, word=word)
+        return filtered_content, extract_uris(content=filtered_content)
+
+    def test_normalize_status_matches_filter_and_remove(self):
+        from mastodon_bot.normalize import normalize_status
+
+        contents = [
+            "@bot@mastodon.social   can you read\nhttps://example.com/a/b.txt and (ftp://files.example.org/x) #python",
+            "no mentions here,\n\n  just https://example.com/page?id=1&x=2 #tts",
+            "@bot @bot twice, then @someone@example.social",
+            "",
+        ]
+        for content in contents:
+            status = normalize_status(content)
+            text, uris = self.legacy_normalize(content)
+
+            self.assertEqual(status.text, text)
+            self.assertEqual(status.uris, uris)
+
+    def test_normalize_status_strips_mentions(self):
+        from mastodon_bot.normalize import normalize_status
+
+        status = normalize_status("@bot@mastodon.social say this #tts https://example.com/#anchor")
+
+        self.assertEqual(status.content, "@bot@mastodon.social say this #tts https://example.com/#anchor")
+        self.assertEqual(status.text, "say this #tts https://example.com/#anchor")
+        self.assertEqual(status.uris, ["https://example.com/"])
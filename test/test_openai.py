@@ -0,0 +1,177 @@
+import unittest
+from unittest.mock import patch, Mock, MagicMock
+
+
+
+class OpenAiChatTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.encoding = Mock()
+        self.encoding.encode.side_effect = lambda text: text.split()
+        return super().setUp()
+
+    def new_chat(self):
+        from mastodon_bot.external.openai import OpenAiChat
+
+        with patch('mastodon_bot.external.openai.encodings.for_model', return_value=self.encoding):
+            return OpenAiChat(openai_api_key="test", persona="Be helpful")
+
+    def test_message_tokens_are_cached(self):
+
+        chat = self.new_chat()
+        messages = chat.init_messages(prompt="one two three")
+        encode_calls = self.encoding.encode.call_count
+
+        self.assertEqual(messages[1]["tokens"], 4 + 1 + 3)
+        self.assertEqual(chat.num_tokens_from_messages(messages), (4 + 1 + 2) + (4 + 1 + 3) + 2)
+        self.assertEqual(chat.num_tokens_from_messages(messages), (4 + 1 + 2) + (4 + 1 + 3) + 2)
+        self.assertEqual(self.encoding.encode.call_count, encode_calls)
+
+    def test_persona_tokens_are_counted_once(self):
+
+        chat = self.new_chat()
+        chat.init_messages(prompt="one")
+        encode_calls = self.encoding.encode.call_count
+        chat.init_messages(prompt="two")
+
+        # only the role of the system message and the new prompt are encoded
+        self.assertEqual(self.encoding.encode.call_count, encode_calls + 3)
+
+    def test_conversation_backend_uses_given_redis_client(self):
+        from mastodon_bot.external.openai import OpenAiChat
+
+        redis_client = Mock()
+        with patch('mastodon_bot.external.openai.encodings.for_model', return_value=self.encoding), \
+                patch('mastodon_bot.external.openai.Redis') as mock_redis:
+            chat = OpenAiChat(openai_api_key="test", redis_connection="redis://localhost:6379/0",
+                              redis_client=redis_client, context_backend="conversation")
+
+        self.assertIs(chat.context.redis_client, redis_client)
+        mock_redis.from_url.assert_not_called()
+
+    def test_reduce_messages_drops_oldest_turns(self):
+
+        chat = self.new_chat()
+        messages = chat.init_messages(prompt="first question")
+        chat.append_response(messages, "first answer")
+        chat.append_prompt(messages, "second question")
+        chat.append_response(messages, "second answer")
+
+        # each message here is 7 tokens, plus 2 for the reply primer
+        cur_tokens, mod_tokens = chat.reduce_messages(messages, max_tokens=7 * 3 + 2)
+
+        self.assertEqual(cur_tokens, 7 * 5 + 2)
+        self.assertEqual(mod_tokens, 7 * 3 + 2)
+        self.assertEqual([m["content"] for m in messages],
+                         ["Be helpful", "second question", "second answer"])
+
+    def test_to_api_messages(self):
+
+        chat = self.new_chat()
+        messages = chat.init_messages(prompt="hello")
+
+        self.assertEqual(chat.to_api_messages(messages), [
+            {"role": "system", "content": "Be helpful"},
+            {"role": "user", "content": "hello"},
+        ])
+
+    def test_save_messages_appends_to_conversation_context(self):
+
+        chat = self.new_chat()
+        chat.context = MagicMock()
+        messages = chat.init_messages(prompt="first question")
+        chat.append_response(messages, "first answer")
+
+        chat.save_messages(convo_id="1", messages=messages, is_new=True)
+        chat.context.__setitem__.assert_called_once_with("1", messages)
+
+        chat.append_prompt(messages, "second question")
+        chat.append_response(messages, "second answer")
+        chat.save_messages(convo_id="1", messages=messages, is_new=False)
+        chat.context.append.assert_called_once_with("1", messages[-2], messages[-1])
+
+    def test_create_uses_response_cache_for_new_conversations(self):
+
+        chat = self.new_chat()
+        chat.context = {}
+        chat.response_cache = Mock()
+        chat.response_cache.applies.return_value = True
+        chat.response_cache.get.return_value = "cached answer"
+
+        mock_chat = MagicMock()
+        # pass new so patch doesn't inspect openai's lazily created client
+        with patch('mastodon_bot.external.openai.openai.chat', new=mock_chat):
+            result = chat.create(prompt="what can you do?", convo_id="1")
+
+        self.assertEqual(result, "cached answer")
+        mock_chat.completions.create.assert_not_called()
+        chat.response_cache.get.assert_called_once_with("Be helpful", chat.model, 0, "what can you do?")
+        # the conversation still has its context for a follow up
+        self.assertEqual(chat.context["1"][-1]["content"], "cached answer")
+
+        chat.response_cache.get.reset_mock()
+        completion = Mock()
+        completion.choices = [Mock(message=Mock(content="follow up answer"))]
+        mock_chat.completions.create.return_value = completion
+        with patch('mastodon_bot.external.openai.openai.chat', new=mock_chat):
+            result = chat.create(prompt="and then?", convo_id="1")
+
+        self.assertEqual(result, "follow up answer")
+        chat.response_cache.get.assert_not_called()
+        chat.response_cache.put.assert_not_called()
+
+    def test_create_stream_saves_context_at_end(self):
+
+        chat = self.new_chat()
+        chat.context = {}
+
+        chunks = [Mock(choices=[Mock(delta=Mock(content=content))]) for content in ["Hello", None, " there"]]
+        chunks.append(Mock(choices=[]))
+        mock_chat = MagicMock()
+        mock_chat.completions.create.return_value = iter(chunks)
+
+        with patch('mastodon_bot.external.openai.openai.chat', new=mock_chat):
+            stream = chat.create_stream(prompt="hi", convo_id="1")
+            self.assertEqual(next(stream), "Hello")
+            self.assertNotIn("1", chat.context)
+            self.assertEqual(list(stream), [" there"])
+
+        self.assertTrue(mock_chat.completions.create.call_args.kwargs["stream"])
+        self.assertEqual([message["content"] for message in chat.context["1"]], ["Be helpful", "hi", "Hello there"])
+
+
+class OpenAiTranscribeTestHandler(unittest.TestCase):
+
+    def test_create_segmented_in_order(self):
+        from mastodon_bot.external.openai import OpenAiTranscribe
+        from contextlib import contextmanager
+
+        @contextmanager
+        def fake_segments(audio_file, segment_seconds):
+            yield ["segment_0", "segment_1", "segment_2"]
+
+        transcribe = OpenAiTranscribe(openai_api_key="key")
+        with patch('mastodon_bot.external.openai.audio_segments', side_effect=fake_segments), \
+                patch.object(transcribe, 'create', side_effect=lambda segment: f" text of {segment} "):
+            result = transcribe.create_segmented("audio.mp3", segment_seconds=10, max_workers=2)
+
+        self.assertEqual(result, "text of segment_0 text of segment_1 text of segment_2")
+
+    def test_create_with_retry(self):
+        from mastodon_bot.external.openai import OpenAiTranscribe
+        import openai
+
+        transcribe = OpenAiTranscribe(openai_api_key="key")
+        error = openai.APIConnectionError(request=Mock())
+        with patch.object(transcribe, 'create', side_effect=[error, error, "text"]) as mock_create, \
+                patch('mastodon_bot.external.openai.time.sleep') as mock_sleep:
+            result = transcribe.create_with_retry("segment_0", max_attempts=3, backoff_seconds=1)
+
+        self.assertEqual(result, "text")
+        self.assertEqual(mock_create.call_count, 3)
+        self.assertEqual([call.args[0] for call in mock_sleep.call_args_list], [1, 2])
+
+        with patch.object(transcribe, 'create', side_effect=error), \
+                patch('mastodon_bot.external.openai.time.sleep'):
+            with self.assertRaises(openai.APIConnectionError):
+                transcribe.create_with_retry("segment_0", max_attempts=2)
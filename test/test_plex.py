@@ -0,0 +1,138 @@
+import os
+import json
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import Mock, patch
+from mastodon_bot.lib.plex.watermark import PlexWatermark, RedisWatermarkStore, FileWatermarkStore
+from fake_redis import FakeRedis
+
+
+def media_item(key, added_at):
+    item = Mock()
+    item.key = key
+    item.title = key
+    item.addedAt = added_at
+    return item
+
+
+class PlexWatermarkTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def test_is_new_and_advance(self):
+        watermark = PlexWatermark()
+        self.assertTrue(watermark.is_new(100.0, "/library/metadata/1"))
+
+        watermark.advance(100.0, "/library/metadata/1")
+        self.assertFalse(watermark.is_new(100.0, "/library/metadata/1"))
+        self.assertFalse(watermark.is_new(99.0, "/library/metadata/9"))
+        # added in the same second as the last item posted
+        self.assertTrue(watermark.is_new(100.0, "/library/metadata/2"))
+
+        watermark.advance(100.0, "/library/metadata/2")
+        watermark.advance(101.0, "/library/metadata/3")
+        self.assertEqual(watermark.to_dict(), {"added_at": 101.0, "keys": ["/library/metadata/3"]})
+
+    def test_file_store_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = FileWatermarkStore(os.path.join(directory, "state", "plex.json"))
+            self.assertIsNone(store.load())
+
+            store.save(PlexWatermark(100.0, ["/library/metadata/1", "/library/metadata/2"]))
+            watermark = store.load()
+
+            self.assertEqual(watermark.added_at, 100.0)
+            self.assertEqual(watermark.keys, {"/library/metadata/1", "/library/metadata/2"})
+            self.assertEqual(os.listdir(os.path.join(directory, "state")), ["plex.json"])
+
+    def test_file_store_ignores_unreadable_state(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "plex.json")
+            with open(path, "w") as file:
+                file.write("{not json")
+
+            self.assertIsNone(FileWatermarkStore(path).load())
+
+    def test_redis_store_round_trip(self):
+        redis_client = FakeRedis()
+        store = RedisWatermarkStore(redis_client, server="server-id")
+        self.assertIsNone(store.load())
+
+        store.save(PlexWatermark(100.0, ["/library/metadata/1"]))
+
+        self.assertEqual(json.loads(redis_client.store["mastodon_bot:plex:watermark:server-id"]),
+                         {"added_at": 100.0, "keys": ["/library/metadata/1"]})
+        self.assertEqual(store.load().keys, {"/library/metadata/1"})
+
+    @patch("plexapi.server.PlexServer")
+    def test_get_recently_added_past_watermark(self, mock_server):
+        from mastodon_bot.external.plex import PlexInstance
+
+        first = datetime(2023, 9, 1, 12, 0, 0)
+        second = datetime(2023, 9, 1, 12, 0, 5)
+        mock_server.return_value.library.recentlyAdded.return_value = [
+            media_item("/library/metadata/3", second),
+            media_item("/library/metadata/2", first),
+            media_item("/library/metadata/1", first),
+        ]
+
+        plex_instance = PlexInstance(plex_host="http://plex", plex_token="token", plex_server_id="server-id")
+        watermark = PlexWatermark(first.timestamp(), ["/library/metadata/1"])
+        recently_added = plex_instance.get_recently_added(hours_since=24, watermark=watermark)
+
+        self.assertEqual([item.get_key() for item in recently_added],
+                         ["/library/metadata/2", "/library/metadata/3"])
+
+    @patch("mastodon_bot.external.plex.copy_remote_file_stream")
+    @patch("mastodon_bot.external.plex.open_remote_file_stream")
+    def test_poster_download_is_capped(self, mock_open_stream, mock_copy_stream):
+        from mastodon_bot.external.plex import PlexRecentlyAddedItem, POSTER_MAX_BYTES
+
+        mock_open_stream.return_value = (Mock(), ".png")
+        mock_copy_stream.side_effect = lambda response, out_file, max_bytes: out_file.write(b"poster")
+
+        item = PlexRecentlyAddedItem(Mock(posterUrl="http://plex/poster"), server_id="server-id")
+
+        self.assertEqual(item.get_poster_image_data(), b"poster")
+        mock_open_stream.assert_called_once_with("http://plex/poster", max_bytes=POSTER_MAX_BYTES)
+        self.assertEqual(mock_copy_stream.call_args.kwargs["max_bytes"], POSTER_MAX_BYTES)
+
+    @patch("mastodon_bot.external.plex.PlexInstance")
+    def test_handle_plex_post_advances_watermark(self, mock_plex_instance):
+        from mastodon_bot.commands.post import handle_plex_post
+
+        items = []
+        for index in range(4):
+            item = Mock()
+            item.get_added_at.return_value = 100.0 + index
+            item.get_key.return_value = f"/library/metadata/{index}"
+            item.get_description.return_value = f"item {index}"
+            items.append(item)
+        mock_plex_instance.return_value.get_recently_added.return_value = items
+
+        mastodon_api = Mock()
+        mastodon_api.media_post.side_effect = lambda **kwargs: {"id": kwargs["file_name"]}
+        mastodon_api.status_post.side_effect = [
+            {"url": "https://example.com/1"},
+            {"url": "https://example.com/2"},
+            Exception("rate limited"),
+        ]
+        for index, item in enumerate(items):
+            item.get_post_image_file_name.return_value = f"poster-{index}.png"
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = FileWatermarkStore(os.path.join(directory, "plex.json"))
+            result = []
+            with self.assertRaises(Exception):
+                handle_plex_post("http://plex", "token", "server-id", result, mastodon_api,
+                                 watermark_store=store, max_workers=2)
+
+            self.assertEqual(result, ["https://example.com/1", "https://example.com/2"])
+            # only the item being posted was uploaded, not the ones downloaded ahead of it
+            self.assertEqual([call.kwargs["file_name"] for call in mastodon_api.media_post.call_args_list],
+                             ["poster-0.png", "poster-1.png", "poster-2.png"])
+            # the first run has no watermark, so falls back to the time window
+            self.assertIsNone(mock_plex_instance.return_value.get_recently_added.call_args.kwargs["watermark"])
+            self.assertEqual(store.load().to_dict(), {"added_at": 101.0, "keys": ["/library/metadata/1"]})
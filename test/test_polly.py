@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import patch, Mock
+from unittest.mock import Mock
 
 
 
@@ -24,4 +24,74 @@ class PollyTestHandler(unittest.TestCase):
 
 
 
-#
\ No newline at end of file
+#
+
+class PollySynthesizerTestHandler(unittest.TestCase):
+
+    def test_split_text_on_sentences(self):
+        from mastodon_bot.lib.polly.synthesizer import split_text
+
+        text = "One two three. Four five six! Seven eight nine? " + "x" * 25
+
+        chunks = split_text(text, max_chars=20)
+
+        self.assertEqual(chunks, ["One two three.", "Four five six!", "Seven eight nine?", "x" * 20, "x" * 5])
+
+    def test_split_ssml_repeats_wrapping_tags(self):
+        from mastodon_bot.lib.polly.synthesizer import split_ssml, billed_characters
+
+        ssml = ('<speak><amazon:domain name="news"><p>First sentence here.</p><break time="1s"/>'
+                '<p>Second sentence here.</p></amazon:domain></speak>')
+
+        chunks = split_ssml(ssml, max_chars=25)
+
+        self.assertEqual(chunks, [
+            '<speak><amazon:domain name="news"><p>First sentence here.</p> <break time="1s"/></amazon:domain></speak>',
+            '<speak><amazon:domain name="news"><p>Second sentence here.</p></amazon:domain></speak>',
+        ])
+        self.assertTrue(all(billed_characters(chunk, True) <= 25 for chunk in chunks))
+
+    def test_split_ssml_keeps_speak_attributes(self):
+        from mastodon_bot.lib.polly.synthesizer import split_ssml
+
+        ssml = '<speak xml:lang="fr-FR"><p>Première phrase ici.</p><p>Deuxième phrase ici.</p></speak>'
+
+        chunks = split_ssml(ssml, max_chars=25)
+
+        self.assertEqual(chunks, [
+            '<speak xml:lang="fr-FR"><p>Première phrase ici.</p></speak>',
+            '<speak xml:lang="fr-FR"><p>Deuxième phrase ici.</p></speak>',
+        ])
+
+    def test_synthesize_chunks_in_order(self):
+        from mastodon_bot.lib.polly.synthesizer import PollySynthesizer
+
+        frame = b'\xff\xfb\x90\x00' + b'\x00' * 413
+
+        wrapper = Mock()
+        wrapper.is_valid_sml.return_value = False
+        wrapper.decide_engine.return_value = "neural"
+        wrapper.synthesize.side_effect = lambda chunk, format_type, voice_id, engine: frame[:4] + chunk[:1].encode() * 413
+
+        synthesizer = PollySynthesizer(wrapper, max_workers=3, chunk_chars=1500)
+        text = " ".join(f"{letter * 1000}." for letter in "abcd")
+
+        audio = synthesizer.synthesize(text, voice_id="Brian")
+
+        self.assertEqual(wrapper.synthesize.call_count, 4)
+        self.assertEqual(wrapper.decide_engine.call_count, 1)
+        self.assertEqual(audio, b''.join(frame[:4] + letter.encode() * 413 for letter in "abcd"))
+
+    def test_synthesize_short_text_whole(self):
+        from mastodon_bot.lib.polly.synthesizer import PollySynthesizer
+
+        wrapper = Mock()
+        wrapper.is_valid_sml.return_value = False
+        wrapper.decide_engine.return_value = "standard"
+        wrapper.synthesize.return_value = b'audio'
+
+        audio = PollySynthesizer(wrapper).synthesize("Hello there.", voice_id="Brian")
+
+        self.assertEqual(audio, b'audio')
+        wrapper.synthesize.assert_called_once_with("Hello there.", format_type="mp3", voice_id="Brian",
+                                                   engine="standard")
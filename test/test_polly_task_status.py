@@ -0,0 +1,79 @@
+import time
+import unittest
+from unittest.mock import patch, Mock
+
+
+
+class PollyTaskStatusTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mastodon_bot.lib.listen.listener_config import ListenerConfig
+
+        self.config = ListenerConfig(rq_redis_connection="redis://localhost:6379/0", rq_queue_name="default",
+                                     mastodon_s3_bucket_name="bucket", mastodon_s3_bucket_prefix_path="audio/")
+        return super().setUp()
+
+    def test_next_delay_is_exponential_then_linear(self):
+        from mastodon_bot.lib.rq.polly_task_status import next_delay
+
+        self.assertEqual([next_delay(attempt) for attempt in range(7)], [2, 4, 8, 16, 30, 30, 30])
+
+    def test_in_progress_reschedules(self):
+        from mastodon_bot.lib.rq import polly_task_status
+
+        polly = Mock()
+        polly.get_task.return_value = {'TaskStatus': 'inProgress'}
+        s3 = Mock()
+
+        with patch.object(polly_task_status.registry, 'get_polly', return_value=polly), \
+                patch.object(polly_task_status.registry, 'get_s3', return_value=s3), \
+                patch.object(polly_task_status.registry, 'get_mastodon', return_value=Mock()), \
+                patch.object(polly_task_status, 'schedule_polly_status_job') as mock_schedule:
+            started_at = time.time() - 10
+            polly_task_status.polly_status_job("1", "task", self.config, attempt=2, started_at=started_at)
+
+        mock_schedule.assert_called_once_with(self.config, "1", "task", attempt=3, started_at=started_at)
+        s3.get_file.assert_not_called()
+
+    def test_completed_downloads_once_and_records_latency(self):
+        from mastodon_bot.lib.rq import polly_task_status
+        from mastodon_bot.external.s3 import s3Wrapper
+
+        polly = Mock()
+        polly.get_task.return_value = {
+            'TaskStatus': 'completed',
+            'OutputUri': 'https://s3.us-east-1.amazonaws.com/bucket/audio/.task.mp3'
+        }
+        s3 = Mock()
+        s3.key_from_uri.side_effect = lambda uri: s3Wrapper.key_from_uri(Mock(bucket_name="bucket"), uri)
+        s3.file_exists.return_value = True
+        s3.get_file.return_value = b'audio'
+        mastodon_api = Mock()
+        mastodon_api.media_post.return_value = {"id": 7}
+        job = Mock(meta={})
+
+        with patch.object(polly_task_status.registry, 'get_polly', return_value=polly), \
+                patch.object(polly_task_status.registry, 'get_s3', return_value=s3), \
+                patch.object(polly_task_status.registry, 'get_mastodon', return_value=mastodon_api), \
+                patch.object(polly_task_status, 'get_current_job', return_value=job), \
+                patch.object(polly_task_status, 'schedule_polly_status_job') as mock_schedule:
+            latency = polly_task_status.polly_status_job("1", "task", self.config, attempt=4,
+                                                         started_at=time.time() - 20)
+
+        s3.file_exists.assert_called_once_with("audio/.task.mp3", apply_prefix=False)
+        s3.get_file.assert_called_once_with("audio/.task.mp3", apply_prefix=False)
+        mock_schedule.assert_not_called()
+        self.assertGreaterEqual(latency, 20)
+        self.assertEqual(job.meta["polly_status_checks"], 5)
+        self.assertEqual(job.meta["polly_completion_latency"], latency)
+        job.save_meta.assert_called_once()
+        self.assertEqual(mastodon_api.status_post.call_args.kwargs["media_ids"], [7])
+
+    def test_key_from_uri(self):
+        from mastodon_bot.external.s3 import s3Wrapper
+
+        wrapper = Mock(bucket_name="bucket")
+
+        self.assertEqual(s3Wrapper.key_from_uri(wrapper, "https://s3.us-east-1.amazonaws.com/bucket/a/b.mp3"), "a/b.mp3")
+        self.assertEqual(s3Wrapper.key_from_uri(wrapper, "https://bucket.s3.amazonaws.com/a/b.mp3"), "a/b.mp3")
+        self.assertEqual(s3Wrapper.key_from_uri(wrapper, "s3://bucket/a/b.mp3"), "a/b.mp3")
@@ -0,0 +1,51 @@
+import unittest
+from unittest.mock import patch, Mock, MagicMock
+
+
+class PreloadingWorkerTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def new_worker(self):
+        from rq import Queue
+        from mastodon_bot.lib.rq.preloading_worker import PreloadingWorker
+
+        connection = MagicMock()
+        return PreloadingWorker([Queue("test", connection=connection)], connection=connection)
+
+    def test_preload_times_each_module(self):
+        from mastodon_bot.lib.rq.preloading_worker import preload
+
+        with patch('mastodon_bot.lib.rq.preloading_worker.encodings.warm', side_effect=Exception("offline")):
+            timings = preload(("json", "csv"))
+
+        self.assertEqual(list(timings), ["json", "csv", "tiktoken encodings", "pygments lexers"])
+        self.assertTrue(all(seconds >= 0 for seconds in timings.values()))
+
+    def test_perform_job_logs_fork_overhead(self):
+        from rq import Worker
+
+        worker = self.new_worker()
+        job = Mock(id="job-1")
+
+        with patch.object(Worker, 'fork_work_horse'):
+            worker.fork_work_horse(job, None)
+
+        with patch.object(Worker, 'perform_job', return_value=True) as mock_perform, \
+                self.assertLogs(level="INFO") as logs:
+            self.assertTrue(worker.perform_job(job, None))
+
+        mock_perform.assert_called_once_with(job, None)
+        self.assertIn("job job-1 started", logs.output[0])
+
+    def test_perform_job_without_fork(self):
+        from rq import Worker
+
+        worker = self.new_worker()
+        job = Mock(id="job-1")
+
+        with patch.object(Worker, 'perform_job', return_value=True) as mock_perform:
+            self.assertTrue(worker.perform_job(job, None))
+
+        mock_perform.assert_called_once_with(job, None)
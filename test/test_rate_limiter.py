@@ -0,0 +1,143 @@
+import threading
+import unittest
+from unittest.mock import patch, Mock
+from fake_redis import FakeRedis
+
+
+class RateLimiterTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def test_take_token(self):
+        from mastodon_bot.lib.clients.rate_limiter import take_token
+
+        state, wait = take_token({}, now=100.0, default_limit=2, window_seconds=60)
+        self.assertEqual((state, wait), ({"tokens": 1.0, "reset": 160.0, "limit": 2}, 0.0))
+
+        state, wait = take_token(state, now=110.0)
+        self.assertEqual((state["tokens"], wait), (0.0, 0.0))
+
+        state, wait = take_token(state, now=120.0)
+        self.assertEqual((state["tokens"], wait), (0.0, 40.0))
+
+        # refilled once the reset has passed
+        state, wait = take_token(state, now=161.0, window_seconds=60)
+        self.assertEqual((state, wait), ({"tokens": 1.0, "reset": 221.0, "limit": 2}, 0.0))
+
+    def test_sync_state(self):
+        from mastodon_bot.lib.clients.rate_limiter import sync_state
+
+        state = {"tokens": 10.0, "reset": 200.0, "limit": 300}
+
+        # same window, the lower count wins
+        self.assertEqual(sync_state(state, remaining=20, reset=200.0, limit=300)["tokens"], 10.0)
+        self.assertEqual(sync_state(state, remaining=5, reset=200.0, limit=300)["tokens"], 5.0)
+        # a later reset is a new window
+        self.assertEqual(sync_state(state, remaining=299, reset=500.0, limit=300),
+                         {"tokens": 299.0, "reset": 500.0, "limit": 300})
+
+    def test_limiter_waits_for_reset(self):
+        from mastodon_bot.lib.clients import rate_limiter
+
+        limiter = rate_limiter.MastodonRateLimiter(FakeRedis(), account="https://example.social:token")
+        now = [1000.0]
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        with patch.object(rate_limiter.time, 'time', side_effect=lambda: now[0]), \
+                patch.object(rate_limiter.time, 'sleep', side_effect=sleep):
+            limiter.sync("statuses", remaining=1, reset=1030.0, limit=300)
+
+            self.assertEqual(limiter.acquire("statuses"), 0.0)
+            self.assertEqual(limiter.acquire("statuses"), 30.0)
+
+        self.assertEqual(limiter.waited_seconds, 30.0)
+        self.assertNotIn("token", "".join(limiter.redis_client.store.keys()))
+
+    def test_rate_limit_from_headers(self):
+        from mastodon_bot.lib.clients.rate_limiter import rate_limit_from_headers
+
+        self.assertIsNone(rate_limit_from_headers({}))
+        self.assertEqual(rate_limit_from_headers({"X-RateLimit-Remaining": "5", "X-RateLimit-Limit": "300",
+                                                  "X-RateLimit-Reset": "2000"}), (5, 2000.0, 300))
+
+        # an iso reset, moved onto our clock by how far the server's Date is behind it
+        headers = {"X-RateLimit-Remaining": "4", "X-RateLimit-Limit": "300",
+                   "X-RateLimit-Reset": "2023-09-01T12:05:00.000Z", "Date": "Fri, 01 Sep 2023 12:00:00 GMT"}
+        self.assertEqual(rate_limit_from_headers(headers, now=1000.0), (4, 1300.0, 300))
+
+    def test_rate_limited_mastodon(self):
+        from mastodon_bot.lib.clients.rate_limiter import RateLimitedMastodon
+
+        mastodon_api = Mock()
+        mastodon_api.session.hooks = {"response": []}
+
+        def status_post(*args, **kwargs):
+            response = Mock(headers={"X-RateLimit-Remaining": "5", "X-RateLimit-Limit": "300",
+                                     "X-RateLimit-Reset": "2000"})
+            for hook in mastodon_api.session.hooks["response"]:
+                hook(response)
+            return {"id": 1}
+        mastodon_api.status_post.side_effect = status_post
+        limiter = Mock()
+
+        client = RateLimitedMastodon(mastodon_api, limiter)
+        toot = client.status_post("hello", visibility="private")
+        client.status_context(1)
+
+        self.assertEqual(toot, {"id": 1})
+        limiter.acquire.assert_called_once_with("statuses")
+        limiter.sync.assert_called_once_with("statuses", remaining=5, reset=2000.0, limit=300)
+        mastodon_api.status_post.assert_called_once_with("hello", visibility="private")
+        mastodon_api.status_context.assert_called_once_with(1)
+
+    def test_rate_limited_mastodon_syncs_from_its_own_response(self):
+        from mastodon_bot.lib.clients.rate_limiter import RateLimitedMastodon
+
+        mastodon_api = Mock()
+        mastodon_api.session.hooks = {"response": []}
+        first_sent, second_done = threading.Event(), threading.Event()
+
+        def respond(remaining):
+            response = Mock(headers={"X-RateLimit-Remaining": str(remaining), "X-RateLimit-Limit": "300",
+                                     "X-RateLimit-Reset": "2000"})
+            for hook in mastodon_api.session.hooks["response"]:
+                hook(response)
+
+        def status_post(text):
+            if text == "first":
+                respond(10)
+                first_sent.set()
+                # another thread's response lands before this call returns
+                second_done.wait(5)
+            else:
+                first_sent.wait(5)
+                respond(3)
+                second_done.set()
+            return {"id": text}
+        mastodon_api.status_post.side_effect = status_post
+        limiter = Mock()
+
+        client = RateLimitedMastodon(mastodon_api, limiter)
+        threads = [threading.Thread(target=client.status_post, args=(text,)) for text in ("first", "second")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertCountEqual([call.kwargs["remaining"] for call in limiter.sync.call_args_list], [10, 3])
+
+    def test_rate_limited_mastodon_without_headers(self):
+        from mastodon_bot.lib.clients.rate_limiter import RateLimitedMastodon
+
+        mastodon_api = Mock()
+        mastodon_api.media_post.return_value = {"id": 2}
+        limiter = Mock()
+
+        client = RateLimitedMastodon(mastodon_api, limiter)
+
+        self.assertEqual(client.media_post(b"image", mime_type="image/png"), {"id": 2})
+        limiter.acquire.assert_called_once_with("media")
+        limiter.sync.assert_not_called()
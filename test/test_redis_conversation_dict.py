@@ -0,0 +1,79 @@
+import json
+import unittest
+from fake_redis import FakeRedis
+from mastodon_bot.redis_conversation_dict import redis_conversation_dict
+
+HEAD_KEY = "mastodon_bot:chat:persona:100:head"
+TURNS_KEY = "mastodon_bot:chat:persona:100:turns"
+
+
+class RedisConversationDictTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.redis_client = FakeRedis()
+        self.context = redis_conversation_dict(self.redis_client, "mastodon_bot:chat:persona",
+                                               max_age_hours=2, max_messages=3)
+        return super().setUp()
+
+    def test_requires_redis_client(self):
+        with self.assertRaises(Exception):
+            redis_conversation_dict(None, "mastodon_bot:chat:persona")
+
+    def test_set_splits_head_from_turns(self):
+        messages = [
+            {"role": "system", "content": "Be helpful"},
+            {"role": "user", "content": "hello"},
+            {"role": "assistant", "content": "hi"},
+        ]
+        self.context["100"] = messages
+
+        self.assertEqual(json.loads(self.redis_client.store[HEAD_KEY]), messages[:1])
+        self.assertEqual([json.loads(turn) for turn in self.redis_client.store[TURNS_KEY]], messages[1:])
+        self.assertEqual(self.context["100"], messages)
+
+        # setting again replaces the conversation rather than adding to it
+        self.context["100"] = messages[1:]
+        self.assertNotIn(HEAD_KEY, self.redis_client.store)
+        self.assertEqual(self.context["100"], messages[1:])
+
+    def test_append_trims_to_window(self):
+        self.context["100"] = [{"role": "system", "content": "Be helpful"}, {"role": "user", "content": "1"}]
+        self.context.append("100", {"role": "assistant", "content": "2"}, {"role": "user", "content": "3"})
+        self.context.append("100", {"role": "assistant", "content": "4"})
+
+        # the persona is kept apart from the window of the last max_messages turns
+        self.assertEqual([message["content"] for message in self.context["100"]], ["Be helpful", "2", "3", "4"])
+        self.assertEqual(self.redis_client.llen(TURNS_KEY), 3)
+
+    def test_expires_per_conversation(self):
+        self.context["100"] = [{"role": "system", "content": "Be helpful"}, {"role": "user", "content": "hello"}]
+        self.context["200"] = [{"role": "user", "content": "other"}]
+
+        self.assertEqual(self.redis_client.ttl(HEAD_KEY), 2 * 60 * 60)
+        self.assertEqual(self.redis_client.ttl(TURNS_KEY), 2 * 60 * 60)
+
+        self.redis_client.expiries[TURNS_KEY] = 60
+        self.context.append("100", {"role": "assistant", "content": "hi"})
+        # appending refreshes the conversation's own expiry
+        self.assertEqual(self.redis_client.ttl(TURNS_KEY), 2 * 60 * 60)
+
+    def test_missing_conversation(self):
+        with self.assertRaises(KeyError):
+            self.context["404"]
+
+        with self.assertRaises(KeyError):
+            del self.context["404"]
+
+        self.assertNotIn("404", self.context)
+
+    def test_keys(self):
+        self.context["100"] = [{"role": "system", "content": "Be helpful"}, {"role": "user", "content": "hello"}]
+        self.context["200:1"] = [{"role": "user", "content": "other"}]
+        self.redis_client.set("mastodon_bot:chat:other_persona:300:turns", "[]")
+
+        self.assertEqual(sorted(self.context.keys()), ["100", "200:1"])
+        self.assertEqual(len(self.context), 2)
+        self.assertIn("100", self.context)
+
+        del self.context["100"]
+        self.assertEqual(self.context.keys(), ["200:1"])
@@ -0,0 +1,51 @@
+import unittest
+from unittest.mock import patch
+from fake_redis import FakeRedis
+
+
+class ChatResponseCacheTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def test_normalize_prompt(self):
+        from mastodon_bot.lib.chat.response_cache import normalize_prompt
+
+        self.assertEqual(normalize_prompt("  What can   you DO? "), "what can you do")
+        self.assertEqual(normalize_prompt("what can you do"), "what can you do")
+
+    def test_get_put_and_stats(self):
+        from mastodon_bot.lib.chat.response_cache import ChatResponseCache
+
+        cache = ChatResponseCache(FakeRedis())
+
+        self.assertIsNone(cache.get("Be helpful", "gpt-3.5-turbo", 0, "What can you do?"))
+        cache.put("Be helpful", "gpt-3.5-turbo", 0, "What can you do?", "Lots")
+
+        self.assertEqual(cache.get("Be helpful", "gpt-3.5-turbo", 0, "what can you do"), "Lots")
+        self.assertIsNone(cache.get("Be terse", "gpt-3.5-turbo", 0, "what can you do"))
+        self.assertIsNone(cache.get("Be helpful", "gpt-3.5-turbo", 0.2, "what can you do"))
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 3})
+
+    def test_evicts_least_recently_used(self):
+        from mastodon_bot.lib.chat.response_cache import ChatResponseCache
+
+        cache = ChatResponseCache(FakeRedis(), max_entries=2)
+        times = iter([1000.0, 1001.0, 1002.0, 1003.0])
+
+        with patch('mastodon_bot.lib.chat.response_cache.time.time', side_effect=lambda: next(times)):
+            cache.put("p", "m", 0, "one", "1")
+            cache.put("p", "m", 0, "two", "2")
+            cache.get("p", "m", 0, "one")
+            cache.put("p", "m", 0, "three", "3")
+
+        responses = [value for value in cache.redis_client.store.values() if isinstance(value, bytes)]
+        self.assertEqual(sorted(responses), [b"1", b"3"])
+
+    def test_applies(self):
+        from mastodon_bot.lib.chat.response_cache import ChatResponseCache
+
+        cache = ChatResponseCache(FakeRedis(), max_temperature=0.3)
+
+        self.assertTrue(cache.applies(0))
+        self.assertFalse(cache.applies(0.7))
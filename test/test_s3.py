@@ -0,0 +1,39 @@
+import gzip
+import hashlib
+import unittest
+from unittest.mock import Mock
+from botocore.exceptions import ClientError
+
+
+
+class S3TestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mastodon_bot.external.s3 import s3Wrapper
+
+        self.wrapper = s3Wrapper(access_key_id="", access_secret_key="", bucket_name="bucket", prefix_path="unroll/")
+        self.wrapper.s3 = Mock()
+        return super().setUp()
+
+    def test_upload_compressed_to_s3(self):
+        self.wrapper.s3.head_object.side_effect = ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+
+        url = self.wrapper.upload_compressed_to_s3("<html>hello</html>")
+
+        key = f"unroll/{hashlib.sha256(b'<html>hello</html>').hexdigest()}.html"
+        self.assertEqual(url, f"https://bucket.s3.amazonaws.com/{key}")
+        kwargs = self.wrapper.s3.put_object.call_args.kwargs
+        self.assertEqual(kwargs["Key"], key)
+        self.assertEqual(kwargs["ContentEncoding"], "gzip")
+        self.assertEqual(kwargs["ContentType"], "text/html; charset=utf-8")
+        self.assertEqual(kwargs["ACL"], "public-read")
+        self.assertEqual(gzip.decompress(kwargs["Body"]), b'<html>hello</html>')
+
+    def test_upload_compressed_to_s3_skips_existing(self):
+        self.wrapper.s3.head_object.return_value = {}
+
+        first = self.wrapper.upload_compressed_to_s3("<html>hello</html>")
+        second = self.wrapper.upload_compressed_to_s3("<html>hello</html>")
+
+        self.assertEqual(first, second)
+        self.wrapper.s3.put_object.assert_not_called()
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import Mock
+from fake_redis import FakeRedis
+
+
+class SpeechCacheTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.cache_dir = tempfile.TemporaryDirectory()
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.cache_dir.cleanup()
+        return super().tearDown()
+
+    def test_cache_key(self):
+        from mastodon_bot.lib.polly.speech_cache import speech_cache_key
+
+        key = speech_cache_key("hello", "Brian", "neural", "mp3")
+
+        self.assertEqual(len(key), 64)
+        self.assertEqual(key, speech_cache_key("hello", "Brian", "neural", "mp3"))
+        self.assertNotEqual(key, speech_cache_key("hello", "Brian", "standard", "mp3"))
+        self.assertNotEqual(speech_cache_key("a|b", "c", "neural", "mp3"), speech_cache_key("a", "b|c", "neural", "mp3"))
+
+    def test_hit_skips_synthesis(self):
+        from mastodon_bot.lib.polly.speech_cache import SpeechCache
+
+        cache = SpeechCache(cache_dir=self.cache_dir.name)
+        synthesize = Mock(return_value=b'audio')
+
+        first = cache.get_or_synthesize("hello", "Brian", "neural", "mp3", synthesize)
+        second = cache.get_or_synthesize("hello", "Brian", "neural", "mp3", synthesize)
+
+        self.assertEqual((first, second), (b'audio', b'audio'))
+        synthesize.assert_called_once()
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_evicts_least_recently_used(self):
+        from mastodon_bot.lib.polly.speech_cache import SpeechCache
+
+        cache = SpeechCache(cache_dir=self.cache_dir.name, max_bytes=25)
+        cache.put_local("a", b'x' * 10)
+        cache.put_local("b", b'x' * 10)
+        os.utime(os.path.join(self.cache_dir.name, "a"), (1, 1))
+        os.utime(os.path.join(self.cache_dir.name, "b"), (2, 2))
+        cache.get_local("a")
+
+        cache.put_local("c", b'x' * 10)
+
+        self.assertEqual(sorted(os.listdir(self.cache_dir.name)), ["a", "c"])
+        self.assertEqual(cache.stats()["local_bytes"], 20)
+
+    def test_s3_tier_fills_local(self):
+        from mastodon_bot.lib.polly.speech_cache import SpeechCache, speech_cache_key
+
+        s3_wrapper = Mock()
+        s3_wrapper.get_file.return_value = b'from s3'
+        cache = SpeechCache(cache_dir=self.cache_dir.name, s3_wrapper=s3_wrapper, s3_prefix="tts/")
+        synthesize = Mock()
+
+        audio = cache.get_or_synthesize("hello", "Brian", "neural", "mp3", synthesize)
+
+        key = speech_cache_key("hello", "Brian", "neural", "mp3")
+        self.assertEqual(audio, b'from s3')
+        synthesize.assert_not_called()
+        s3_wrapper.get_file.assert_called_once_with(f"tts/{key}")
+        self.assertEqual(cache.get_local(key), b'from s3')
+
+    def test_concurrent_misses_synthesize_once(self):
+        from mastodon_bot.lib.polly.speech_cache import SpeechCache
+
+        redis_client = FakeRedis()
+        caches = [SpeechCache(cache_dir=self.cache_dir.name, redis_client=redis_client) for _ in range(4)]
+        started = threading.Barrier(4)
+        calls = []
+
+        def synthesize():
+            calls.append(1)
+            return b'audio'
+
+        def request(cache):
+            started.wait()
+            results.append(cache.get_or_synthesize("hello", "Brian", "neural", "mp3", synthesize))
+
+        results = []
+        threads = [threading.Thread(target=request, args=(cache,)) for cache in caches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [b'audio'] * 4)
+        self.assertEqual(len(calls), 1)
+
+    def test_synthesizer_uses_cache(self):
+        from mastodon_bot.lib.polly.speech_cache import SpeechCache
+        from mastodon_bot.lib.polly.synthesizer import PollySynthesizer
+
+        wrapper = Mock()
+        wrapper.is_valid_sml.return_value = False
+        wrapper.decide_engine.return_value = "neural"
+        wrapper.synthesize.return_value = b'audio'
+        synthesizer = PollySynthesizer(wrapper, speech_cache=SpeechCache(cache_dir=self.cache_dir.name))
+
+        synthesizer.synthesize("Hello there.", voice_id="Brian")
+        audio = synthesizer.synthesize("Hello there.", voice_id="Brian")
+
+        self.assertEqual(audio, b'audio')
+        wrapper.synthesize.assert_called_once()
@@ -0,0 +1,39 @@
+import unittest
+from unittest.mock import Mock
+
+
+
+class StatusEventTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def test_parse_update(self):
+
+        from mastodon_bot.lib.listen.status_event import parse_event
+
+        attachment = Mock()
+        attachment.url = "https://example.social/image.png"
+        status = {
+            "id": 2,
+            "in_reply_to_id": 1,
+            "content": "<p><span>@bot</span> hello there</p>",
+            "media_attachments": [attachment],
+            "account": {"bot": False},
+        }
+
+        parsed = parse_event("update", status)
+        self.assertEqual(parsed, (2, 1, "https://example.social/image.png", "@bot hello there",
+                                  ["https://example.social/image.png"]))
+
+    def test_parse_notification_from_bot(self):
+
+        from mastodon_bot.lib.listen.status_event import parse_event
+
+        notification = {
+            "status": {"id": 2, "in_reply_to_id": None, "content": "<p>beep</p>", "media_attachments": []},
+            "account": {"bot": True},
+        }
+
+        self.assertIsNone(parse_event("notification", notification))
+        self.assertIsNone(parse_event("notification", {"type": "follow", "account": {"bot": False}}))
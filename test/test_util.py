@@ -1,5 +1,6 @@
 import unittest
-from unittest.mock import patch, Mock
+from unittest.mock import patch, MagicMock
+from requests.structures import CaseInsensitiveDict
 
 
 
@@ -56,6 +57,89 @@ class UtilTestHandler(unittest.TestCase):
             self.assertEqual(response, b'this will be image encoded')
             mock_get.assert_called_once_with('http://www.example.com/image.png')
 
+    def test_download_remote_file_to_path(self):
+        from mastodon_bot.util import download_remote_file_to_path
+        import os
+
+        mock_response = MagicMock()
+        mock_response.headers = CaseInsensitiveDict({'content-type': 'audio/mpeg', 'content-length': '12'})
+        mock_response.iter_content.return_value = [b'audio ', b'chunks']
+
+        with patch('requests.get', return_value=mock_response):
+            file_path, file_extension = download_remote_file_to_path("http://www.example.com/audio",
+                                                                     allow_mime_types=['audio/mpeg'], max_bytes=100)
+
+        try:
+            with open(file_path, 'rb') as file:
+                self.assertEqual(file.read(), b'audio chunks')
+            self.assertEqual(file_extension, '.mp3')
+        finally:
+            os.remove(file_path)
+
+    def test_download_remote_file_to_path_rejects_before_body(self):
+        from mastodon_bot.util import download_remote_file_to_path
+
+        mock_response = MagicMock()
+        mock_response.headers = CaseInsensitiveDict({'content-type': 'text/html', 'content-length': '12'})
+
+        with patch('requests.get', return_value=mock_response):
+            with self.assertRaises(Exception):
+                download_remote_file_to_path("http://www.example.com/audio", allow_mime_types=['audio/mpeg'])
+
+        mock_response.iter_content.assert_not_called()
+        mock_response.close.assert_called_once()
+
+        mock_response = MagicMock()
+        mock_response.headers = CaseInsensitiveDict({'content-type': 'audio/mpeg', 'content-length': '1000'})
+
+        with patch('requests.get', return_value=mock_response):
+            with self.assertRaises(Exception):
+                download_remote_file_to_path("http://www.example.com/audio.mp3", max_bytes=100)
+
+        mock_response.iter_content.assert_not_called()
+
+    def test_download_remote_file_to_path_caps_size(self):
+        from mastodon_bot.util import download_remote_file_to_path
+        import os
+        import tempfile
+
+        mock_response = MagicMock()
+        mock_response.headers = CaseInsensitiveDict({'content-type': 'audio/mpeg'})
+        mock_response.iter_content.return_value = [b'x' * 60, b'x' * 60]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            mkstemp = tempfile.mkstemp
+            with patch('requests.get', return_value=mock_response), \
+                    patch('tempfile.mkstemp', side_effect=lambda **kwargs: mkstemp(dir=temp_dir, **kwargs)):
+                with self.assertRaises(Exception):
+                    download_remote_file_to_path("http://www.example.com/audio.mp3", max_bytes=100)
+
+            # the partial download is removed
+            self.assertEqual(os.listdir(temp_dir), [])
+
+    def test_ordered_bounded_map(self):
+        from mastodon_bot.util import ordered_bounded_map
+        from concurrent.futures import ThreadPoolExecutor
+        import time
+
+        taken = []
+
+        def items():
+            for item in range(10):
+                taken.append(item)
+                yield item
+
+        def work(item):
+            time.sleep(0.01 * (item % 3))
+            return item * 2
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            results = ordered_bounded_map(executor, work, items(), max_in_flight=3)
+            self.assertEqual(next(results), 0)
+            # only the in flight items have been read
+            self.assertEqual(taken, [0, 1, 2])
+            self.assertEqual(list(results), [2, 4, 6, 8, 10, 12, 14, 16, 18])
+
     def test_split_string_into_words(self):
         from mastodon_bot.util import split_string_by_words
 
@@ -65,6 +149,22 @@ class UtilTestHandler(unittest.TestCase):
         self.assertEqual(split[0], "I'm sorry, but as a friendly assistant who works for a financial investment newsletter marketing company, my role is to provide marketing solutions and ideas to improve customer engagement, not individual investment advice. It is important to perform thorough research and analysis before making any investment decisions. It's always a good idea to consult with a licensed financial advisor or broker who can provide you with personalized investment advice based on your individual financial")
         self.assertEqual(split[1], "situation, goals, and objectives.")
 
+    def test_split_stream_by_words(self):
+        from mastodon_bot.util import split_stream_by_words
+
+        words = [f"word{index} " for index in range(30)]
+        segments = list(split_stream_by_words(iter(words), max_length=50))
+
+        self.assertTrue(all(len(segment) <= 50 for segment, _ in segments))
+        self.assertEqual([is_last for _, is_last in segments], [False] * (len(segments) - 1) + [True])
+        self.assertEqual(" ".join(segment for segment, _ in segments), "".join(words).strip())
+
+        # trailing whitespace never leaves an empty last segment after a continued one
+        segments = list(split_stream_by_words(iter(["a" * 10, " ", "b" * 10, "   "]), max_length=12))
+        self.assertEqual(segments, [("a" * 10, False), ("b" * 10, True)])
+
+        self.assertEqual(list(split_stream_by_words(iter([]), max_length=10)), [("", True)])
+
     def test_break_long_string_into_paragraphs(self):
         from mastodon_bot.util import break_long_string_into_paragraphs
 
@@ -0,0 +1,67 @@
+import unittest
+from unittest.mock import Mock
+
+
+
+class VoiceCatalogTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def test_seeded_lookups(self):
+
+        from mastodon_bot.lib.polly.voice_catalog import VoiceCatalog
+
+        catalog = VoiceCatalog()
+        self.assertEqual(catalog.get("Kevin")["LanguageCode"], "en-US")
+        self.assertIsNone(catalog.get("NotAVoice"))
+        self.assertTrue(catalog.supports_engine("Kevin", "neural"))
+        self.assertFalse(catalog.supports_engine("Filiz", "neural"))
+        self.assertIn("Astrid", [voice["Id"] for voice in catalog.by_language("sv-SE")])
+        self.assertIn("Filiz", [voice["Id"] for voice in catalog.by_engine("standard")])
+
+    def test_refresh_once_per_ttl(self):
+
+        from mastodon_bot.lib.polly.voice_catalog import VoiceCatalog
+
+        fetch_voices = Mock(return_value=[
+            {"Id": "Brian", "LanguageCode": "en-GB", "SupportedEngines": ["neural", "standard"]}
+        ])
+        catalog = VoiceCatalog(fetch_voices=fetch_voices, ttl_seconds=3600)
+
+        for _ in range(200):
+            self.assertTrue(catalog.supports_engine("Brian", "neural"))
+
+        fetch_voices.assert_called_once()
+        self.assertIsNone(catalog.get("Kevin"))
+
+    def test_refresh_failure_keeps_seed(self):
+
+        from mastodon_bot.lib.polly.voice_catalog import VoiceCatalog
+
+        fetch_voices = Mock(side_effect=Exception("no credentials"))
+        catalog = VoiceCatalog(fetch_voices=fetch_voices)
+
+        self.assertTrue(catalog.supports_engine("Kevin", "neural"))
+        self.assertTrue(catalog.supports_engine("Kevin", "neural"))
+        fetch_voices.assert_called_once()
+
+    def test_refresh_shared_through_redis(self):
+
+        from mastodon_bot.lib.polly.voice_catalog import VoiceCatalog
+
+        redis_client = Mock()
+        redis_client.get.return_value = None
+        fetch_voices = Mock(return_value=[
+            {"Id": "Brian", "LanguageCode": "en-GB", "SupportedEngines": ["neural", "standard"]}
+        ])
+
+        VoiceCatalog(fetch_voices=fetch_voices, redis_client=redis_client).refresh()
+        cached = redis_client.set.call_args.args[1]
+
+        redis_client.get.return_value = cached.encode("utf-8")
+        other_fetch_voices = Mock()
+        other = VoiceCatalog(fetch_voices=other_fetch_voices, redis_client=redis_client)
+
+        self.assertTrue(other.supports_engine("Brian", "neural"))
+        other_fetch_voices.assert_not_called()
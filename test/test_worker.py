@@ -0,0 +1,180 @@
+import time
+import unittest
+from unittest.mock import patch, Mock
+
+
+
+class WorkerTestHandler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def fake_transcribe(self, openai_api_key, audio_url, audio_model, max_bytes=None, segment_seconds=None,
+                        segment_workers=None):
+        # finish out of order to prove results are reassembled in post order
+        time.sleep(0.05 if audio_url.endswith("1") else 0)
+        if audio_url.endswith("bad"):
+            raise Exception("boom")
+        return f"text of {audio_url}"
+
+    def test_transcribe_all_in_order(self):
+
+        from mastodon_bot.worker import transcribe_all
+        from mastodon_bot.lib.listen.listener_config import ListenerConfig
+
+        config = ListenerConfig(transcribe_max_workers=3)
+        items = [(None, "https://example.social/1"), ("https://a.com/2", "https://a.com/2"),
+                 ("https://a.com/bad", "https://a.com/bad")]
+
+        with patch('mastodon_bot.worker.transcribe_audio_url', side_effect=self.fake_transcribe):
+            result = transcribe_all(Mock(), config, 1, items)
+
+        self.assertEqual(result,
+                         "https://example.social/1: \n\n text of https://example.social/1\n\n"
+                         "https://a.com/2: \n\n text of https://a.com/2\n\n"
+                         "https://a.com/bad: \n\n Error trying to transcribe https://a.com/bad\n\n")
+
+        config.transcribe_error_policy = "skip"
+        with patch('mastodon_bot.worker.transcribe_audio_url', side_effect=self.fake_transcribe):
+            result = transcribe_all(Mock(), config, 1, items)
+
+        self.assertNotIn("bad", result)
+
+        config.transcribe_error_policy = "fail"
+        with patch('mastodon_bot.worker.transcribe_audio_url', side_effect=self.fake_transcribe):
+            with self.assertRaises(Exception):
+                transcribe_all(Mock(), config, 1, items)
+
+    def test_transcribe_single_attachment(self):
+
+        from mastodon_bot.worker import transcribe_all
+        from mastodon_bot.lib.listen.listener_config import ListenerConfig
+
+        mastodon_api = Mock()
+        with patch('mastodon_bot.worker.transcribe_audio_url', side_effect=self.fake_transcribe):
+            result = transcribe_all(mastodon_api, ListenerConfig(), 1, [(None, "https://example.social/1")])
+
+        self.assertEqual(result, "text of https://example.social/1")
+        mastodon_api.status_post.assert_called_once()
+
+    def test_stream_chat_response_posts_parts_as_generated(self):
+
+        from mastodon_bot.worker import stream_chat_response
+        from mastodon_bot.lib.listen.listener_config import ListenerConfig
+
+        mastodon_api = Mock()
+        posted = []
+
+        def status_post(content, **kwargs):
+            posted.append(content)
+            return {"id": len(posted), "url": ""}
+        mastodon_api.status_post.side_effect = status_post
+
+        words = ["word "] * 201
+
+        def create_stream(convo_id, prompt):
+            for index, word in enumerate(words):
+                # the first part is posted before the rest of the response is generated
+                if index == 150:
+                    self.assertEqual(len(posted), 1)
+                yield word
+
+        chat_context = Mock()
+        chat_context.create_stream.side_effect = create_stream
+
+        with patch('mastodon_bot.worker.unroll_response_content', return_value="\n\n  View unrolled: url"):
+            response_content, status_ids = stream_chat_response(
+                mastodon_api, ListenerConfig(), chat_context, "2", "1", "prompt")
+
+        self.assertEqual(response_content, "".join(words) + "\n\n  View unrolled: url")
+        self.assertEqual(status_ids, [1, 2, 3])
+        self.assertTrue(posted[0].endswith(" .../1"))
+        self.assertTrue(posted[1].endswith(" .../2"))
+        self.assertTrue(posted[2].endswith("View unrolled: url /3"))
+
+    def test_stream_chat_response_failure_is_not_retried(self):
+
+        from mastodon_bot.worker import stream_chat_response, STREAM_PROGRESS_META
+        from mastodon_bot.lib.listen.listener_config import ListenerConfig
+
+        mastodon_api = Mock()
+        mastodon_api.status_post.side_effect = lambda content, **kwargs: {"id": 10, "url": ""}
+
+        def create_stream(convo_id, prompt):
+            for _ in range(150):
+                yield "word "
+            raise Exception("stream closed")
+
+        chat_context = Mock()
+        chat_context.create_stream.side_effect = create_stream
+        job = Mock(meta={}, retries_left=3)
+
+        with patch('mastodon_bot.worker.get_current_job', return_value=job), \
+                self.assertRaises(Exception):
+            stream_chat_response(mastodon_api, ListenerConfig(), chat_context, "2", "1", "prompt")
+
+        mastodon_api.status_post.assert_called_once()
+        self.assertEqual(job.retries_left, 0)
+        self.assertEqual(job.meta[STREAM_PROGRESS_META]["status_ids"], [10])
+        self.assertFalse(job.meta[STREAM_PROGRESS_META]["done"])
+        self.assertEqual(job.save_meta.call_count, 2)
+
+    def test_stream_chat_response_retry_ends_thread(self):
+
+        from mastodon_bot.worker import stream_chat_response, STREAM_PROGRESS_META
+        from mastodon_bot.lib.listen.listener_config import ListenerConfig
+
+        mastodon_api = Mock()
+        mastodon_api.status_post.return_value = {"id": 12, "url": ""}
+        chat_context = Mock()
+        job = Mock(meta={STREAM_PROGRESS_META: {"status_ids": [10, 11], "offset": 986, "done": False}})
+
+        with patch('mastodon_bot.worker.get_current_job', return_value=job):
+            response_content, status_ids = stream_chat_response(
+                mastodon_api, ListenerConfig(), chat_context, "2", "1", "prompt")
+
+        chat_context.create_stream.assert_not_called()
+        self.assertEqual(status_ids, [10, 11, 12])
+        mastodon_api.status_post.assert_called_once()
+        self.assertEqual(mastodon_api.status_post.call_args.kwargs["in_reply_to_id"], 11)
+        self.assertTrue(mastodon_api.status_post.call_args.args[0].endswith(" /3"))
+
+        # a thread that was finished isn't posted to again
+        job.meta[STREAM_PROGRESS_META]["done"] = True
+        with patch('mastodon_bot.worker.get_current_job', return_value=job):
+            stream_chat_response(mastodon_api, ListenerConfig(), chat_context, "2", "1", "prompt")
+        mastodon_api.status_post.assert_called_once()
+
+    def test_speak_csv_rows_in_row_order(self):
+
+        from mastodon_bot.worker import speak_csv_rows
+        from mastodon_bot.lib.listen.listener_config import ListenerConfig
+
+        config = ListenerConfig(aws_polly_voice_id="Brian", polly_max_workers=3, speech_upload_workers=2)
+        rows = iter([{"text": "first", "voice_id": "Amy"}, {"text": "second", "voice": "Emma"},
+                     {"content": "third"}, {"text": "bad"}])
+        voices = {}
+
+        def fake_synthesize(config, filtered_content, in_reply_to_id, voice_id, max_workers):
+            # rows are already synthesized polly_max_workers at a time
+            self.assertEqual(max_workers, 1)
+            voices[filtered_content] = voice_id
+            # finish out of order to prove results are reassembled in row order
+            time.sleep(0.05 if filtered_content == "first" else 0)
+            if filtered_content == "bad":
+                raise Exception("boom")
+            return f"/tmp/{filtered_content}.mp3"
+
+        def fake_post(mastodon_api, config, temp_file_path, filtered_content, s3_key):
+            return f"media_{filtered_content}", f"Audio Generated from: {filtered_content}"
+
+        media_ids = []
+        with patch('mastodon_bot.worker.synthesize_speech_file', side_effect=fake_synthesize), \
+                patch('mastodon_bot.worker.post_speech_file', side_effect=fake_post):
+            result = speak_csv_rows(Mock(), media_ids, config, rows, 1)
+
+        self.assertEqual(voices, {"first": "Amy", "second": "Emma", "third": "Brian", "bad": "Brian"})
+        self.assertEqual(media_ids, ["media_first", "media_second", "media_third"])
+        self.assertEqual(result,
+                         "\n\nAudio Generated from: first\n\n\n\nAudio Generated from: second\n\n"
+                         "\n\nAudio Generated from: third\n\n\n\nError generating speech for row 4\n\n")